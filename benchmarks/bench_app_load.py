@@ -0,0 +1,213 @@
+"""
+Concurrent-session load harness for the Streamlit tier, run against the local fake agent
+of fake_agent_server.py instead of Bedrock.
+
+Each simulated user holds the per-session state the app keeps (a HistoryStore, the
+recent queries, the last answer) and asks questions through InvokeAgent the way the
+app's request flow does: lambda_handler_stream consumed step by step, the final body
+decoded, and both turns added to the history. Users pause between questions.
+
+For each concurrency level the harness reports turns per second, p50/p95/p99 turn
+latency and time to the first answer chunk, and the memory retained per session
+(measured with tracemalloc in a separate pass, so it does not slow the timed one).
+
+Usage:
+    python benchmarks/bench_app_load.py [--users 1 5 10 25 50] [--turns 3] [--user-think 1.0]
+        [--no-stream] [--think-seconds 0.5] [--trace-kb 20] [--output results.json] [--quick]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'streamlit_app'))
+sys.path.insert(0, HERE)
+
+from fake_agent_server import add_profile_arguments, profile_from_arguments, start_server  # noqa: E402
+
+QUESTION = "How many call centers are there in the tpcds schema?"
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def summarize(samples):
+    if not samples:
+        return {}
+    return {
+        'mean_ms': statistics.mean(samples) * 1000,
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p95_ms': percentile(samples, 0.95) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+        'max_ms': max(samples) * 1000,
+    }
+
+
+class SimulatedUser:
+    """One browser session: the app's per-session state and its question loop."""
+
+    def __init__(self, agenthelper, history_store, stream=True):
+        self.agenthelper = agenthelper
+        self.session_id = str(uuid.uuid4())
+        self.stream = stream
+        self.state = {'history': history_store(self.session_id), 'queries': [], 'trace_data': None}
+        self.latencies = []
+        self.first_chunk = []
+        self.errors = 0
+
+    def ask(self, question):
+        state = self.state
+        state['history'].append("user", question)
+        event = {"sessionId": self.session_id, "question": f"User ID: loadtest\n{question}"}
+
+        started = time.perf_counter()
+        response = None
+        if self.stream:
+            streamed_text = ""
+            for update in self.agenthelper.lambda_handler_stream(event, None):
+                if update['type'] == 'chunk':
+                    if not streamed_text:
+                        self.first_chunk.append(time.perf_counter() - started)
+                    streamed_text += update['text']
+                elif update['type'] == 'final':
+                    response = update
+        else:
+            response = self.agenthelper.lambda_handler(event, None)
+
+        if not response or response['status_code'] != 200:
+            self.errors += 1
+            return
+        response_data = json.loads(response['body'])
+        self.latencies.append(time.perf_counter() - started)
+        state['queries'] = response_data.get('trace', {}).get('sql', [])
+        state['trace_data'] = response_data['trace_data']
+        state['history'].append("assistant", response_data['trace_data'])
+
+    def run(self, turns, user_think, start):
+        start.wait()
+        for turn in range(turns):
+            if turn:
+                time.sleep(user_think)
+            try:
+                self.ask(QUESTION)
+            except Exception:
+                self.errors += 1
+
+
+def run_users(agenthelper, history_store, users, turns, user_think, stream):
+    simulated = [SimulatedUser(agenthelper, history_store, stream) for _ in range(users)]
+    start = threading.Event()
+    threads = [threading.Thread(target=user.run, args=(turns, user_think, start)) for user in simulated]
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    start.set()
+    for thread in threads:
+        thread.join()
+    return simulated, time.perf_counter() - started
+
+
+def bench_level(agenthelper, history_store, users, turns, user_think, stream):
+    simulated, elapsed = run_users(agenthelper, history_store, users, turns, user_think, stream)
+    latencies = [sample for user in simulated for sample in user.latencies]
+    first_chunk = [sample for user in simulated for sample in user.first_chunk]
+    return {
+        'users': users,
+        'turns': len(latencies),
+        'errors': sum(user.errors for user in simulated),
+        'elapsed_seconds': elapsed,
+        'turns_per_second': len(latencies) / elapsed,
+        'latency': summarize(latencies),
+        'first_chunk': summarize(first_chunk),
+    }
+
+
+def measure_session_memory(agenthelper, history_store, users, turns, stream):
+    # Sessions are kept alive after their turns, as Streamlit keeps session_state
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        simulated, _ = run_users(agenthelper, history_store, users, turns, 0, stream)
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'retained_bytes_per_session': (retained - baseline) / users,
+        'peak_bytes_per_session': (peak - baseline) / users,
+        'sessions': len(simulated),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, nargs='+', default=[1, 5, 10, 25, 50], help='concurrency levels')
+    parser.add_argument('--turns', type=int, default=3, help='questions per user')
+    parser.add_argument('--user-think', type=float, default=1.0, help='seconds a user pauses between questions')
+    parser.add_argument('--no-stream', action='store_true', help='use lambda_handler instead of lambda_handler_stream')
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    parser.add_argument('--quick', action='store_true', help='smaller levels and a faster agent, for a smoke run')
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.users, args.turns, args.user_think = [1, 5], 2, 0.1
+        args.think_seconds, args.action_seconds = 0.05, 0.05
+
+    server = start_server(profile_from_arguments(args))
+    # InvokeAgent reads its configuration at import, so the environment is set first
+    os.environ.update({
+        'BEDROCK_AGENT_ENDPOINT': server.endpoint,
+        'AGENT_ID': 'FAKEAGENT',
+        'AGENT_ALIAS_ID': 'FAKEALIAS',
+        'AWS_REGION': os.environ.get('AWS_REGION', 'us-east-1'),
+        'AWS_ACCESS_KEY_ID': os.environ.get('AWS_ACCESS_KEY_ID', 'loadtest'),
+        'AWS_SECRET_ACCESS_KEY': os.environ.get('AWS_SECRET_ACCESS_KEY', 'loadtest'),
+        'HISTORY_DIR': tempfile.mkdtemp(prefix='bench_app_load_'),
+        'METRICS_ENABLED': 'false',
+    })
+    import InvokeAgent as agenthelper
+    from history_store import HistoryStore
+
+    stream = not args.no_stream
+    levels = []
+    for users in args.users:
+        level = bench_level(agenthelper, HistoryStore, users, args.turns, args.user_think, stream)
+        level['memory'] = measure_session_memory(agenthelper, HistoryStore, users, args.turns, stream)
+        levels.append(level)
+        print(f"{users:>4} users: {level['turns_per_second']:.2f} turns/s, "
+              f"p50 {level['latency'].get('p50_ms', 0):.0f} ms, p99 {level['latency'].get('p99_ms', 0):.0f} ms, "
+              f"{level['memory']['retained_bytes_per_session'] / 1024:.1f} KiB/session", file=sys.stderr)
+    server.shutdown()
+
+    report = {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'stream': stream,
+        'agent_profile': vars(server.profile),
+        'pool_size': agenthelper.poolSize,
+        'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'levels': levels,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
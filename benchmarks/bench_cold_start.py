@@ -0,0 +1,128 @@
+"""
+Cold-start and per-invocation overhead harness for the action-group Lambda.
+
+Init time is measured by importing lambda_function in fresh interpreters, as the Lambda
+init phase does. Invocation overhead is measured in-process against a stubbed
+redshift-data client, so only the handler's own work is timed.
+
+Usage:
+    python benchmarks/bench_cold_start.py [--cold-runs 5] [--invocations 200] [--importtime]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FUNCTION_DIR = os.path.join(HERE, '..', 'function')
+TEST_EVENTS_DIR = os.path.join(FUNCTION_DIR, 'test-events')
+
+# The handler needs a workgroup name and a region to build its client; no call reaches AWS.
+# EMF records are turned off, as they would be printed among the JSON report.
+BENCH_ENV = {
+    'REDSHIFT_WORKGROUP_NAME': 'bench-wg',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'bench',
+    'AWS_SECRET_ACCESS_KEY': 'bench',
+    'QUERY_CACHE_BACKEND': 'none',
+    'METRICS_ENABLED': 'false',
+}
+
+INIT_SNIPPET = """
+import json, sys, time
+started = time.perf_counter()
+import lambda_function
+print(json.dumps({'init_seconds': time.perf_counter() - started, 'modules': len(sys.modules)}))
+"""
+
+
+def measure_init(runs, importtime=False):
+    env = dict(os.environ, **BENCH_ENV)
+    samples = []
+    slowest = []
+    for run in range(runs):
+        command = [sys.executable]
+        if importtime and run == 0:
+            command += ['-X', 'importtime']
+        command += ['-c', INIT_SNIPPET]
+        completed = subprocess.run(command, cwd=FUNCTION_DIR, env=env, capture_output=True, text=True, check=True)
+        samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+        if importtime and run == 0:
+            slowest = parse_importtime(completed.stderr)
+    init_times = [sample['init_seconds'] for sample in samples]
+    return {
+        'runs': runs,
+        'init_seconds_median': statistics.median(init_times),
+        'init_seconds_min': min(init_times),
+        'init_seconds_max': max(init_times),
+        'modules_loaded': samples[0]['modules'],
+        'slowest_imports': slowest
+    }
+
+
+def parse_importtime(stderr, top=10):
+    # Lines look like "import time:   self [us] | cumulative | imported package"
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, self_us, cumulative_us, name = [part.strip() for part in line.replace('import time:', '|', 1).split('|')]
+        entries.append({'module': name.strip(), 'self_us': int(self_us), 'cumulative_us': int(cumulative_us)})
+    return sorted(entries, key=lambda entry: entry['cumulative_us'], reverse=True)[:top]
+
+
+def load_events():
+    events = {}
+    for name in sorted(os.listdir(TEST_EVENTS_DIR)):
+        if name.endswith('.json'):
+            with open(os.path.join(TEST_EVENTS_DIR, name)) as f:
+                events[name[:-len('.json')]] = json.load(f)
+    return events
+
+
+def measure_invocations(invocations):
+    os.environ.update(BENCH_ENV)
+    sys.path.insert(0, FUNCTION_DIR)
+    sys.path.insert(0, HERE)
+    import lambda_function
+    import redshift_serverless_functions
+    from fake_redshift_data import FakeRedshiftDataClient
+
+    redshift_serverless_functions.set_redshift_data_client(FakeRedshiftDataClient())
+    results = {}
+    for name, event in load_events().items():
+        lambda_function.lambda_handler(event, None)  # warm up caches and lazy imports
+        samples = []
+        for _ in range(invocations):
+            started = time.perf_counter()
+            lambda_function.lambda_handler(event, None)
+            samples.append(time.perf_counter() - started)
+        samples.sort()
+        results[name] = {
+            'invocations': invocations,
+            'mean_ms': statistics.mean(samples) * 1000,
+            'p50_ms': samples[len(samples) // 2] * 1000,
+            'p95_ms': samples[int(len(samples) * 0.95) - 1] * 1000,
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cold-runs', type=int, default=5)
+    parser.add_argument('--invocations', type=int, default=200)
+    parser.add_argument('--importtime', action='store_true', help='report the slowest imports of the first cold run')
+    args = parser.parse_args(argv)
+
+    report = {
+        'init': measure_init(args.cold_runs, importtime=args.importtime),
+        'invocation_overhead': measure_invocations(args.invocations),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
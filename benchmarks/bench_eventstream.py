@@ -0,0 +1,139 @@
+"""
+Throughput benchmark of InvokeAgent response decoding: the original string-splitting
+decode_response against the binary event-stream decoder in streamlit_app/eventstream.py.
+
+Streams are either recorded agent responses (raw response bodies saved to files) or
+synthetic ones of a given size, built from trace events and a final answer chunk.
+
+Usage:
+    python benchmarks/bench_eventstream.py [--size-mb 1 4 8] [--stream recorded.bin ...] [--skip-legacy]
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'streamlit_app'))
+
+from eventstream import DEFAULT_READ_SIZE, encode_agent_event, iter_agent_events  # noqa: E402
+
+
+class RecordedResponse:
+    """Replays a response body through iter_content, like a streamed requests.Response."""
+
+    def __init__(self, body):
+        self.body = body
+
+    def iter_content(self, chunk_size=1):
+        body = self.body
+        for offset in range(0, len(body), chunk_size):
+            yield body[offset:offset + chunk_size]
+
+
+def synthetic_stream(size_bytes, seed=7):
+    # Traces dominated by model invocation prompts, as with enableTrace on, then the answer
+    rng = random.Random(seed)
+    words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9))) for _ in range(500)]
+    parts = []
+    total = 0
+    step = 0
+    while total < size_bytes:
+        prompt = ' '.join(rng.choice(words) for _ in range(3000))
+        trace = {
+            'agentId': 'AGENT', 'sessionId': 'bench',
+            'trace': {'orchestrationTrace': {'modelInvocationInput': {
+                'traceId': f'trace-{step}', 'type': 'ORCHESTRATION', 'text': prompt
+            }}}
+        }
+        parts.append(encode_agent_event('trace', trace))
+        parts.append(encode_agent_event('trace', {'trace': {'orchestrationTrace': {'rationale': {
+            'traceId': f'trace-{step}', 'text': 'I will run <query>SELECT 1</query> — “quoted”'
+        }}}}))
+        total += len(parts[-1]) + len(parts[-2])
+        step += 1
+    parts.append(encode_agent_event('chunk', 'The answer is 42 — ünïcode included.'.encode('utf-8')))
+    return b''.join(parts)
+
+
+def legacy_decode_response(response):
+    # The original implementation, kept as the baseline (stdout capture included)
+    captured_output = io.StringIO()
+    sys.stdout = captured_output
+    try:
+        string_body = ""
+        for line in response.iter_content():
+            try:
+                string_body += line.decode(encoding='utf-8')
+            except Exception:
+                continue
+        print("Decoded response", string_body)
+        split_response = string_body.split(":message-type")
+        print(f"Split Response: {split_response}")
+        for part in split_response:
+            if "bytes" in part:
+                final_response = base64.b64decode(part.split("\"")[3]).decode('utf-8')
+                print(final_response)
+            else:
+                print(part)
+        last_response = split_response[-1]
+        final_response = base64.b64decode(last_response.split("\"")[3]).decode('utf-8')
+    finally:
+        sys.stdout = sys.__stdout__
+    return captured_output.getvalue(), final_response
+
+
+def new_decode_response(response):
+    chunks = []
+    traces = 0
+    for event in iter_agent_events(response):
+        if event.kind == 'chunk':
+            chunks.append(event.data)
+        else:
+            traces += 1
+    return traces, b''.join(chunks).decode('utf-8')
+
+
+def measure(func, body):
+    started = time.perf_counter()
+    func(RecordedResponse(body))
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=float, nargs='+', default=[1, 4])
+    parser.add_argument('--stream', nargs='*', default=[], help='files holding recorded response bodies')
+    parser.add_argument('--skip-legacy', action='store_true', help='the legacy decoder reads one byte at a time')
+    args = parser.parse_args(argv)
+
+    streams = [(f'synthetic {size:g} MB', synthetic_stream(int(size * 1024 * 1024))) for size in args.size_mb]
+    for path in args.stream:
+        with open(path, 'rb') as f:
+            streams.append((os.path.basename(path), f.read()))
+
+    results = []
+    for name, body in streams:
+        new_seconds = measure(new_decode_response, body)
+        result = {
+            'stream': name,
+            'bytes': len(body),
+            'read_size': DEFAULT_READ_SIZE,
+            'eventstream_seconds': new_seconds,
+            'eventstream_mb_per_sec': len(body) / new_seconds / 1e6,
+        }
+        if not args.skip_legacy:
+            legacy_seconds = measure(legacy_decode_response, body)
+            result['legacy_seconds'] = legacy_seconds
+            result['legacy_mb_per_sec'] = len(body) / legacy_seconds / 1e6
+            result['speedup'] = legacy_seconds / new_seconds
+        results.append(result)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Microbenchmark of Data API result decoding: the original row-by-row extract_result_data
+against the decoders in function/result_decoder.py, the row-wise iter_records used for
+JSON responses and the column-wise decode_columns used for DataFrames and Arrow tables.
+
+Usage:
+    python benchmarks/bench_extract_result_data.py [--rows 10000 100000] [--repeat 3]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'function'))
+
+from result_decoder import decode_columns, iter_records  # noqa: E402
+
+# A store_sales-like mix of column types
+COLUMNS = [
+    {'name': 'ss_sold_date_sk', 'typeName': 'int4'},
+    {'name': 'ss_item_sk', 'typeName': 'int4'},
+    {'name': 'ss_customer_sk', 'typeName': 'int4'},
+    {'name': 'ss_quantity', 'typeName': 'int4'},
+    {'name': 'ss_sales_price', 'typeName': 'numeric', 'precision': 7, 'scale': 2},
+    {'name': 'ss_net_profit', 'typeName': 'numeric', 'precision': 7, 'scale': 2},
+    {'name': 'ss_ratio', 'typeName': 'float8'},
+    {'name': 's_store_name', 'typeName': 'varchar'},
+    {'name': 'd_date', 'typeName': 'date'},
+    {'name': 'ss_sold_at', 'typeName': 'timestamp'},
+]
+
+
+def make_page(rows, seed=42):
+    rng = random.Random(seed)
+    records = []
+    for _ in range(rows):
+        records.append([
+            {'longValue': rng.randint(2450000, 2453000)},
+            {'longValue': rng.randint(1, 18000)},
+            {'isNull': True} if rng.random() < 0.05 else {'longValue': rng.randint(1, 100000)},
+            {'longValue': rng.randint(1, 100)},
+            {'stringValue': '%.2f' % rng.uniform(0, 200)},
+            {'stringValue': '%.2f' % rng.uniform(-100, 100)},
+            {'doubleValue': rng.random()},
+            {'stringValue': rng.choice(['able', 'ation', 'bar', 'ese', 'ought'])},
+            {'stringValue': '2002-%02d-%02d' % (rng.randint(1, 12), rng.randint(1, 28))},
+            {'stringValue': '2002-01-01 %02d:%02d:%02d' % (rng.randint(0, 23), rng.randint(0, 59), rng.randint(0, 59))},
+        ])
+    return {'ColumnMetadata': COLUMNS, 'Records': records}
+
+
+def legacy_extract_result_data(query_results):
+    # The original implementation, kept verbatim as the baseline
+    result_data = []
+    column_metadata = query_results['ColumnMetadata']
+    column_names = [col['name'] for col in column_metadata]
+    for row in query_results['Records']:
+        row_data = []
+        for item in row:
+            if 'stringValue' in item:
+                row_data.append(item['stringValue'])
+            elif 'longValue' in item:
+                row_data.append(item['longValue'])
+            elif 'doubleValue' in item:
+                row_data.append(item['doubleValue'])
+            elif 'booleanValue' in item:
+                row_data.append(item['booleanValue'])
+            else:
+                row_data.append(None)
+        result_data.append(dict(zip(column_names, row_data)))
+    return result_data
+
+
+CANDIDATES = {
+    'legacy list-of-dicts': legacy_extract_result_data,
+    'columnar list-of-dicts': lambda page: decode_columns(page).to_records(),
+    'columnar dict-of-lists': lambda page: decode_columns(page).to_dict_of_lists(),
+    'columnar typed columns': lambda page: decode_columns(page, typed=True).columns,
+    'row-wise records': lambda page: list(iter_records(page)),
+}
+
+
+def best_time(func, page, repeat):
+    # Like timeit, collect garbage up front and keep the collector out of the timed region
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            func(page)
+            elapsed = time.perf_counter() - started
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"{'rows':>8}  {'decoder':<24} {'seconds':>9} {'rows/sec':>12}")
+    for rows in args.rows:
+        page = make_page(rows)
+        for name, func in CANDIDATES.items():
+            elapsed = best_time(func, page, args.repeat)
+            print(f"{rows:>8}  {name:<24} {elapsed:>9.4f} {rows / elapsed:>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
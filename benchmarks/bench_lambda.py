@@ -0,0 +1,257 @@
+"""
+Offline benchmark suite for the action-group Lambda, run against FakeRedshiftDataClient
+instead of a live workgroup:
+
+- schema: get_schema cold (catalog reloaded) and warm (cached) from 10 to 10k tables
+- decode: extract_result_data and iter_result_data rows/sec
+- encode: format_success_response time and throughput at several result sizes
+- handler: end-to-end /querydatabase lambda_handler latency, with and without simulated
+  Data API latency
+- sessions: per-statement setup overhead (starting the statement plus Redshift queue time)
+  of agent turns, each statement opening a connection versus reusing the Data API session
+  of the turn, with simulated session setup cost
+
+Results are written as JSON, tagged with the git commit, so runs can be compared.
+
+Usage:
+    python benchmarks/bench_lambda.py [--output results.json] [--only schema decode]
+        [--recording "store_sales=recorded.json" ...] [--compare baseline.json] [--quick]
+        [--session-setup 0.1]
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FUNCTION_DIR = os.path.join(HERE, '..', 'function')
+sys.path.insert(0, FUNCTION_DIR)
+sys.path.insert(0, HERE)
+
+from bench_cold_start import BENCH_ENV, load_events  # noqa: E402
+from bench_extract_result_data import make_page  # noqa: E402
+
+# Keep EMF records and the result cache out of the measurements
+os.environ.update(BENCH_ENV, GOVERNOR_MAX_WAIT_SECONDS='60')
+
+import lambda_function  # noqa: E402
+import redshift_serverless_functions  # noqa: E402
+from fake_redshift_data import FakeRedshiftDataClient, catalog_result, recorded_responder, default_responder  # noqa: E402
+from schema_catalog import invalidate_catalog  # noqa: E402
+from data_api_sessions import SessionPool  # noqa: E402
+from timing import recorder  # noqa: E402
+
+# Per-call round trips of the simulated Data API, in seconds
+NETWORK_LATENCY = {
+    'execute_statement': 0.015,
+    'describe_statement': 0.010,
+    'get_statement_result': 0.020,
+}
+
+
+def timed(func, repeat):
+    # Best-of and median of repeat runs, with the garbage collector kept out of the timed region
+    samples = []
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - started)
+        finally:
+            gc.enable()
+    return {'best_seconds': min(samples), 'median_seconds': statistics.median(samples)}
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {
+        'mean_ms': statistics.mean(samples) * 1000,
+        'p50_ms': samples[len(samples) // 2] * 1000,
+        'p95_ms': samples[max(0, int(len(samples) * 0.95) - 1)] * 1000,
+        'max_ms': samples[-1] * 1000,
+    }
+
+
+def bench_schema(table_counts, repeat, page_size):
+    results = []
+    for tables in table_counts:
+        catalog = catalog_result(tables=tables, columns_per_table=8)
+        client = FakeRedshiftDataClient(lambda sql, catalog=catalog: catalog, page_size=page_size)
+        redshift_serverless_functions.set_redshift_data_client(client)
+
+        def cold():
+            invalidate_catalog()
+            redshift_serverless_functions.get_schema('bench')
+
+        result = {'tables': tables, 'columns': tables * 8, 'cold': timed(cold, repeat)}
+        result['warm'] = timed(lambda: redshift_serverless_functions.get_schema('bench'), repeat)
+        result['get_statement_result_calls'] = client.calls.get('get_statement_result', 0)
+        results.append(result)
+    return results
+
+
+def bench_decode(row_counts, repeat):
+    results = []
+    for rows in row_counts:
+        page = make_page(rows)
+        for name, func in (
+            ('extract_result_data', redshift_serverless_functions.extract_result_data),
+            ('iter_result_data', lambda page: list(redshift_serverless_functions.iter_result_data(page))),
+        ):
+            timing = timed(lambda: func(page), repeat)
+            timing.update({'decoder': name, 'rows': rows, 'rows_per_sec': rows / timing['best_seconds']})
+            results.append(timing)
+    return results
+
+
+def bench_encode(row_counts, repeat):
+    event = {'actionGroup': 'bench', 'apiPath': '/querydatabase', 'httpMethod': 'POST'}
+    results = []
+    for rows in row_counts:
+        page = make_page(rows)
+        result = redshift_serverless_functions.QueryResult(redshift_serverless_functions.extract_result_data(page))
+        response = lambda_function.format_success_response(result, event)
+        body = response['response']['responseBody']['application/json']['body']
+        timing = timed(lambda: lambda_function.format_success_response(result, event), repeat)
+        timing.update({
+            'rows': rows,
+            'body_bytes': len(body.encode('utf-8')),
+            'rows_per_sec': rows / timing['best_seconds'],
+            'input_mb_per_sec': len(json.dumps(result)) / timing['best_seconds'] / 1e6,
+        })
+        results.append(timing)
+    return results
+
+
+def bench_handler(invocations, responder):
+    event = load_events()['querydatabase']
+    results = {}
+    for name, latency in (('no_latency', {}), ('simulated_latency', NETWORK_LATENCY)):
+        client = FakeRedshiftDataClient(responder, latency=latency)
+        redshift_serverless_functions.set_redshift_data_client(client)
+        lambda_function.lambda_handler(event, None)  # warm up caches and lazy imports
+        samples = []
+        for _ in range(invocations):
+            started = time.perf_counter()
+            lambda_function.lambda_handler(event, None)
+            samples.append(time.perf_counter() - started)
+        results[name] = dict(percentiles(samples), invocations=invocations, latency=latency)
+    return results
+
+
+def bench_sessions(turns, statements_per_turn, responder, setup_seconds):
+    event = load_events()['querydatabase']
+    configured = redshift_serverless_functions.session_pool
+    results = {}
+    try:
+        for name, pool in (('without_sessions', None), ('with_sessions', SessionPool())):
+            client = FakeRedshiftDataClient(responder, latency=NETWORK_LATENCY, session_setup_seconds=setup_seconds)
+            redshift_serverless_functions.set_redshift_data_client(client)
+            redshift_serverless_functions.session_pool = pool
+            samples, setups = [], []
+            for turn in range(turns):
+                # Session attributes are carried from one action group call of the turn to the next, as the agent does
+                attributes = {}
+                for _ in range(statements_per_turn):
+                    started = time.perf_counter()
+                    response = lambda_function.lambda_handler(dict(event, sessionId=f'bench-turn-{turn}', sessionAttributes=attributes), None)
+                    samples.append(time.perf_counter() - started)
+                    setups.extend(span['duration_ms'] for span in recorder.spans() if span['name'] in ('setup_cold', 'setup_warm'))
+                    attributes = response.get('sessionAttributes', attributes)
+            results[name] = dict(
+                percentiles(samples),
+                statements=len(samples),
+                setup_mean_ms=statistics.mean(setups) if setups else None,
+                setup_total_ms=sum(setups),
+                sessions=pool.stats() if pool is not None else None,
+            )
+    finally:
+        redshift_serverless_functions.session_pool = configured
+    return results
+
+
+# Metrics compared against a baseline run; lower is better for all of them
+COMPARED_METRICS = ('best_seconds', 'p50_ms', 'p95_ms')
+
+
+def compare(results, baseline, path=''):
+    """Relative change of each compared metric against the same entry of a baseline run."""
+    changes = {}
+    if isinstance(results, dict) and isinstance(baseline, dict):
+        for key, value in results.items():
+            if key in COMPARED_METRICS and isinstance(baseline.get(key), (int, float)) and baseline[key]:
+                changes[f"{path}{key}"] = round(value / baseline[key] - 1, 4)
+            elif key in baseline:
+                changes.update(compare(value, baseline[key], f"{path}{key}."))
+    elif isinstance(results, list) and isinstance(baseline, list):
+        for index, (value, base) in enumerate(zip(results, baseline)):
+            changes.update(compare(value, base, f"{path}{index}."))
+    return changes
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=HERE, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    parser.add_argument('--only', nargs='+', choices=['schema', 'decode', 'encode', 'handler', 'sessions'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--invocations', type=int, default=100)
+    parser.add_argument('--page-size', type=int, default=1000, help='records per simulated result page')
+    parser.add_argument('--recording', nargs='*', default=[],
+                        help='SQL_SUBSTRING=PATH of a recorded get_statement_result response to answer matching statements')
+    parser.add_argument('--session-setup', type=float, default=0.1,
+                        help='seconds a simulated statement spends connecting when it does not reuse a session')
+    parser.add_argument('--compare', help='a previous results file; adds the relative change of each timing')
+    parser.add_argument('--quick', action='store_true', help='smaller sizes, for a smoke run')
+    args = parser.parse_args(argv)
+
+    tables = [10, 100] if args.quick else [10, 100, 1000, 10000]
+    rows = [100, 1000] if args.quick else [100, 1000, 10000, 100000]
+    recordings = dict(item.split('=', 1) for item in args.recording)
+    responder = recorded_responder(recordings) if recordings else default_responder
+
+    benchmarks = {
+        'schema': lambda: bench_schema(tables, args.repeat, args.page_size),
+        'decode': lambda: bench_decode(rows, args.repeat),
+        'encode': lambda: bench_encode(rows, args.repeat),
+        'handler': lambda: bench_handler(args.invocations, responder),
+        'sessions': lambda: bench_sessions(3 if args.quick else 10, 4, responder, args.session_setup),
+    }
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': {name: run() for name, run in benchmarks.items() if not args.only or name in args.only},
+    }
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        report['baseline_commit'] = baseline.get('commit')
+        report['change_vs_baseline'] = compare(report['results'], baseline.get('results', {}))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+A local stand-in for the bedrock-agent-runtime InvokeAgent endpoint, answering
+POST /agents/{agentId}/agentAliases/{aliasId}/sessions/{sessionId}/text with an
+event stream shaped like a real agent turn: a rationale, a /querydatabase action group
+call and its observation, model invocation traces, then the answer in chunks.
+
+Think time, action group time, trace volume and answer chunking are configurable, so the
+app can be load tested without calling Bedrock. Point the app at it with
+BEDROCK_AGENT_ENDPOINT=http://127.0.0.1:<port>; request signatures are not checked.
+
+Usage:
+    python benchmarks/fake_agent_server.py [--port 8750] [--think-seconds 0.5]
+        [--action-seconds 0.3] [--trace-kb 20] [--chunk-bytes 64] [--chunk-interval 0.02]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import string
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'streamlit_app'))
+
+from eventstream import encode_agent_event  # noqa: E402
+
+SESSION_PATH = re.compile(r'^/agents/[^/]+/agentAliases/[^/]+/sessions/([^/]+)/text$')
+
+DEFAULT_ANSWER = (
+    "There are 6 call centers in the tpcds schema. They are spread over 4 states, and the "
+    "largest one, with 22 employees, is in Midway, Williamson County. — ünïcode included."
+)
+
+
+class AgentProfile:
+    """
+    What a fake agent turn looks like and how long it takes.
+
+    think_seconds is spent before the action group call and again before the answer,
+    action_seconds between the call and its observation. trace_kb of model invocation
+    prompts are sent as traces, as with enableTrace on. The answer is streamed in
+    chunk_bytes pieces chunk_interval seconds apart when the request asks for
+    streamFinalResponse, and sent as one chunk otherwise.
+    """
+
+    def __init__(self, think_seconds=0.5, action_seconds=0.3, trace_kb=20, chunk_bytes=64,
+                 chunk_interval=0.02, answer=DEFAULT_ANSWER, rows=6):
+        self.think_seconds = think_seconds
+        self.action_seconds = action_seconds
+        self.trace_kb = trace_kb
+        self.chunk_bytes = chunk_bytes
+        self.chunk_interval = chunk_interval
+        self.answer = answer
+        self.rows = rows
+
+    def events(self, session_id, question, stream_final_response, sleep=time.sleep):
+        """Yield the encoded events of one turn, sleeping where the agent would be working."""
+        rng = random.Random(session_id)
+        words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9))) for _ in range(200)]
+        query = "SELECT COUNT(*) AS call_center_count FROM tpcds.call_center"
+
+        def trace(orchestration):
+            return encode_agent_event('trace', {
+                'agentId': 'FAKEAGENT', 'sessionId': session_id,
+                'trace': {'orchestrationTrace': orchestration}
+            })
+
+        def model_invocations(step):
+            # The prompts are the bulk of a traced turn; split them like the agent does
+            remaining = self.trace_kb * 1024
+            while remaining > 0:
+                text = ' '.join(rng.choice(words) for _ in range(min(remaining, 8192) // 6 + 1))
+                remaining -= len(text)
+                yield trace({'modelInvocationInput': {'traceId': f'{session_id}-{step}', 'type': 'ORCHESTRATION', 'text': text}})
+
+        yield from model_invocations(0)
+        sleep(self.think_seconds)
+        yield trace({'rationale': {'traceId': f'{session_id}-0', 'text': f'To answer "{question[:80]}" I will count the call centers.'}})
+        yield trace({'invocationInput': {'actionGroupInvocationInput': {
+            'actionGroupName': 'redshift', 'apiPath': '/querydatabase', 'verb': 'post',
+            'requestBody': {'content': {'application/json': [{'name': 'query', 'type': 'string', 'value': query}]}}
+        }}})
+        sleep(self.action_seconds)
+        rows = [{'call_center_count': 6} for _ in range(self.rows)]
+        yield trace({'observation': {'actionGroupInvocationOutput': {'text': json.dumps(rows)}}})
+        yield from model_invocations(1)
+        sleep(self.think_seconds)
+        yield trace({'observation': {'finalResponse': {'text': self.answer}}})
+
+        answer = self.answer.encode('utf-8')
+        if not stream_final_response or not self.chunk_bytes:
+            yield encode_agent_event('chunk', answer)
+            return
+        for offset in range(0, len(answer), self.chunk_bytes):
+            if offset:
+                sleep(self.chunk_interval)
+            yield encode_agent_event('chunk', answer[offset:offset + self.chunk_bytes])
+
+
+class FakeAgentHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('content-length', 0)))
+        match = SESSION_PATH.match(self.path.split('?', 1)[0])
+        if not match:
+            self.send_error(404)
+            return
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError:
+            self.send_error(400)
+            return
+        stream = request.get('streamingConfigurations', {}).get('streamFinalResponse', False)
+
+        self.send_response(200)
+        self.send_header('content-type', 'application/vnd.amazon.eventstream')
+        self.send_header('transfer-encoding', 'chunked')
+        self.end_headers()
+        # Every event is its own HTTP chunk, flushed at once, so arrival times are realistic
+        for event in self.server.profile.events(match.group(1), request.get('inputText', ''), stream):
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(event), event))
+            self.wfile.flush()
+        self.wfile.write(b'0\r\n\r\n')
+        self.server.count_turn()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeAgentServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), profile=None):
+        super().__init__(address, FakeAgentHandler)
+        self.profile = profile or AgentProfile()
+        self.turns = 0
+        self._lock = threading.Lock()
+
+    def count_turn(self):
+        with self._lock:
+            self.turns += 1
+
+    @property
+    def endpoint(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+
+def start_server(profile=None, port=0):
+    """Serve a fake agent from a background thread; return the server, whose endpoint is its URL."""
+    server = FakeAgentServer(('127.0.0.1', port), profile)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_profile_arguments(parser):
+    parser.add_argument('--think-seconds', type=float, default=0.5)
+    parser.add_argument('--action-seconds', type=float, default=0.3)
+    parser.add_argument('--trace-kb', type=int, default=20, help='model invocation trace sent per reasoning step')
+    parser.add_argument('--chunk-bytes', type=int, default=64, help='answer bytes per chunk event')
+    parser.add_argument('--chunk-interval', type=float, default=0.02)
+
+
+def profile_from_arguments(args):
+    return AgentProfile(args.think_seconds, args.action_seconds, args.trace_kb, args.chunk_bytes, args.chunk_interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8750)
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = FakeAgentServer(('127.0.0.1', args.port), profile_from_arguments(args))
+    print(f'Fake agent listening; set BEDROCK_AGENT_ENDPOINT={server.endpoint}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
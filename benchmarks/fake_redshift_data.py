@@ -0,0 +1,183 @@
+"""
+An in-memory stand-in for the boto3 redshift-data client, answering execute_statement,
+describe_statement, get_statement_result and cancel_statement from canned or recorded
+results, with optional per-call latency, execution time and result pagination, and
+Data API sessions (SessionKeepAliveSeconds / SessionId) with a simulated setup cost.
+"""
+import datetime
+import itertools
+import json
+import threading
+import time
+
+
+def catalog_result(tables=3, columns_per_table=5, schema='tpcds'):
+    """A result of the schema catalog query with the given number of tables."""
+    column_metadata = [
+        {'name': 'table_schema', 'typeName': 'varchar'},
+        {'name': 'table_name', 'typeName': 'varchar'},
+        {'name': 'column_name', 'typeName': 'varchar'},
+        {'name': 'data_type', 'typeName': 'varchar'},
+        {'name': 'remarks', 'typeName': 'varchar'},
+    ]
+    records = []
+    for table in range(tables):
+        for column in range(columns_per_table):
+            records.append([
+                {'stringValue': schema},
+                {'stringValue': f'table_{table}'},
+                {'stringValue': f'column_{column}'},
+                {'stringValue': 'integer' if column % 2 else 'character varying'},
+                {'isNull': True},
+            ])
+    return column_metadata, records
+
+
+def small_result(rows=1):
+    """A single-column integer result, like SELECT COUNT(*)."""
+    return [{'name': 'call_center_count', 'typeName': 'int8'}], [[{'longValue': 6}] for _ in range(rows)]
+
+
+def default_responder(sql):
+    if 'svv_columns' in sql:
+        return catalog_result()
+    return small_result()
+
+
+def load_recording(path):
+    """
+    Load a recorded result, a JSON file holding a get_statement_result response (or a list
+    of its pages), as a (ColumnMetadata, Records) tuple.
+    """
+    with open(path) as f:
+        recorded = json.load(f)
+    pages = recorded if isinstance(recorded, list) else [recorded]
+    records = [record for page in pages for record in page['Records']]
+    return pages[0]['ColumnMetadata'], records
+
+
+def recorded_responder(recordings, fallback=default_responder):
+    """
+    A responder answering statements from recordings: a dict of SQL substring -> path of a
+    recorded result. Statements matching no substring are answered by fallback.
+    """
+    loaded = {needle: load_recording(path) for needle, path in recordings.items()}
+
+    def respond(sql):
+        for needle, result in loaded.items():
+            if needle in sql:
+                return result
+        return fallback(sql)
+    return respond
+
+
+class FakeRedshiftDataClient:
+    """
+    Fake redshift-data client. Statements finish with the result the responder returns for
+    their SQL, as a (ColumnMetadata, Records) tuple.
+
+    latency maps call names (e.g. 'describe_statement') to seconds slept per call, the way a
+    network round trip would. A statement reports STARTED until execution_seconds have
+    passed. With page_size, results are returned page_size records at a time with NextToken.
+
+    A statement not run in an existing session first spends session_setup_seconds
+    connecting, reported as queue time the way Redshift reports it. Sessions opened with
+    SessionKeepAliveSeconds expire that long after their last statement finished, and
+    run one statement at a time; using an expired or busy session raises.
+    """
+
+    def __init__(self, responder=default_responder, latency=None, execution_seconds=0.0, page_size=None,
+                 session_setup_seconds=0.0, sleep=time.sleep, clock=time.monotonic):
+        self.responder = responder
+        self.latency = latency or {}
+        self.execution_seconds = execution_seconds
+        self.page_size = page_size
+        self.session_setup_seconds = session_setup_seconds
+        self.sleep = sleep
+        self.clock = clock
+        self.calls = {}
+        self._statements = {}
+        self._sessions = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        delay = self.latency.get(name)
+        if delay:
+            self.sleep(delay)
+
+    def _finishes_at(self, statement):
+        return statement['started'] + statement['setup'] + self.execution_seconds
+
+    def execute_statement(self, **kwargs):
+        self._count('execute_statement')
+        statement_id = f'fake-{next(self._ids)}'
+        now = self.clock()
+        with self._lock:
+            session_id = kwargs.get('SessionId')
+            if session_id is not None:
+                session = self._sessions.get(session_id)
+                if session is None or (session['last'] is not None and now >= self._finishes_at(session['last']) + session['keepalive']):
+                    raise RuntimeError(f'ValidationException: Session {session_id} is not available')
+                if session['last'] is not None and now < self._finishes_at(session['last']):
+                    raise RuntimeError(f'ActiveStatementsExceededException: Session {session_id} is running a statement')
+                setup = 0.0
+            elif kwargs.get('SessionKeepAliveSeconds'):
+                session_id = f'session-{next(self._ids)}'
+                session = self._sessions[session_id] = {'keepalive': kwargs['SessionKeepAliveSeconds'], 'last': None}
+                setup = self.session_setup_seconds
+            else:
+                session = None
+                setup = self.session_setup_seconds
+        column_metadata, records = self.responder(kwargs['Sql'])
+        statement = {
+            'column_metadata': column_metadata,
+            'records': records,
+            'started': now,
+            'setup': setup,
+            'created_at': datetime.datetime.now(datetime.timezone.utc),
+        }
+        with self._lock:
+            self._statements[statement_id] = statement
+            if session is not None:
+                session['last'] = statement
+        response = {'Id': statement_id}
+        if session is not None:
+            response['SessionId'] = session_id
+        return response
+
+    def describe_statement(self, Id):
+        self._count('describe_statement')
+        statement = self._statements[Id]
+        elapsed = self.clock() - statement['started']
+        if elapsed < statement['setup'] + self.execution_seconds:
+            return {'Id': Id, 'Status': 'STARTED', 'HasResultSet': False, 'Duration': -1}
+        return {
+            'Id': Id,
+            'Status': 'FINISHED',
+            'HasResultSet': True,
+            'ResultRows': len(statement['records']),
+            'Duration': int(self.execution_seconds * 1e9),
+            'CreatedAt': statement['created_at'],
+            'UpdatedAt': statement['created_at'] + datetime.timedelta(seconds=elapsed),
+        }
+
+    def get_statement_result(self, Id, NextToken=None):
+        self._count('get_statement_result')
+        statement = self._statements[Id]
+        records = statement['records']
+        page = {'TotalNumRows': len(records)}
+        start = int(NextToken) if NextToken else 0
+        if start == 0:
+            page['ColumnMetadata'] = statement['column_metadata']
+        end = len(records) if self.page_size is None else start + self.page_size
+        page['Records'] = records[start:end]
+        if end < len(records):
+            page['NextToken'] = str(end)
+        return page
+
+    def cancel_statement(self, Id):
+        self._count('cancel_statement')
+        return {'Status': True}
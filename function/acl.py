@@ -0,0 +1,215 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Where grants come from: "file" (JSON or YAML) or "dynamodb"
+ACL_SOURCE = os.environ.get('ACL_SOURCE', 'file')
+ACL_PATH = os.environ.get('ACL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'acl.json'))
+ACL_TABLE = os.environ.get('ACL_TABLE')
+# How long compiled grants are trusted before the source is checked again
+ACL_TTL_SECONDS = float(os.environ.get('ACL_TTL_SECONDS', '60'))
+# How long a user unknown to a per-user source is remembered as having no grants
+ACL_NEGATIVE_TTL_SECONDS = float(os.environ.get('ACL_NEGATIVE_TTL_SECONDS', '60'))
+
+
+def compile_grants(grants):
+    """
+    Compile a user's grants into a set for O(1) membership checks.
+
+    :param grants: A list of {"db", "schema"} dicts
+    :return: A frozenset of (db, schema) tuples
+    """
+    return frozenset((grant['db'], grant['schema']) for grant in grants)
+
+
+def compile_acl(acl_data):
+    """
+    Compile a user -> grants mapping into an index.
+
+    :param acl_data: A dict of {user_id: [{"db", "schema"}, ...]}
+    :return: A dict of {user_id: frozenset of (db, schema)}
+    """
+    if not isinstance(acl_data, dict):
+        raise ValueError("ACL data must map user ids to lists of grants")
+    return {user_id: compile_grants(grants) for user_id, grants in acl_data.items()}
+
+
+class FileAclSource:
+    """Grants of every user, read from a JSON or YAML file of {user_id: [{"db", "schema"}]}."""
+
+    bulk = True
+
+    def __init__(self, path=ACL_PATH):
+        self.path = path
+
+    def version(self):
+        # Changes whenever the file is rewritten
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def load_all(self):
+        with open(self.path) as f:
+            if self.path.endswith(('.yaml', '.yml')):
+                try:
+                    import yaml
+                except ImportError:
+                    raise ImportError("Reading a YAML ACL file requires PyYAML in the deployment package")
+                return yaml.safe_load(f) or {}
+            return json.load(f)
+
+
+class InMemoryAclTable:
+    """
+    A local stand-in for a DynamoDB table of ACL items, answering get_item like
+    boto3's Table resource. Items look like {"user_id": ..., "grants": [{"db", "schema"}]}.
+    """
+
+    def __init__(self, items=None):
+        self.items = {item['user_id']: item for item in (items or [])}
+        self.get_item_calls = 0
+
+    def put_item(self, Item):
+        self.items[Item['user_id']] = Item
+
+    def get_item(self, Key):
+        self.get_item_calls += 1
+        item = self.items.get(Key['user_id'])
+        return {'Item': item} if item is not None else {}
+
+
+class DynamoDBAclSource:
+    """Grants read per user from a DynamoDB table keyed on user_id, with a "grants" list attribute."""
+
+    bulk = False
+
+    def __init__(self, table_name=ACL_TABLE, table=None):
+        if table is None:
+            if not table_name:
+                raise ValueError("ACL_TABLE must be set when ACL_SOURCE is dynamodb")
+            import boto3
+            table = boto3.resource('dynamodb').Table(table_name)
+        self.table = table
+
+    def load_user(self, user_id):
+        item = self.table.get_item(Key={'user_id': user_id}).get('Item')
+        return None if item is None else item.get('grants', [])
+
+
+class AclIndex:
+    """
+    A user -> set of (db, schema) index over an ACL source, reloaded at most once per TTL.
+
+    Bulk sources (files) are compiled whole and recompiled only when their version changes.
+    Per-user sources (tables) are cached per user, with unknown users remembered for the
+    negative TTL so repeated lookups do not reach the table.
+    """
+
+    def __init__(self, source, ttl=ACL_TTL_SECONDS, negative_ttl=ACL_NEGATIVE_TTL_SECONDS, clock=time.monotonic):
+        self.source = source
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self.loads = 0
+        self._lock = threading.Lock()
+        self._index = None
+        self._version = None
+        self._checked_at = None
+        self._users = {}
+
+    def _refresh_bulk(self):
+        now = self.clock()
+        if self._index is not None and now - self._checked_at < self.ttl:
+            return
+        version = self.source.version()
+        if self._index is None or version != self._version:
+            self._index = compile_acl(self.source.load_all())
+            self._version = version
+            self.loads += 1
+            logger.info("Loaded ACL for %d users", len(self._index))
+        self._checked_at = now
+
+    def _lookup_user(self, user_id):
+        now = self.clock()
+        cached = self._users.get(user_id)
+        if cached is not None and now < cached[0]:
+            return cached[1]
+        grants = self.source.load_user(user_id)
+        self.loads += 1
+        if grants is None:
+            entry = (now + self.negative_ttl, frozenset())
+        else:
+            entry = (now + self.ttl, compile_grants(grants))
+        self._users[user_id] = entry
+        return entry[1]
+
+    def grants(self, user_id):
+        """
+        Return the (db, schema) pairs a user may query.
+
+        :param user_id: The ID of the user
+        :return: A frozenset of (db, schema) tuples, empty for unknown users
+        """
+        with self._lock:
+            if self.source.bulk:
+                self._refresh_bulk()
+                return self._index.get(user_id, frozenset())
+            return self._lookup_user(user_id)
+
+    def has_access(self, user_id, db, schema):
+        """
+        Check whether a user may query a schema of a database.
+
+        :return: True if the user holds a grant for (db, schema)
+        """
+        return (db, schema) in self.grants(user_id)
+
+    def invalidate(self):
+        """Forget everything loaded, so the next lookup reads the source again."""
+        with self._lock:
+            self._index = None
+            self._users.clear()
+
+
+def create_acl_source():
+    """
+    Create the ACL source selected by ACL_SOURCE.
+
+    :return: A FileAclSource or DynamoDBAclSource
+    """
+    if ACL_SOURCE == 'file':
+        return FileAclSource(ACL_PATH)
+    if ACL_SOURCE == 'dynamodb':
+        return DynamoDBAclSource(ACL_TABLE)
+    raise ValueError(f"Unknown ACL_SOURCE {ACL_SOURCE}")
+
+
+_acl_index = None
+_acl_index_lock = threading.Lock()
+
+
+def get_acl_index():
+    """
+    Return the process-wide ACL index, creating it on first use.
+
+    :return: An AclIndex
+    """
+    global _acl_index
+    with _acl_index_lock:
+        if _acl_index is None:
+            _acl_index = AclIndex(create_acl_source())
+        return _acl_index
+
+
+def set_acl_index(index):
+    """
+    Replace the process-wide ACL index, e.g. with one over a local table.
+
+    :param index: An AclIndex
+    """
+    global _acl_index
+    with _acl_index_lock:
+        _acl_index = index
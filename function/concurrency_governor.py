@@ -0,0 +1,267 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+GOVERNOR_ENABLED = os.environ.get('GOVERNOR_ENABLED', 'true').lower() == 'true'
+# Statements allowed to run at once against the workgroup
+GOVERNOR_MAX_IN_FLIGHT = int(os.environ.get('GOVERNOR_MAX_IN_FLIGHT', '8'))
+# Statements started per second, and the burst allowed above it (0 disables the rate limit)
+GOVERNOR_RATE_PER_SECOND = float(os.environ.get('GOVERNOR_RATE_PER_SECOND', '0'))
+GOVERNOR_BURST = float(os.environ.get('GOVERNOR_BURST', str(max(1.0, GOVERNOR_RATE_PER_SECOND))))
+# Longest a statement waits for admission, and most statements waiting at once
+GOVERNOR_MAX_WAIT_SECONDS = float(os.environ.get('GOVERNOR_MAX_WAIT_SECONDS', '10'))
+GOVERNOR_MAX_QUEUE = int(os.environ.get('GOVERNOR_MAX_QUEUE', '32'))
+
+# Lower values are admitted first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_INTROSPECTION = 1
+
+# How often the head of the queue re-checks a backend it gets no notifications from
+POLL_INTERVAL_SECONDS = 0.05
+
+
+class GovernorRejectedError(Exception):
+    """Raised when a statement cannot be admitted within its wait budget."""
+
+
+class GovernorBackend:
+    """
+    State shared by everything sending statements to a workgroup: the statements waiting
+    for admission with their priorities, the statements in flight and the token bucket.
+    A backend shared across Lambda execution environments (DynamoDB items updated with
+    conditional writes, a Redis sorted set and script) implements the same calls, keyed
+    on the waiter, so it can order waiters from every environment by priority.
+    """
+
+    def enqueue(self, workgroup, waiter, priority):
+        """
+        Record a statement waiting for admission.
+
+        :param waiter: A unique identity of the waiting statement
+        :param priority: Its priority, lower values admitted first
+        :return: The number of statements already waiting for the workgroup
+        """
+        raise NotImplementedError
+
+    def try_acquire(self, workgroup, waiter, priority, max_in_flight, rate, burst):
+        """
+        Atomically admit a waiter if it is first in priority order, then first come first
+        served, among the workgroup's waiters and an in-flight slot and a rate token are
+        available. An admitted waiter leaves the queue.
+
+        :return: A tuple (acquired, retry_after), retry_after being the seconds until a token
+                 is due, or None when a slot or an earlier waiter is missing
+        """
+        raise NotImplementedError
+
+    def withdraw(self, workgroup, waiter):
+        """Remove a waiter that gave up before being admitted."""
+        raise NotImplementedError
+
+    def release(self, workgroup, waiter):
+        """Give back the in-flight slot of a finished statement."""
+        raise NotImplementedError
+
+    def in_flight(self, workgroup):
+        raise NotImplementedError
+
+    def queued(self, workgroup):
+        raise NotImplementedError
+
+
+class LocalGovernorBackend(GovernorBackend):
+    """
+    In-process state, enough for tests and for one execution environment. On Lambda an
+    environment serves one invocation at a time, so this only bounds the statements of a
+    single /querydatabase batch and orders waiters of that batch; workgroup-wide limits
+    and priorities across concurrent invocations need a shared backend.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._sequence = itertools.count()
+        self._in_flight = {}
+        self._buckets = {}
+
+    def enqueue(self, workgroup, waiter, priority):
+        with self._lock:
+            queue = self._queues.setdefault(workgroup, [])
+            waiting = len(queue)
+            heapq.heappush(queue, (priority, next(self._sequence), waiter))
+            return waiting
+
+    def try_acquire(self, workgroup, waiter, priority, max_in_flight, rate, burst):
+        with self._lock:
+            queue = self._queues.get(workgroup)
+            if not queue or queue[0][2] != waiter:
+                return False, None
+            if self._in_flight.get(workgroup, 0) >= max_in_flight:
+                return False, None
+            if rate > 0:
+                now = self.clock()
+                tokens, updated = self._buckets.get(workgroup, (burst, now))
+                tokens = min(burst, tokens + (now - updated) * rate)
+                if tokens < 1:
+                    self._buckets[workgroup] = (tokens, now)
+                    return False, (1 - tokens) / rate
+                self._buckets[workgroup] = (tokens - 1, now)
+            heapq.heappop(queue)
+            self._in_flight[workgroup] = self._in_flight.get(workgroup, 0) + 1
+            return True, None
+
+    def withdraw(self, workgroup, waiter):
+        with self._lock:
+            queue = self._queues.get(workgroup, [])
+            queue[:] = [entry for entry in queue if entry[2] != waiter]
+            heapq.heapify(queue)
+
+    def release(self, workgroup, waiter):
+        with self._lock:
+            self._in_flight[workgroup] = max(0, self._in_flight.get(workgroup, 0) - 1)
+
+    def in_flight(self, workgroup):
+        with self._lock:
+            return self._in_flight.get(workgroup, 0)
+
+    def queued(self, workgroup):
+        with self._lock:
+            return len(self._queues.get(workgroup, []))
+
+
+class Lease:
+    """An admitted statement's slot. Released once, on release() or leaving a with block."""
+
+    def __init__(self, governor, workgroup, waiter, waited):
+        self.governor = governor
+        self.workgroup = workgroup
+        self.waiter = waiter
+        self.waited = waited
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.governor._release(self.workgroup, self.waiter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class ConcurrencyGovernor:
+    """
+    Admission control for statements: at most max_in_flight at once and rate per second
+    per workgroup. Waiting statements are admitted in priority order, then first come
+    first served, and rejected once they have waited max_wait seconds. The queue, the
+    slots and the tokens live in the backend, so their scope is the backend's.
+    """
+
+    def __init__(self, backend=None, max_in_flight=GOVERNOR_MAX_IN_FLIGHT, rate=GOVERNOR_RATE_PER_SECOND,
+                 burst=GOVERNOR_BURST, max_wait=GOVERNOR_MAX_WAIT_SECONDS, max_queue=GOVERNOR_MAX_QUEUE,
+                 clock=time.monotonic):
+        self.backend = backend or LocalGovernorBackend(clock)
+        self.max_in_flight = max_in_flight
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.clock = clock
+        # Wakes local waiters when a local statement finishes; others are polled for
+        self._condition = threading.Condition()
+        self._waiting = set()
+        self._stats = {
+            "admitted": 0,
+            "rejected_wait": 0,
+            "rejected_queue_full": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0
+        }
+
+    def acquire(self, workgroup, priority=PRIORITY_INTERACTIVE, max_wait=None):
+        """
+        Wait for a statement to be admitted.
+
+        :param workgroup: The Redshift Serverless workgroup the statement runs in
+        :param priority: PRIORITY_INTERACTIVE or PRIORITY_INTROSPECTION
+        :param max_wait: Seconds to wait at most, capped by the governor's max_wait
+        :return: A Lease to release when the statement has finished
+        :raises GovernorRejectedError: If the queue is full or the wait budget runs out
+        """
+        max_wait = self.max_wait if max_wait is None else min(max_wait, self.max_wait)
+        started = self.clock()
+        deadline = started + max_wait
+        waiter = uuid.uuid4().hex
+
+        with self._condition:
+            waiting = self.backend.enqueue(workgroup, waiter, priority)
+            if waiting >= self.max_queue:
+                self.backend.withdraw(workgroup, waiter)
+                self._stats["rejected_queue_full"] += 1
+                raise GovernorRejectedError(
+                    f"Redshift is busy: {waiting} statements are already waiting. Retry shortly."
+                )
+            self._waiting.add(waiter)
+            try:
+                while True:
+                    acquired, retry_after = self.backend.try_acquire(
+                        workgroup, waiter, priority, self.max_in_flight, self.rate, self.burst
+                    )
+                    if acquired:
+                        waited = self.clock() - started
+                        self._stats["admitted"] += 1
+                        self._stats["wait_seconds_total"] += waited
+                        self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+                        if waited > 0.001:
+                            logger.info("Statement admitted after waiting %.3fs", waited)
+                        return Lease(self, workgroup, waiter, waited)
+                    remaining = deadline - self.clock()
+                    if remaining <= 0:
+                        self.backend.withdraw(workgroup, waiter)
+                        self._stats["rejected_wait"] += 1
+                        logger.warning("Statement rejected after waiting %.3fs (%s)", max_wait, self._stats)
+                        raise GovernorRejectedError(
+                            f"Redshift is busy: the statement was not admitted within {max_wait:g}s. Retry shortly."
+                        )
+                    self._condition.wait(min(remaining, retry_after or POLL_INTERVAL_SECONDS))
+            finally:
+                self._waiting.discard(waiter)
+                # Let the next waiter check whether it is now at the head of the queue
+                self._condition.notify_all()
+
+    def _release(self, workgroup, waiter):
+        self.backend.release(workgroup, waiter)
+        with self._condition:
+            self._condition.notify_all()
+
+    def stats(self):
+        """
+        Return admission counters: admitted and rejected statements and their wait times.
+
+        :return: A dict of counters
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats["queued"] = len(self._waiting)
+        return stats
+
+
+def create_governor(backend=None):
+    """
+    Create the governor configured by the GOVERNOR_* environment variables.
+
+    :param backend: A GovernorBackend, defaulting to a LocalGovernorBackend
+    :return: A ConcurrencyGovernor, or None when GOVERNOR_ENABLED is false
+    """
+    if not GOVERNOR_ENABLED:
+        return None
+    return ConcurrencyGovernor(backend)
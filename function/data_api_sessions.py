@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Seconds a Data API session stays open after its last statement, for the next statements of the same agent session (0 disables)
+DATA_API_SESSION_KEEPALIVE_SECONDS = int(os.environ.get('DATA_API_SESSION_KEEPALIVE_SECONDS', '300'))
+# A session this close to its expiry is not reused, as it could expire before the statement starts
+SESSION_EXPIRY_MARGIN_SECONDS = 5
+# Idle sessions kept per agent session and database, enough for a batch's concurrent statements
+MAX_IDLE_SESSIONS_PER_KEY = 4
+# Agent sessions whose Data API sessions are tracked by one execution environment
+MAX_TRACKED_AGENT_SESSIONS = 256
+# Session attribute carrying the open sessions to the next invocation of the same agent session
+SESSION_ATTRIBUTE = 'redshiftDataSessions'
+
+
+class SessionPool:
+    """
+    Data API sessions left open between statements, keyed by (agent session, workgroup,
+    database) so statements of one agent session never share a session with another.
+    A session runs one statement at a time: acquire hands out an idle session and
+    release returns it once its statement finished; a statement started while every
+    session is busy opens a new one. The open sessions of the current agent session are
+    also passed in its session attributes, so an invocation served by another execution
+    environment can reuse them.
+    """
+
+    def __init__(self, keepalive=DATA_API_SESSION_KEEPALIVE_SECONDS, clock=time.time):
+        self.keepalive = keepalive
+        self.clock = clock
+        self.agent_session = None
+        # (agent session, workgroup, database) -> [(session id, expires at)], most recently used last
+        self._idle = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"reused": 0, "opened": 0, "expired": 0, "failed": 0}
+
+    def begin(self, agent_session, attribute=None):
+        """
+        Start an invocation for an agent session, adopting the sessions passed in its
+        session attributes.
+
+        :param agent_session: The sessionId of the Bedrock agent, or None
+        :param attribute: The value of SESSION_ATTRIBUTE, if any
+        """
+        self.agent_session = agent_session
+        if not attribute:
+            return
+        try:
+            passed = [(name.partition('/'), session['id'], float(session['expires_at'])) for name, session in json.loads(attribute).items()]
+        except (TypeError, ValueError, KeyError, AttributeError):
+            logger.warning("Ignoring malformed %s session attribute", SESSION_ATTRIBUTE)
+            return
+        now = self.clock()
+        with self._lock:
+            for (workgroup, _, db), passed_id, expires_at in passed:
+                idle = self._idle.setdefault((agent_session, workgroup, db), [])
+                if expires_at > now and all(session_id != passed_id for session_id, _ in idle):
+                    idle.insert(0, (passed_id, expires_at))
+            self._trim()
+
+    def acquire(self, workgroup, db):
+        """
+        Take an idle session of the current agent session.
+
+        :param workgroup: The workgroup name
+        :param db: The database name
+        :return: A session id, or None to open a new session
+        """
+        now = self.clock()
+        with self._lock:
+            idle = self._idle.get((self.agent_session, workgroup, db), [])
+            while idle:
+                session_id, expires_at = idle.pop()
+                if expires_at - SESSION_EXPIRY_MARGIN_SECONDS > now:
+                    self._stats["reused"] += 1
+                    return session_id
+                self._stats["expired"] += 1
+            return None
+
+    def release(self, workgroup, db, session_id, opened=False):
+        """
+        Return a session whose statement finished, to be reused until keepalive seconds from now.
+
+        :param workgroup: The workgroup name
+        :param db: The database name
+        :param session_id: The SessionId returned by execute_statement
+        :param opened: Whether the statement opened the session
+        """
+        with self._lock:
+            if opened:
+                self._stats["opened"] += 1
+            key = (self.agent_session, workgroup, db)
+            idle = self._idle.setdefault(key, [])
+            idle.append((session_id, self.clock() + self.keepalive))
+            # Beyond the limit the oldest sessions are left to expire on their own
+            del idle[:-MAX_IDLE_SESSIONS_PER_KEY]
+            self._idle.move_to_end(key)
+            self._trim()
+
+    def failed(self):
+        """Count a session handed out by acquire that could not be reused, e.g. expired early."""
+        with self._lock:
+            self._stats["reused"] -= 1
+            self._stats["failed"] += 1
+
+    def _trim(self):
+        agent_sessions = OrderedDict((key[0], None) for key in self._idle)
+        for agent_session in list(agent_sessions)[:-MAX_TRACKED_AGENT_SESSIONS]:
+            for key in [key for key in self._idle if key[0] == agent_session]:
+                del self._idle[key]
+
+    def attribute(self):
+        """
+        The value of SESSION_ATTRIBUTE for the current agent session: its most recently
+        used open session per workgroup and database.
+
+        :return: A JSON string, or None when it has no open session
+        """
+        now = self.clock()
+        with self._lock:
+            sessions = {
+                f"{workgroup}/{db}": {"id": idle[-1][0], "expires_at": int(idle[-1][1])}
+                for (agent_session, workgroup, db), idle in self._idle.items()
+                if agent_session == self.agent_session and idle and idle[-1][1] > now
+            }
+        return json.dumps(sessions, sort_keys=True) if sessions else None
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+def create_session_pool():
+    """
+    Create the session pool configured by DATA_API_SESSION_KEEPALIVE_SECONDS.
+
+    :return: A SessionPool, or None when sessions are disabled
+    """
+    if DATA_API_SESSION_KEEPALIVE_SECONDS <= 0:
+        return None
+    return SessionPool()
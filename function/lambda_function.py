@@ -1,10 +1,35 @@
 import json
+import logging
 import os
-from redshift_serverless_functions import get_schema, get_user_acl, execute_query
+from redshift_serverless_functions import get_schema, get_schema_fingerprint, get_user_acl, execute_query, execute_query_batch, get_query_result, sweep_abandoned_statements, begin_data_api_sessions, data_api_session_attribute
+from statement_waiter import StatementTimeoutError, STATEMENT_TIMEOUT_SECONDS
+from statement_handles import STATEMENT_ASYNC_AFTER_SECONDS
+from data_api_sessions import SESSION_ATTRIBUTE
+from result_export import EXPORT_AUTO
+from response_encoder import encode_response_body
+from timing import recorder
+
+# Largest number of queries accepted in one /querydatabase call
+BATCH_MAX_QUERIES = int(os.environ.get('BATCH_MAX_QUERIES', '10'))
+
+logger = logging.getLogger()
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
 
 def lambda_handler(event, context):
-    print("Received event:", json.dumps(event))
+    # Events and results are only serialized when debug logging is enabled
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Received event: %s", json.dumps(event))
+
+    recorder.reset()
+    # Statements of one agent session reuse its open Data API sessions, see data_api_sessions
+    begin_data_api_sessions(event.get('sessionId'), (event.get('sessionAttributes') or {}).get(SESSION_ATTRIBUTE))
+    try:
+        with recorder.span("lambda_handler"):
+            return handle_event(event, context)
+    finally:
+        recorder.emit({"ApiPath": str(event.get('apiPath'))})
 
+def handle_event(event, context):
     try:
         api_path = event.get('apiPath')
         if not api_path:
@@ -13,23 +38,60 @@ def lambda_handler(event, context):
         if api_path == "/getschema":
             properties = event.get('requestBody', {}).get('content', {}).get('application/json', {}).get('properties', [])
             db = next((prop['value'] for prop in properties if prop['name'] == 'db'), None)
+            refresh = next((prop['value'] for prop in properties if prop['name'] == 'refresh'), None)
+            question = next((prop['value'] for prop in properties if prop['name'] == 'question'), None)
             if db is None:
                 return format_error_response('Missing database parameter', event)
-            result = get_schema(db)
+            result = get_schema(db, refresh=str(refresh).lower() == 'true', question=question)
+
+        elif api_path == "/getschemafingerprint":
+            # Not exposed to the agent; used by the app to key its suggested questions
+            properties = event.get('requestBody', {}).get('content', {}).get('application/json', {}).get('properties', [])
+            db = next((prop['value'] for prop in properties if prop['name'] == 'db'), None)
+            if db is None:
+                return format_error_response('Missing database parameter', event)
+            result = get_schema_fingerprint(db)
 
         elif api_path == "/querydatabase":
+            sweep_abandoned_statements()
             properties = event.get('requestBody', {}).get('content', {}).get('application/json', {}).get('properties', [])
             user_id = next((prop['value'] for prop in properties if prop['name'] == 'user_id'), None)
             db = next((prop['value'] for prop in properties if prop['name'] == 'database'), None)
             schema = next((prop['value'] for prop in properties if prop['name'] == 'schema'), None)
             table = next((prop['value'] for prop in properties if prop['name'] == 'table'), None)
             query = next((prop['value'] for prop in properties if prop['name'] == 'query'), None)
-            
-            if not all([db, schema, query]):
-                return format_error_response('Missing required parameters', event)
-            
-            result = execute_query(query, db, schema, table, user_id)
-            print("Query Result:", result)  # Debug print
+            queries = next((prop['value'] for prop in properties if prop['name'] == 'queries'), None)
+            export = next((prop['value'] for prop in properties if prop['name'] == 'export'), None)
+
+            if queries:
+                batch, error = parse_query_batch(queries, db, schema, table)
+                if error:
+                    return format_error_response(error, event)
+                result = execute_query_batch(batch, user_id, timeout=statement_timeout(context), async_after=async_after())
+                logger.debug("Batch Result: %s", result)
+            else:
+                if not all([db, schema, query]):
+                    return format_error_response('Missing required parameters', event)
+
+                result = execute_query(
+                    query, db, schema, table, user_id, timeout=statement_timeout(context),
+                    async_after=async_after(), export=export_requested(export)
+                )
+                logger.debug("Query Result: %s", result)
+
+        elif api_path == "/queryresult":
+            sweep_abandoned_statements()
+            properties = event.get('requestBody', {}).get('content', {}).get('application/json', {}).get('properties', [])
+            handle = next((prop['value'] for prop in properties if prop['name'] == 'handle'), None)
+            user_id = next((prop['value'] for prop in properties if prop['name'] == 'user_id'), None)
+            offset = next((prop['value'] for prop in properties if prop['name'] == 'offset'), None)
+            if handle is None:
+                return format_error_response('Missing handle parameter', event)
+            try:
+                offset = max(0, int(offset or 0))
+            except (TypeError, ValueError):
+                return format_error_response('The offset parameter must be an integer', event)
+            result = get_query_result(handle, user_id, offset=offset, timeout=statement_timeout(context))
 
         elif api_path == "/getUserACL":
             properties = event.get('requestBody', {}).get('content', {}).get('application/json', {}).get('properties', [])
@@ -43,11 +105,65 @@ def lambda_handler(event, context):
 
         return format_success_response(result, event)
 
+    except StatementTimeoutError as e:
+        logger.warning("Timeout in lambda_handler: %s", e)
+        return format_error_response(str(e), event, details=e.to_dict())
+
     except Exception as e:
-        print(f"Error in lambda_handler: {str(e)}")
+        logger.error("Error in lambda_handler: %s", e)
         return format_error_response(str(e), event)
 
-def format_error_response(error_message, event):
+def parse_query_batch(queries, db, schema, table):
+    # The agent passes arrays as JSON text; each entry may be a SQL string or an object
+    # overriding the request's database, schema and table
+    if isinstance(queries, str):
+        try:
+            queries = json.loads(queries)
+        except json.JSONDecodeError:
+            return None, 'The queries parameter must be a JSON array'
+    if not isinstance(queries, list) or not queries:
+        return None, 'The queries parameter must be a non-empty JSON array'
+    if len(queries) > BATCH_MAX_QUERIES:
+        return None, f'At most {BATCH_MAX_QUERIES} queries can be sent in one request'
+
+    batch = []
+    for item in queries:
+        if isinstance(item, str):
+            item = {'query': item}
+        if not isinstance(item, dict):
+            return None, 'Each entry of queries must be a SQL string or an object with a query'
+        entry = {
+            'query': item.get('query'),
+            'database': item.get('database', db),
+            'schema': item.get('schema', schema),
+            'table': item.get('table', table)
+        }
+        if not all([entry['query'], entry['database'], entry['schema']]):
+            return None, 'Missing required parameters in queries'
+        batch.append(entry)
+    return batch, None
+
+def async_after():
+    # Seconds before a running statement is answered with a handle, None when disabled
+    return STATEMENT_ASYNC_AFTER_SECONDS if STATEMENT_ASYNC_AFTER_SECONDS > 0 else None
+
+def export_requested(value):
+    # Large results are exported when the agent asks for it, or by default with EXPORT_AUTO
+    if value is None:
+        return EXPORT_AUTO
+    return str(value).lower() == 'true'
+
+def statement_timeout(context, margin_seconds=5):
+    # Leave enough of the Lambda's remaining time to cancel the statement and respond
+    if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+        return None
+    remaining = context.get_remaining_time_in_millis() / 1000.0 - margin_seconds
+    return max(1.0, min(STATEMENT_TIMEOUT_SECONDS, remaining))
+
+def format_error_response(error_message, event, details=None):
+    body = {'error': error_message}
+    if details:
+        body['details'] = details
     return {
         'messageVersion': '1.0',
         'response': {
@@ -57,21 +173,29 @@ def format_error_response(error_message, event):
             'httpStatusCode': 400,
             'responseBody': {
                 'application/json': {
-                    'body': json.dumps({'error': error_message})
+                    'body': json.dumps(body)
                 }
             }
         }
     }
 
+def session_attributes(event):
+    # Pass the open Data API sessions on to the next invocation of the agent session
+    attributes = dict(event.get('sessionAttributes') or {})
+    sessions = data_api_session_attribute()
+    if sessions:
+        attributes[SESSION_ATTRIBUTE] = sessions
+    return attributes
+
 def format_success_response(result, event):
     if result is None:
         result = {"error": "Query returned no results."}
     elif isinstance(result, str) and result.startswith("Error:"):
         return format_error_response(result, event)
     
-    result_str = json.dumps(result)
-    if len(result_str) > 24000:  # Check if result exceeds Bedrock's 25 KB limit
-        result = {"error": "Response size exceeds 25 KB limit."}
+    # Encode once, keeping as many rows as fit Bedrock's 25 KB limit
+    with recorder.span("encode"):
+        result_str = encode_response_body(result)
 
     return {
         'messageVersion': '1.0',
@@ -82,10 +206,10 @@ def format_success_response(result, event):
             'httpStatusCode': 200,
             'responseBody': {
                 'application/json': {
-                    'body': json.dumps(result)
+                    'body': result_str
                 }
             }
         },
-        'sessionAttributes': event.get('sessionAttributes', {}),
+        'sessionAttributes': session_attributes(event),
         'promptSessionAttributes': event.get('promptSessionAttributes', {})
     }
\ No newline at end of file
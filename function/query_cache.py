@@ -0,0 +1,245 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from result_reader import QueryResult
+
+logger = logging.getLogger(__name__)
+
+QUERY_CACHE_BACKEND = os.environ.get('QUERY_CACHE_BACKEND', 'memory').lower()
+QUERY_CACHE_TTL_SECONDS = int(os.environ.get('QUERY_CACHE_TTL_SECONDS', '300'))
+QUERY_CACHE_MAX_BYTES = int(os.environ.get('QUERY_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+QUERY_CACHE_PATH = os.environ.get('QUERY_CACHE_PATH', '/tmp/query_cache.sqlite')
+
+# Quoted literals and identifiers are kept verbatim, everything else is normalized
+_SQL_TOKEN = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|(--[^\n]*|/\*.*?\*/)|(\s+)|([^'\"\s/-]+|[-/])", re.DOTALL)
+_READ_ONLY = re.compile(r"^(select|with)\b")
+_VOLATILE = re.compile(r"\b(random|getdate|sysdate|current_timestamp|timeofday|now|current_time)\b")
+
+
+def normalize_sql(query):
+    """
+    Normalize a SQL statement for cache lookups: comments removed, whitespace collapsed,
+    everything outside quoted literals and identifiers lower-cased, trailing semicolons dropped.
+
+    :param query: The SQL statement
+    :return: The normalized statement
+    """
+    parts = []
+    for literal, comment, space, word in _SQL_TOKEN.findall(query):
+        if literal:
+            parts.append(literal)
+        elif comment or space:
+            if parts and parts[-1] != ' ':
+                parts.append(' ')
+        else:
+            parts.append(word.lower())
+    return ''.join(parts).strip().rstrip(';').strip()
+
+
+def is_cacheable(normalized_query):
+    """
+    Only read-only statements whose result does not depend on the clock are cached.
+
+    :param normalized_query: A statement returned by normalize_sql
+    :return: True if the result of the statement can be cached
+    """
+    return bool(_READ_ONLY.match(normalized_query)) and not _VOLATILE.search(normalized_query)
+
+
+def cache_key(normalized_query, db, schema, max_rows, max_bytes):
+    # Budgets are part of the key, as they decide which rows the cached result holds
+    material = json.dumps([normalized_query, db, schema, max_rows, max_bytes])
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class CacheBackend:
+    """
+    Interface of a query result store. Values are JSON strings; implementations
+    enforce their own size cap and expire entries after their TTL.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process LRU store, shared by the invocations served by one warm Lambda."""
+
+    def __init__(self, max_bytes=QUERY_CACHE_MAX_BYTES, clock=time.time):
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= self.clock():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, self.clock() + ttl)
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    File-backed LRU store. Several processes pointing at the same file share entries,
+    which makes it the local implementation of a shared cache.
+    """
+
+    def __init__(self, path=QUERY_CACHE_PATH, max_bytes=QUERY_CACHE_MAX_BYTES, clock=time.time):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.clock = clock
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS query_cache_last_access ON query_cache (last_access)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        now = self.clock()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, expires_at FROM query_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                conn.execute("DELETE FROM query_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE query_cache SET last_access = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key, value, ttl):
+        if len(value) > self.max_bytes:
+            return
+        now = self.clock()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO query_cache (key, value, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now + ttl, now)
+            )
+            conn.execute("DELETE FROM query_cache WHERE expires_at <= ?", (now,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM query_cache").fetchone()[0]
+            while total > self.max_bytes:
+                oldest = conn.execute("SELECT key, size FROM query_cache ORDER BY last_access LIMIT 1").fetchone()
+                conn.execute("DELETE FROM query_cache WHERE key = ?", (oldest[0],))
+                total -= oldest[1]
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM query_cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM query_cache")
+
+
+class QueryCache:
+    """Caches QueryResults keyed on normalized SQL, database, schema and result budgets."""
+
+    def __init__(self, backend, ttl=QUERY_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, query, db, schema, max_rows, max_bytes):
+        """
+        :return: A tuple of (cache key or None when the query is not cacheable, cached QueryResult or None)
+        """
+        normalized = normalize_sql(query)
+        if not is_cacheable(normalized):
+            return None, None
+        key = cache_key(normalized, db, schema, max_rows, max_bytes)
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning("Error reading query cache: %s", e)
+            value = None
+        if value is None:
+            self.misses += 1
+            return key, None
+        self.hits += 1
+        data = json.loads(value)
+        return key, QueryResult(data['rows'], total_rows=data['total_rows'], truncated=data['truncated'], pages_read=0)
+
+    def store(self, key, result):
+        value = json.dumps({"rows": result, "total_rows": result.total_rows, "truncated": result.truncated})
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            logger.warning("Error writing query cache: %s", e)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def create_query_cache(backend_name=QUERY_CACHE_BACKEND):
+    """
+    Build the query cache selected by QUERY_CACHE_BACKEND: "memory", "sqlite" or "none".
+
+    :return: A QueryCache, or None when caching is disabled
+    """
+    if backend_name == 'none':
+        return None
+    if backend_name == 'sqlite':
+        return QueryCache(SQLiteCacheBackend())
+    if backend_name != 'memory':
+        logger.warning("Unknown QUERY_CACHE_BACKEND %s, using memory", backend_name)
+    return QueryCache(MemoryCacheBackend())
@@ -0,0 +1,219 @@
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+QUERY_GUARD_ENABLED = os.environ.get('QUERY_GUARD_ENABLED', 'true').lower() == 'true'
+# Run EXPLAIN before each guarded statement, costing one extra Data API round trip
+QUERY_GUARD_EXPLAIN = os.environ.get('QUERY_GUARD_EXPLAIN', 'false').lower() == 'true'
+# Reject statements whose estimated total cost, or largest estimated scan, exceeds these (0 disables)
+QUERY_GUARD_MAX_COST = float(os.environ.get('QUERY_GUARD_MAX_COST', '0'))
+QUERY_GUARD_MAX_SCAN_ROWS = int(os.environ.get('QUERY_GUARD_MAX_SCAN_ROWS', '0'))
+
+# Quoted literals and identifiers, comments, whitespace, punctuation and words
+_TOKEN = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|(--[^\n]*|/\*.*?\*/)|(\s+)|([();,])|([^'\"\s/();,-]+|[-/])", re.DOTALL)
+_PLAN_ESTIMATE = re.compile(r"cost=([\d.]+)\.\.([\d.]+) rows=(\d+) width=(\d+)")
+_PLAN_SCAN = re.compile(r"Seq Scan on (\S+).*?rows=(\d+)")
+
+_stats = {
+    "checked": 0,
+    "limits_injected": 0,
+    "limits_tightened": 0,
+    "explained": 0,
+    "scans_prevented": 0
+}
+_stats_lock = threading.Lock()
+
+
+class QueryRejectedError(Exception):
+    """Raised when a statement's estimated cost exceeds the guard's thresholds."""
+
+
+class GuardedQuery:
+    """
+    A statement as it will be executed, with the row limit the guard put on it.
+    limit is None when the guard did not inject or tighten a LIMIT.
+    """
+
+    def __init__(self, sql, limit=None, action=None, estimate=None):
+        self.sql = sql
+        self.limit = limit
+        self.action = action
+        self.estimate = estimate
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def stats():
+    """
+    Return the guard's counters since the execution environment started.
+
+    :return: A dict of counters
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _significant_tokens(query):
+    # (text, start, end, depth) of every token outside comments and whitespace
+    tokens = []
+    depth = 0
+    for match in _TOKEN.finditer(query):
+        literal, comment, space, punct, word = match.groups()
+        if comment or space:
+            continue
+        text = match.group(0)
+        if punct == ')':
+            depth -= 1
+        tokens.append((text, match.start(), match.end(), depth))
+        if punct == '(':
+            depth += 1
+    return tokens
+
+
+def _statement_tokens(query):
+    # Tokens of a single read-only statement, without trailing semicolons, or None
+    tokens = _significant_tokens(query)
+    while tokens and tokens[-1][0] == ';':
+        tokens.pop()
+    if not tokens or tokens[0][0].lower() not in ('select', 'with'):
+        return None
+    if any(text == ';' and depth == 0 for text, _, _, depth in tokens):
+        return None
+    return tokens
+
+
+def strip_trailing(query):
+    """
+    Remove the whitespace, comments and semicolons after the last token of a statement,
+    so it can be embedded in another one.
+
+    :param query: The SQL statement
+    :return: The statement up to its last significant token
+    """
+    tokens = _significant_tokens(query)
+    while tokens and tokens[-1][0] == ';':
+        tokens.pop()
+    return query[:tokens[-1][2]].strip() if tokens else ''
+
+
+def apply_limit(query, limit):
+    """
+    Make sure a read-only statement returns at most limit rows, adding a LIMIT clause or
+    lowering an existing LIMIT or TOP. Other statements, and several statements in one,
+    are returned unchanged.
+
+    :param query: The SQL statement
+    :param limit: The maximum number of rows
+    :return: A tuple (sql, action), action being "limit_injected", "limit_tightened" or None
+    """
+    tokens = _statement_tokens(query)
+    if tokens is None:
+        return query, None
+
+    for index, (text, start, end, depth) in enumerate(tokens):
+        if depth != 0 or index + 1 >= len(tokens):
+            continue
+        keyword = text.lower()
+        is_limit = keyword == 'limit'
+        is_top = keyword == 'top' and index > 0 and tokens[index - 1][0].lower() in ('select', 'distinct')
+        if not (is_limit or is_top):
+            continue
+        value, value_start, value_end, _ = tokens[index + 1]
+        if value.isdigit() and int(value) <= limit:
+            return query, None
+        if value.isdigit() or (is_limit and value.lower() == 'all'):
+            return query[:value_start] + str(limit) + query[value_end:], "limit_tightened"
+
+    last_end = tokens[-1][2]
+    return f"{query[:last_end]} LIMIT {limit}", "limit_injected"
+
+
+def parse_plan(plan_lines):
+    """
+    Extract the estimates of an EXPLAIN plan.
+
+    :param plan_lines: The lines of the plan, top node first
+    :return: A dict with "cost", "rows", "width" of the top node and the "scans" of the
+             plan as (table, estimated rows) tuples, largest first
+    """
+    estimate = {"cost": None, "rows": None, "width": None, "scans": []}
+    for line in plan_lines:
+        match = _PLAN_ESTIMATE.search(line)
+        if match and estimate["cost"] is None:
+            estimate["cost"] = float(match.group(2))
+            estimate["rows"] = int(match.group(3))
+            estimate["width"] = int(match.group(4))
+        scan = _PLAN_SCAN.search(line)
+        if scan:
+            estimate["scans"].append((scan.group(1), int(scan.group(2))))
+    estimate["scans"].sort(key=lambda scan: scan[1], reverse=True)
+    return estimate
+
+
+def _rejection(reason, estimate):
+    scans = ", ".join(f"{table} (~{rows} rows)" for table, rows in estimate["scans"][:3])
+    message = f"Query rejected by the cost guard: {reason}."
+    if scans:
+        message += f" Largest scans: {scans}."
+    return message + (" Narrow the query with WHERE filters on the largest tables, aggregate in SQL"
+                      " instead of returning raw rows, or select fewer columns, then retry.")
+
+
+def guard_query(query, max_rows, max_bytes=None, explain=None,
+                max_cost=QUERY_GUARD_MAX_COST, max_scan_rows=QUERY_GUARD_MAX_SCAN_ROWS):
+    """
+    Bound a statement to the response budget before it runs.
+
+    A LIMIT one row above max_rows is injected or tightened, so truncation can still be
+    detected. With explain, the statement's plan is checked against the thresholds and the
+    LIMIT is lowered further to one row above those that can fit in max_bytes given the
+    estimated width. Readers keep at most limit - 1 rows, so the extra row always marks
+    a result cut short by the LIMIT.
+
+    :param query: The SQL statement
+    :param max_rows: The row budget of the response
+    :param max_bytes: The byte budget of the response (optional)
+    :param explain: Callable sql -> list of EXPLAIN plan lines, or None to skip EXPLAIN
+    :param max_cost: Reject statements with a larger estimated total cost, 0 to disable
+    :param max_scan_rows: Reject statements scanning more estimated rows from one table, 0 to disable
+    :return: A GuardedQuery
+    :raises QueryRejectedError: If the plan exceeds a threshold
+    """
+    _count("checked")
+    if _statement_tokens(query) is None:
+        return GuardedQuery(query)
+
+    limit = max_rows + 1
+    sql, action = apply_limit(query, limit)
+    if action is None:
+        limit = None
+
+    estimate = None
+    if explain is not None:
+        estimate = parse_plan(explain(sql))
+        _count("explained")
+        if max_cost and estimate["cost"] is not None and estimate["cost"] > max_cost:
+            _count("scans_prevented")
+            raise QueryRejectedError(_rejection(f"estimated cost {estimate['cost']:.0f} exceeds {max_cost:.0f}", estimate))
+        if max_scan_rows and estimate["scans"] and estimate["scans"][0][1] > max_scan_rows:
+            _count("scans_prevented")
+            raise QueryRejectedError(_rejection(f"it scans an estimated {estimate['scans'][0][1]} rows, more than {max_scan_rows}", estimate))
+        if max_bytes and estimate["width"]:
+            # A row's JSON is at least as wide as its estimated width, so no more rows can fit,
+            # plus one to keep truncation detectable when the real rows are narrower
+            fitting = max_bytes // estimate["width"] + 1
+            if fitting < max_rows:
+                sql, tightened = apply_limit(sql, fitting + 1)
+                if tightened:
+                    limit = fitting + 1
+                    action = action or tightened
+
+    if action is not None:
+        _count("limits_injected" if action == "limit_injected" else "limits_tightened")
+    return GuardedQuery(sql, limit=limit, action=action, estimate=estimate)
@@ -1,67 +1,119 @@
 import boto3
-import json
+import logging
 import os
+import time
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from acl import get_acl_index
+from schema_catalog import load_catalog
+from schema_index import get_schema_index, compact_schema, SCHEMA_MAX_TABLES
+from statement_waiter import wait_for_statement, StatementTimeoutError, STATEMENT_TIMEOUT_SECONDS
+from statement_handles import create_handle_store, sweep_expired, pending_response, STATEMENT_ASYNC_AFTER_SECONDS
+from result_reader import read_statement_result, QueryResult, QueryBatchResult, MAX_RESULT_ROWS, MAX_RESULT_BYTES
+from query_cache import create_query_cache
+from data_api_sessions import create_session_pool
+from result_export import exports_enabled, new_export, build_unload, export_summary
+from concurrency_governor import create_governor, GovernorRejectedError, PRIORITY_INTERACTIVE, PRIORITY_INTROSPECTION
+from query_guard import guard_query, QueryRejectedError, QUERY_GUARD_ENABLED, QUERY_GUARD_EXPLAIN, stats as guard_stats
+from result_decoder import iter_records
+from timing import recorder, timed_iter
 
-redshift_data = boto3.client('redshift-data')
+logger = logging.getLogger(__name__)
+
+# Upper bound on statements a single /querydatabase batch runs at once
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', '4'))
+
+def create_redshift_data_client():
+    """
+    Create a redshift-data client tuned for Lambda: kept-alive connections, a pool sized for
+    concurrent batch statements, short connect timeouts and fast standard-mode retries.
+    
+    :return: A redshift-data client
+    """
+    config = Config(
+        tcp_keepalive=True,
+        max_pool_connections=BATCH_MAX_WORKERS + 2,
+        connect_timeout=float(os.environ.get('DATA_API_CONNECT_TIMEOUT', '2')),
+        read_timeout=float(os.environ.get('DATA_API_READ_TIMEOUT', '15')),
+        retries={'mode': 'standard', 'max_attempts': int(os.environ.get('DATA_API_MAX_ATTEMPTS', '3'))}
+    )
+    return boto3.client('redshift-data', config=config)
+
+def set_redshift_data_client(client):
+    """
+    Replace the module's redshift-data client, e.g. with a stub for benchmarks.
+    
+    :param client: An object implementing the redshift-data calls used by this module
+    """
+    global redshift_data
+    redshift_data = client
+
+# Created once per execution environment, during Lambda init, and reused by every invocation
+redshift_data = create_redshift_data_client()
 workgroup_name = os.environ['REDSHIFT_WORKGROUP_NAME']
+query_cache = create_query_cache()
+governor = create_governor()
+handle_store = create_handle_store()
+session_pool = create_session_pool()
 
-def get_schema(db):
+def get_schema(db, refresh=False, question=None):
     """
     Retrieve the schema for tables in the specified database.
+    The catalog is loaded with one bulk query and cached per database, see schema_catalog.
+    With a question, tables are ranked against it with the catalog's BM25 index and only the
+    best matches are returned, see schema_index.
     
     :param db: The name of the database
-    :return: A list of dictionaries containing table names and their schemas
+    :param refresh: Reload the catalog from Redshift even if a cached copy is still valid
+    :param question: The user's question or keywords to select relevant tables (optional)
+    :return: A dictionary with the tables and their columns, sized to fit the response, and
+             the number of tables and columns left out
     """
-    table_schema_list = []
-    
     try:
-        # Get list of schemas
-        schema_query = "SELECT DISTINCT schemaname FROM pg_tables WHERE schemaname NOT IN ('pg_catalog', 'information_schema');"
-        schema_result = execute_query(schema_query, db, None, None)
+        entry = load_catalog(
+            db,
+            lambda query, database: execute_query(query, database, None, None, max_rows=None, max_bytes=None, use_cache=False, priority=PRIORITY_INTROSPECTION),
+            force_refresh=refresh
+        )
         
-        for schema in schema_result:
-            schema_name = schema['schemaname']
-            # Get list of tables for each schema
-            table_query = f"SELECT tablename FROM pg_tables WHERE schemaname = '{schema_name}';"
-            table_result = execute_query(table_query, db, None, None)
-            
-            for table in table_result:
-                table_name = table['tablename']
-                # Get column information for each table
-                column_query = f"SELECT column_name, data_type FROM information_schema.columns WHERE table_schema = '{schema_name}' AND table_name = '{table_name}';"
-                column_result = execute_query(column_query, db, None, None)
-                
-                schema = {col['column_name']: col['data_type'] for col in column_result}
-                table_schema_list.append({"Table": f"{schema_name}.{table_name}", "Schema": json.dumps(schema)})
+        if not question:
+            return compact_schema(entry['catalog'])
+        with recorder.span("schema_rank"):
+            ranked = get_schema_index(db, entry).search(question, limit=SCHEMA_MAX_TABLES)
+        # Without any match the agent still gets the start of the catalog rather than nothing
+        result = compact_schema(entry['catalog'], ranked or None)
+        result["matched_tables"] = len(ranked)
+        return result
     
     except Exception as e:
-        print(f"Error in get_schema: {str(e)}")
+        logger.error("Error in get_schema: %s", e)
         return [{"Error": str(e)}]
+
+def get_schema_fingerprint(db):
+    """
+    Retrieve the fingerprint of a database's catalog, which changes whenever a table or column does.
+    Served from the same cached catalog as get_schema.
     
-    return table_schema_list
+    :param db: The name of the database
+    :return: A dictionary with the database, its fingerprint and its number of tables
+    """
+    entry = load_catalog(
+        db,
+        lambda query, database: execute_query(query, database, None, None, max_rows=None, max_bytes=None, use_cache=False, priority=PRIORITY_INTROSPECTION)
+    )
+    return {"db": db, "fingerprint": entry['fingerprint'], "tables": len(entry['catalog'])}
 
 def get_user_acl(user_id):
     """
     Retrieve the list of data sources a given user has access to.
+    Grants come from the ACL source configured for the function, see acl.
     
     :param user_id: The ID of the user to get data source access for
     :return: A list of accessible data sources
     """
-    # This is a mock implementation. In a real scenario, you'd query your ACL system.
-    acl_data = {
-        "sudipta": [
-            {"db": "sample_data_dev", "schema": "tpcds"},
-            {"db": "sample_data_prod", "schema": "public"}
-        ],
-        "syed": [
-            {"db": "sample_data_dev", "schema": "tpcds"},
-            {"db": "analytics", "schema": "reports"}
-        ]
-    }
-    
-    return acl_data.get(user_id, [])
+    return [{"db": db, "schema": schema} for db, schema in sorted(get_acl_index().grants(user_id))]
 
-def execute_query(query, db, schema, table, user_id=None):
+def execute_query(query, db, schema, table, user_id=None, timeout=None, max_rows=MAX_RESULT_ROWS, max_bytes=MAX_RESULT_BYTES, use_cache=True, priority=PRIORITY_INTERACTIVE, async_after=None, export=False):
     """
     Execute a query using Amazon Redshift Serverless after checking user access if applicable.
     Allows DESCRIBE queries without specific user permissions.
@@ -71,40 +123,372 @@ def execute_query(query, db, schema, table, user_id=None):
     :param schema: the schema in which table exist
     :param table: the table name
     :param user_id: The ID of the user executing the query (optional)
-    :return: Query results or error message
+    :param timeout: Seconds to wait for the statement before cancelling it (optional)
+    :param max_rows: Stop reading after this many rows, None to read them all
+    :param max_bytes: Stop reading once the rows would exceed this JSON size, None to read them all
+    :param use_cache: Serve read-only queries from, and store them in, the query result cache
+    :param priority: Admission priority, PRIORITY_INTERACTIVE or PRIORITY_INTROSPECTION
+    :param async_after: Seconds after which a still running statement is left running and a
+                        handle to it returned, see get_query_result (optional)
+    :param export: Unload a result that does not fit the budgets to Parquet and return its
+                   summary instead, see export_result
+    :return: Query results as a QueryResult, an export summary, a pending statement handle,
+             or error message
+    :raises StatementTimeoutError: If the statement is cancelled for exceeding its deadline
     """
+    export = export and exports_enabled()
+
     # Check if the query is a DESCRIBE query
     is_describe_query = query.strip().upper().startswith("DESCRIBE")
 
     # If it's not a DESCRIBE query and user_id is provided, check if user has access to the schema
     if not is_describe_query and user_id and db and schema:
-        user_acl = get_user_acl(user_id)
-        if not any(acl['db'] == db and acl['schema'] == schema for acl in user_acl):
+        if not get_acl_index().has_access(user_id, db, schema):
             return f"Error: User {user_id} does not have access to database {db} and schema {schema}"
 
-    response = redshift_data.execute_statement(
-        WorkgroupName=workgroup_name,
-        Database=db,
-        Sql=query,
-        WithEvent=True
-    )
+    # Only serve from the cache once the ACL check has passed
+    cache_key = None
+    if use_cache and query_cache is not None:
+        cache_key, cached = query_cache.lookup(query, db, schema, max_rows, max_bytes)
+        # A truncated result is only the preview of an export, so it is not served from the cache
+        if cached is not None and not (export and getattr(cached, 'truncated', False)):
+            logger.info("Query cache hit (%s)", query_cache.stats())
+            return cached
+
+    # Bound the statement to the response budget, and reject it if its plan is too expensive
+    guarded = None
+    if QUERY_GUARD_ENABLED and max_rows is not None:
+        try:
+            with recorder.span("guard"):
+                guarded = guard_query(
+                    query, max_rows, max_bytes,
+                    explain=(lambda sql: explain_query(sql, db)) if QUERY_GUARD_EXPLAIN else None
+                )
+        except QueryRejectedError as e:
+            logger.info("Query rejected by the cost guard (%s)", guard_stats())
+            return f"Error: {e}"
+        if guarded.action:
+            logger.info("Query guard %s LIMIT %d", guarded.action, guarded.limit)
+
+    # Wait for the workgroup's admission control before starting the statement
+    lease = None
+    if governor is not None:
+        try:
+            lease = governor.acquire(workgroup_name, priority=priority, max_wait=timeout)
+        except GovernorRejectedError as e:
+            return f"Error: {e}"
+        recorder.add("governor_queue", lease.waited * 1000)
+        if timeout is not None:
+            # Time spent queued counts against the statement's deadline
+            timeout = max(0.0, timeout - lease.waited)
+    started = time.monotonic()
+
     try:
-        query_id = response['Id']
+        statement = submit_statement(guarded.sql if guarded else query, db)
+        try:
+            query_id = statement['id']
+
+            # Detach from statements outliving async_after, unless the deadline comes first anyway
+            detach = (
+                async_after is not None and handle_store is not None
+                and async_after < (STATEMENT_TIMEOUT_SECONDS if timeout is None else timeout)
+            )
         
-        # Wait for query to complete
-        while True:
-            status = redshift_data.describe_statement(Id=query_id)
-            if status['Status'] == 'FINISHED':
-                break
-            elif status['Status'] in ['FAILED', 'ABORTED']:
+            # Wait for query to complete, cancelling it if it outlives its deadline
+            try:
+                with recorder.span("wait"):
+                    status, polls = wait_for_statement(
+                        redshift_data, query_id,
+                        timeout=async_after if detach else timeout,
+                        cancel_on_timeout=not detach
+                    )
+            except StatementTimeoutError as e:
+                if not detach:
+                    raise
+                entry = handle_store.register(query_id, db, schema, user_id, guarded.limit if guarded else None, cache_key)
+                logger.info("Statement %s still %s after %.1fs, returning a handle", query_id, e.last_status, async_after)
+                return pending_response(entry, e.last_status, async_after)
+            release_session(statement, db)
+            record_statement_timing(status, statement)
+            if status['Status'] in ['FAILED', 'ABORTED']:
                 return f"Query failed: {status.get('Error', 'Unknown error')}"
 
-        # Get results
-        result = redshift_data.get_statement_result(Id=query_id)
-        return extract_result_data(result)
+            result = read_finished_statement(query_id, status, guarded.limit if guarded else None, max_rows, max_bytes)
+            if export and result.truncated:
+                remaining = None if timeout is None else max(1.0, timeout - (time.monotonic() - started))
+                return export_result(query, db, result, timeout=remaining)
+            if cache_key is not None:
+                query_cache.store(cache_key, result)
+            return result
+
+        except StatementTimeoutError:
+            raise
+        except Exception as e:
+            return f"Error in execute_query: {str(e)}"
+    finally:
+        if lease is not None:
+            lease.release()
+
+def export_result(query, db, preview, timeout=None):
+    """
+    Run a query again as an UNLOAD writing its full result as Parquet to EXPORT_LOCATION,
+    so a result too large for the agent reaches the user through the app instead.
+    An UNLOAD still running at the deadline is left running: its manifest appears once
+    it finishes.
+    
+    :param query: The query, as sent by the agent
+    :param db: The database name
+    :param preview: The budgeted, truncated QueryResult of the query
+    :param timeout: Seconds to wait for the UNLOAD (optional)
+    :return: An export summary, or the preview if the UNLOAD failed
+    """
+    export_id, prefix, manifest = new_export()
+    with recorder.span("export"):
+        statement = submit_statement(build_unload(query, prefix), db)
+        try:
+            status, polls = wait_for_statement(redshift_data, statement['id'], timeout=timeout, cancel_on_timeout=False)
+        except StatementTimeoutError as e:
+            logger.info("Export %s still %s at the deadline, left running", export_id, e.last_status)
+            return export_summary(export_id, manifest, list(preview), e.last_status)
+    release_session(statement, db)
+    if status['Status'] != 'FINISHED':
+        logger.warning("Export %s failed, returning the truncated result: %s", export_id, status.get('Error'))
+        return preview
+    rows = status.get('ResultRows')
+    logger.info("Exported %s rows to %s", rows, prefix)
+    return export_summary(export_id, manifest, list(preview), status['Status'], rows if rows and rows > 0 else None)
+
+def submit_statement(sql, db):
+    """
+    Start a statement, in an open Data API session of the current agent session when one is
+    idle, so it skips connecting and authenticating to the workgroup. Otherwise it opens a
+    session kept alive for the next statements. A session that can no longer be used, e.g.
+    because it expired, is dropped and the statement is started in a new one.
+    
+    :param sql: The SQL statement
+    :param db: The database name
+    :return: A dict with the statement "id", its "session_id" (or None), whether it "reused"
+             a session, and the "submit_ms" spent starting it
+    """
+    session_id = session_pool.acquire(workgroup_name, db) if session_pool is not None else None
+    if session_id is not None:
+        started = time.perf_counter()
+        try:
+            with recorder.span("submit", session="reused"):
+                # The workgroup and database are those of the session
+                response = redshift_data.execute_statement(Sql=sql, SessionId=session_id, WithEvent=True)
+            return {"id": response['Id'], "session_id": session_id, "reused": True, "submit_ms": (time.perf_counter() - started) * 1000}
+        except Exception as e:
+            logger.info("Data API session %s could not be reused, opening a new one: %s", session_id, e)
+            session_pool.failed()
+
+    keepalive = {"SessionKeepAliveSeconds": session_pool.keepalive} if session_pool is not None else {}
+    started = time.perf_counter()
+    with recorder.span("submit", session="new" if keepalive else "none"):
+        response = redshift_data.execute_statement(
+            WorkgroupName=workgroup_name,
+            Database=db,
+            Sql=sql,
+            WithEvent=True,
+            **keepalive
+        )
+    return {"id": response['Id'], "session_id": response.get('SessionId'), "reused": False, "submit_ms": (time.perf_counter() - started) * 1000}
+
+def release_session(statement, db):
+    # The statement finished, so its session can run the next one
+    if session_pool is not None and statement['session_id']:
+        session_pool.release(workgroup_name, db, statement['session_id'], opened=not statement['reused'])
+
+def begin_data_api_sessions(agent_session, attribute=None):
+    """
+    Scope the Data API sessions of this invocation to an agent session.
+    
+    :param agent_session: The sessionId of the Bedrock agent, or None
+    :param attribute: The sessions passed in its session attributes, if any
+    """
+    if session_pool is not None:
+        session_pool.begin(agent_session, attribute)
+
+def data_api_session_attribute():
+    """
+    The open Data API sessions of the current agent session, to pass in its session attributes.
+    
+    :return: A JSON string, or None
+    """
+    return session_pool.attribute() if session_pool is not None else None
+
+def read_finished_statement(query_id, status, limit, max_rows, max_bytes, offset=0):
+    """
+    Read the rows of a finished statement within the result budgets.
+    
+    :param query_id: The Id of the statement
+    :param status: Its final describe_statement response
+    :param limit: The LIMIT injected by the query guard, if any
+    :param max_rows: Stop reading after this many rows, None to read them all
+    :param max_bytes: Stop reading once the rows would exceed this JSON size, None to read them all
+    :param offset: Number of leading rows to skip
+    :return: A QueryResult
+    """
+    # Get results, reading only as many pages as the budgets allow
+    if not status.get('HasResultSet', True):
+        return QueryResult()
+    total_rows = status.get('ResultRows')
+    if limit is not None:
+        # The guard's LIMIT is one row above what may be returned, so reading that extra
+        # row marks the result as truncated even when every row fits the byte budget
+        kept = max(limit - 1 - offset, 0)
+        max_rows = kept if max_rows is None else min(max_rows, kept)
+        if total_rows is not None and total_rows >= limit:
+            # Cut short by the guard's LIMIT, so the full row count is unknown
+            total_rows = None
+    # Rows are decoded lazily while they are read, so decoding is timed separately from fetching
+    decode_seconds = [0.0]
+    read_started = recorder.clock()
+    result = read_statement_result(
+        redshift_data, query_id, lambda page: timed_iter(iter_result_data(page), decode_seconds),
+        max_rows=max_rows, max_bytes=max_bytes,
+        total_rows=total_rows, offset=offset
+    )
+    read_ms = (recorder.clock() - read_started) * 1000
+    recorder.add("decode", decode_seconds[0] * 1000)
+    recorder.add("fetch", read_ms - decode_seconds[0] * 1000, pages=result.pages_read)
+    return result
+
+def get_query_result(handle, user_id=None, offset=0, timeout=None, wait=STATEMENT_ASYNC_AFTER_SECONDS):
+    """
+    Retrieve the status or the rows of a statement /querydatabase returned a handle for.
+    Waits up to wait seconds for a running statement before reporting it as still running.
+    Rows are returned within the usual budgets, starting at offset, so a large result is
+    read in pages by passing the offset plus the rows already returned.
+    
+    :param handle: The handle returned by /querydatabase
+    :param user_id: The ID of the user asking, who must be the one who ran the query
+    :param offset: Number of leading rows to skip
+    :param timeout: Seconds left to wait in this invocation (optional)
+    :param wait: Seconds to wait at most for a running statement
+    :return: A QueryResult, a pending statement handle, or error message
+    """
+    entry = handle_store.get(handle) if handle_store is not None else None
+    if entry is None:
+        return f"Error: Unknown or expired statement handle {handle}"
+    owner = entry.get('user_id')
+    if owner and (user_id != owner or not get_acl_index().has_access(owner, entry['db'], entry['schema'])):
+        return f"Error: User {user_id} does not have access to the result of statement {handle}"
+
+    statement_id = entry['statement_id']
+    try:
+        with recorder.span("wait"):
+            status, polls = wait_for_statement(
+                redshift_data, statement_id,
+                timeout=wait if timeout is None else min(wait, timeout),
+                cancel_on_timeout=False
+            )
+    except StatementTimeoutError as e:
+        return pending_response(entry, e.last_status, time.time() - float(entry['created_at']))
+    record_statement_timing(status)
+    if status['Status'] in ['FAILED', 'ABORTED']:
+        handle_store.remove(handle)
+        return f"Query failed: {status.get('Error', 'Unknown error')}"
+
+    limit = entry.get('limit')
+    result = read_finished_statement(
+        statement_id, status, None if limit is None else int(limit),
+        MAX_RESULT_ROWS, MAX_RESULT_BYTES, offset=offset
+    )
+    if offset == 0 and entry.get('cache_key') and query_cache is not None:
+        query_cache.store(entry['cache_key'], result)
+    return result
 
+def sweep_abandoned_statements():
+    """
+    Cancel statements whose handles were not used within their TTL, at most once per
+    sweep interval. Errors are logged, never raised.
+    
+    :return: The number of statements cancelled
+    """
+    if handle_store is None or not handle_store.sweep_due():
+        return 0
+    try:
+        return sweep_expired(handle_store, redshift_data)
     except Exception as e:
-        return f"Error in execute_query: {str(e)}"
+        logger.warning("Error sweeping abandoned statements: %s", e)
+        return 0
+
+def record_statement_timing(status, statement=None):
+    """
+    Record the Redshift-side queue and run time of a finished statement from describe_statement.
+    Duration is the execution time in nanoseconds; the rest of CreatedAt..UpdatedAt was spent queued.
+    With the statement as returned by submit_statement, its setup overhead (starting it plus
+    the queue time, which includes connecting to the workgroup) is also recorded, as
+    setup_warm in a reused session and setup_cold otherwise.
+    
+    :param status: A describe_statement response
+    :param statement: The statement as returned by submit_statement (optional)
+    """
+    duration = status.get('Duration')
+    if duration is None or duration < 0:
+        return
+    run_ms = duration / 1e6
+    recorder.add("redshift_run", run_ms)
+    created, updated = status.get('CreatedAt'), status.get('UpdatedAt')
+    if created is not None and updated is not None:
+        queue_ms = max(0.0, (updated - created).total_seconds() * 1000 - run_ms)
+        recorder.add("redshift_queue", queue_ms)
+        if statement is not None:
+            recorder.add("setup_warm" if statement['reused'] else "setup_cold", statement['submit_ms'] + queue_ms)
+
+def explain_query(query, db):
+    """
+    Retrieve the EXPLAIN plan of a statement.
+    
+    :param query: The SQL statement
+    :param db: The name of the database
+    :return: The lines of the plan, or an empty list if it could not be explained
+    """
+    result = execute_query(f"EXPLAIN {query}", db, None, None, max_rows=None, max_bytes=None, use_cache=False)
+    if isinstance(result, str):
+        logger.warning("EXPLAIN failed: %s", result)
+        return []
+    return [next(iter(row.values()), '') for row in result]
+
+def execute_query_batch(queries, user_id=None, timeout=None, max_workers=BATCH_MAX_WORKERS, async_after=None):
+    """
+    Execute several queries concurrently, each with its own ACL check and error handling.
+    The Data API's batch_execute_statement is not used, as it runs its statements one after
+    another in a single transaction and only in one database.
+    
+    :param queries: A list of dicts with "query", "database", "schema" and optional "table" keys
+    :param user_id: The ID of the user executing the queries (optional)
+    :param timeout: Seconds to wait for each statement before cancelling it (optional)
+    :param max_workers: Maximum number of statements in flight at once
+    :param async_after: Seconds after which a still running statement is returned as a handle (optional)
+    :return: A QueryBatchResult with one outcome per query, in input order
+    """
+    def run(item):
+        try:
+            result = execute_query(item['query'], item['database'], item['schema'], item.get('table'), user_id, timeout=timeout, async_after=async_after)
+        except StatementTimeoutError as e:
+            return {"query": item['query'], "error": str(e), "details": e.to_dict()}
+        except Exception as e:
+            return {"query": item['query'], "error": f"Error in execute_query: {str(e)}"}
+        if isinstance(result, str):
+            return {"query": item['query'], "error": result}
+        if isinstance(result, dict):
+            return {"query": item['query'], "pending": result}
+        return {"query": item['query'], "result": result}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(queries)))) as executor:
+        return QueryBatchResult(executor.map(run, queries))
+
+def iter_result_data(query_results):
+    """
+    Lazily decode the rows of one page of Redshift Serverless query results.
+    Values are converted according to each column's ColumnMetadata type, see result_decoder.
+    
+    :param query_results: One get_statement_result response
+    :return: A generator of dictionaries, one per row
+    """
+    return iter_records(query_results)
 
 def extract_result_data(query_results):
     """
@@ -113,27 +497,4 @@ def extract_result_data(query_results):
     :param query_results: Raw query results from Redshift Serverless
     :return: Formatted list of dictionaries containing the query results
     """
-    result_data = []
-
-    # Extract column names
-    column_metadata = query_results['ColumnMetadata']
-    column_names = [col['name'] for col in column_metadata]
-
-    # Process each row of data
-    for row in query_results['Records']:
-        row_data = []
-        for item in row:
-            # Check for different value types
-            if 'stringValue' in item:
-                row_data.append(item['stringValue'])
-            elif 'longValue' in item:
-                row_data.append(item['longValue'])
-            elif 'doubleValue' in item:
-                row_data.append(item['doubleValue'])
-            elif 'booleanValue' in item:
-                row_data.append(item['booleanValue'])
-            else:
-                row_data.append(None)  # For null values or unhandled types
-        result_data.append(dict(zip(column_names, row_data)))
-
-    return result_data
\ No newline at end of file
+    return list(iter_records(query_results))
@@ -0,0 +1,130 @@
+import json
+import os
+
+from result_reader import QueryBatchResult
+
+# Bedrock action-group responses are limited to 25 KB, leave headroom for the envelope
+MAX_RESPONSE_BYTES = int(os.environ.get('MAX_RESPONSE_BYTES', '24000'))
+
+SIZE_ERROR = {"error": "Response size exceeds 25 KB limit."}
+
+
+def _truncated_envelope(encoded_rows, total_rows):
+    # Rows go last but one so the prefix can be written before the rows are known
+    total = 'null' if total_rows is None else str(total_rows)
+    prefix = '{"truncated": true, "total_rows": ' + total + ', "rows": ['
+    suffix = '], "returned_rows": ' + str(len(encoded_rows)) + '}'
+    return prefix + ", ".join(encoded_rows) + suffix
+
+
+def encode_rows(rows, max_bytes=MAX_RESPONSE_BYTES, total_rows=None, truncated=False, encoded_rows=None):
+    """
+    Encode result rows as JSON one row at a time, keeping the largest prefix that fits the budget.
+    When every row fits the result is a plain JSON array. Otherwise it is an envelope of the form
+    {"truncated": true, "total_rows": N, "rows": [...], "returned_rows": k}.
+
+    :param rows: The rows to encode
+    :param max_bytes: Maximum size of the encoded document
+    :param total_rows: Total number of rows in the full result, if known. Defaults to len(rows)
+    :param truncated: Whether rows is already a cut-down prefix of the full result
+    :param encoded_rows: Pre-computed JSON encoding of each row, reused instead of encoding again
+    :return: The JSON document as a string, never longer than max_bytes
+    """
+    if total_rows is None and not truncated:
+        total_rows = len(rows)
+    total_text = 'null' if total_rows is None else str(total_rows)
+    # Worst case envelope around the rows, returned_rows can never exceed the rows given
+    reserve = len('{"truncated": true, "total_rows": , "rows": [], "returned_rows": }') + len(total_text) + len(str(len(rows)))
+    budget = max_bytes - reserve
+
+    kept = []
+    size = 0
+    # Number of rows that fit once the envelope is added, set when the first row overflows it
+    envelope_count = None
+    fits_all = True
+    for index, row in enumerate(rows):
+        encoded = encoded_rows[index] if encoded_rows is not None else json.dumps(row)
+        row_size = len(encoded) + (2 if kept else 0)
+        if size + row_size + 2 > max_bytes:
+            fits_all = False
+            break
+        if envelope_count is None and size + row_size > budget:
+            envelope_count = len(kept)
+        kept.append(encoded)
+        size += row_size
+
+    if fits_all and not truncated:
+        return "[" + ", ".join(kept) + "]"
+    if envelope_count is None:
+        envelope_count = len(kept)
+    return _truncated_envelope(kept[:envelope_count], total_rows)
+
+
+def encode_batch_body(items, max_bytes=MAX_RESPONSE_BYTES):
+    """
+    Encode the outcomes of a query batch as one JSON array sharing a single size budget.
+    Queries with small results take only what they need; the remaining budget is split
+    evenly among the larger results, each truncated as by encode_rows.
+
+    :param items: A QueryBatchResult
+    :param max_bytes: Maximum size of the encoded document
+    :return: The JSON document as a string
+    """
+    heads = []
+    bodies = [None] * len(items)
+    row_encodings = [None] * len(items)
+    needs = [0] * len(items)
+    for index, item in enumerate(items):
+        if 'result' not in item:
+            heads.append(json.dumps(item))
+            bodies[index] = ''
+            continue
+        rows = item['result']
+        heads.append('{"query": ' + json.dumps(item['query']) + ', "result": ')
+        row_encodings[index] = getattr(rows, 'encoded_rows', None) or [json.dumps(row) for row in rows]
+        needs[index] = 2 + sum(len(encoded) for encoded in row_encodings[index]) + 2 * max(len(rows) - 1, 0)
+
+    # "[" + "]" + ", " between items + the closing "}" of every item with a result
+    fixed = 2 + 2 * max(len(items) - 1, 0) + sum(len(head) for head in heads) + sum(1 for body in bodies if body is None)
+    available = max_bytes - fixed
+    pending = sorted((index for index, body in enumerate(bodies) if body is None), key=lambda index: needs[index])
+    for position, index in enumerate(pending):
+        share = available // (len(pending) - position)
+        rows = items[index]['result']
+        bodies[index] = encode_rows(
+            rows,
+            max_bytes=share,
+            total_rows=getattr(rows, 'total_rows', None),
+            truncated=getattr(rows, 'truncated', False),
+            encoded_rows=row_encodings[index]
+        )
+        available -= len(bodies[index])
+
+    parts = [head + body + ('}' if body else '') for head, body in zip(heads, bodies)]
+    return "[" + ", ".join(parts) + "]"
+
+
+def encode_response_body(result, max_bytes=MAX_RESPONSE_BYTES):
+    """
+    Encode an action-group result exactly once, within the response size budget.
+    Lists are encoded row by row and truncated to fit; other values are all or nothing.
+
+    :param result: The result to encode
+    :param max_bytes: Maximum size of the encoded body
+    :return: The response body string
+    """
+    if isinstance(result, QueryBatchResult):
+        return encode_batch_body(result, max_bytes=max_bytes)
+    if isinstance(result, list):
+        return encode_rows(
+            result,
+            max_bytes=max_bytes,
+            total_rows=getattr(result, 'total_rows', None),
+            truncated=getattr(result, 'truncated', False),
+            encoded_rows=getattr(result, 'encoded_rows', None)
+        )
+
+    body = json.dumps(result)
+    if len(body) > max_bytes:
+        body = json.dumps(SIZE_ERROR)
+    return body
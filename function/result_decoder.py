@@ -0,0 +1,193 @@
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from itertools import repeat
+from operator import itemgetter
+
+# Redshift type names, as reported in ColumnMetadata.typeName, grouped by the field that carries them
+INTEGER_TYPES = ('int2', 'int4', 'int8', 'smallint', 'integer', 'bigint', 'oid')
+FLOAT_TYPES = ('float4', 'float8', 'float', 'real', 'double precision')
+BOOLEAN_TYPES = ('bool', 'boolean')
+NUMERIC_TYPES = ('numeric', 'decimal')
+DATE_TYPES = ('date',)
+TIMESTAMP_TYPES = ('timestamp', 'timestamptz', 'timestamp without time zone', 'timestamp with time zone')
+TIME_TYPES = ('time', 'timetz', 'time without time zone', 'time with time zone')
+
+
+def _any_value(field):
+    # Fallback for fields that do not carry the value their column type implies
+    if field.get('isNull'):
+        return None
+    for key in ('stringValue', 'longValue', 'doubleValue', 'booleanValue'):
+        if key in field:
+            return field[key]
+    return None
+
+
+def _parse_timestamp(value):
+    # Redshift returns "2024-01-31 12:34:56[.ffffff][+00]"; fromisoformat needs a full offset
+    if len(value) > 19 and value[-3] in '+-' and value[-3:].lstrip('+-').isdigit():
+        value = value + ':00'
+    return datetime.fromisoformat(value)
+
+
+def _lenient(parse):
+    # Keep values that a parser does not understand as the string Redshift sent
+    def convert(value):
+        try:
+            return parse(value)
+        except (ValueError, ArithmeticError):
+            return value
+    return convert
+
+
+def column_converter(column, typed=False):
+    """
+    Build the decoding plan of one column: which Data API field carries its values,
+    and the conversion applied to every non-null value.
+
+    :param column: One ColumnMetadata entry
+    :param typed: Decode numerics to Decimal and dates/times to datetime objects. Otherwise
+        values stay JSON serializable: numerics without a scale become int, and numerics
+        with a scale and dates/times stay the exact strings Redshift sent
+    :return: A tuple of (field key or None for unknown types, conversion function or None)
+    """
+    type_name = (column.get('typeName') or '').lower()
+    if type_name in INTEGER_TYPES:
+        return 'longValue', None
+    if type_name in FLOAT_TYPES:
+        return 'doubleValue', None
+    if type_name in BOOLEAN_TYPES:
+        return 'booleanValue', None
+    if type_name in NUMERIC_TYPES:
+        if typed:
+            return 'stringValue', _lenient(Decimal)
+        # A float would round DECIMAL(38, s) values, so only integral numerics are converted
+        return 'stringValue', None if column.get('scale') else _lenient(int)
+    if typed and type_name in DATE_TYPES:
+        return 'stringValue', _lenient(date.fromisoformat)
+    if typed and type_name in TIMESTAMP_TYPES:
+        return 'stringValue', _lenient(_parse_timestamp)
+    if typed and type_name in TIME_TYPES:
+        return 'stringValue', _lenient(dt_time.fromisoformat)
+    if type_name:
+        return 'stringValue', None
+    return None, None
+
+
+def decode_column(fields, key, convert=None):
+    """
+    Decode the fields of one column into a list of values.
+
+    :param fields: The Data API field dicts of the column, one per row
+    :param key: The field key carrying the column's values, None to detect it per field
+    :param convert: Optional conversion applied to every non-null value
+    :return: A list of values, None for nulls
+    """
+    if key is None:
+        return list(map(_any_value, fields))
+    values = list(map(dict.get, fields, repeat(key)))
+    has_nulls = None in values
+    if has_nulls:
+        # Nulls, or fields carrying their value under another key than the column type implies
+        for index, value in enumerate(values):
+            if value is None and not fields[index].get('isNull'):
+                values[index] = _any_value(fields[index])
+    if convert is not None:
+        if has_nulls:
+            values = [None if value is None else convert(value) for value in values]
+        else:
+            values = list(map(convert, values))
+    return values
+
+
+class ColumnarResult:
+    """Decoded query results held as one list of values per column."""
+
+    def __init__(self, names, type_names, columns):
+        self.names = names
+        self.type_names = type_names
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def to_dict_of_lists(self):
+        return dict(zip(self.names, self.columns))
+
+    def to_records(self):
+        names = self.names
+        return [dict(zip(names, row)) for row in zip(*self.columns)]
+
+    def to_pandas(self):
+        try:
+            import pandas as pd
+        except ImportError:
+            raise ImportError("pandas is required for ColumnarResult.to_pandas()")
+        return pd.DataFrame(self.to_dict_of_lists(), columns=self.names)
+
+    def to_arrow(self):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("pyarrow is required for ColumnarResult.to_arrow()")
+        return pa.table(self.to_dict_of_lists())
+
+
+def decode_columns(query_results, typed=False, start=0, stop=None):
+    """
+    Decode a page of Data API results column by column, using one converter per column.
+
+    :param query_results: One get_statement_result response
+    :param typed: See column_converter
+    :param start: Index of the first record to decode
+    :param stop: Index after the last record to decode, None for the end of the page
+    :return: A ColumnarResult
+    """
+    column_metadata = query_results['ColumnMetadata']
+    records = query_results['Records'][start:stop] if start or stop is not None else query_results['Records']
+    columns = []
+    for index, column in enumerate(column_metadata):
+        key, convert = column_converter(column, typed)
+        columns.append(decode_column(list(map(itemgetter(index), records)), key, convert))
+    return ColumnarResult(
+        [col['name'] for col in column_metadata],
+        [col.get('typeName') for col in column_metadata],
+        columns
+    )
+
+
+def iter_records(query_results, typed=False):
+    """
+    Lazily yield the rows of a page as row dicts, decoding each record only when it is
+    consumed, so a consumer that stops early skips the rest. The field key and converter
+    of every column are looked up once and rows are built directly, without the
+    per-column lists of decode_columns, which only pay off for columnar consumers.
+
+    :param query_results: One get_statement_result response
+    :param typed: See column_converter
+    :return: A generator of row dicts
+    """
+    column_metadata = query_results['ColumnMetadata']
+    names = [column['name'] for column in column_metadata]
+    plans = [column_converter(column, typed) for column in column_metadata]
+    # Fields of a known type carry their value under its key, or are nulls that dict.get
+    # turns into None; only columns of unknown types need their fields inspected
+    keys = [key or '' for key, _ in plans]
+    unknown = [index for index, (key, _) in enumerate(plans) if key is None]
+    converters = [(index, convert) for index, (_, convert) in enumerate(plans) if convert is not None]
+    get = dict.get
+
+    if not unknown and not converters:
+        for record in query_results['Records']:
+            yield dict(zip(names, map(get, record, keys)))
+        return
+
+    for record in query_results['Records']:
+        values = list(map(get, record, keys))
+        for index in unknown:
+            values[index] = _any_value(record[index])
+        for index, convert in converters:
+            value = values[index]
+            if value is not None:
+                values[index] = convert(value)
+        yield dict(zip(names, values))
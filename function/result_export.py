@@ -0,0 +1,78 @@
+import os
+import uuid
+
+from query_guard import strip_trailing
+
+# Where results too large for the agent are unloaded, e.g. s3://bucket/exports/ (empty disables exports)
+EXPORT_LOCATION = os.environ.get('EXPORT_LOCATION', '')
+# IAM role Redshift assumes to write the files: a role ARN, or "default" for the namespace's default role
+EXPORT_IAM_ROLE = os.environ.get('EXPORT_IAM_ROLE', 'default')
+# Export every /querydatabase result that does not fit the response, not only when the agent asks
+EXPORT_AUTO = os.environ.get('EXPORT_AUTO', 'true').lower() == 'true'
+# Rows of an exported result still sent to the agent, so it can describe the result
+EXPORT_PREVIEW_ROWS = int(os.environ.get('EXPORT_PREVIEW_ROWS', '5'))
+# Largest Parquet file written, keeping every file small enough to download or page through
+EXPORT_MAX_FILE_SIZE_MB = int(os.environ.get('EXPORT_MAX_FILE_SIZE_MB', '256'))
+
+
+def exports_enabled():
+    return bool(EXPORT_LOCATION)
+
+
+def new_export(location=EXPORT_LOCATION):
+    """
+    Choose where a new export is written.
+
+    :param location: The export root, an s3:// URI
+    :return: A tuple (export_id, path prefix of its files, URI of its manifest)
+    """
+    export_id = uuid.uuid4().hex
+    prefix = f"{location.rstrip('/')}/{export_id}/part_"
+    # UNLOAD names the manifest after the path prefix given in TO
+    return export_id, prefix, prefix + "manifest"
+
+
+def build_unload(query, prefix, iam_role=EXPORT_IAM_ROLE, max_file_size_mb=EXPORT_MAX_FILE_SIZE_MB):
+    """
+    Wrap a query in an UNLOAD writing its full result as Parquet, with a verbose manifest
+    listing every file and its row count.
+
+    :param query: The SELECT statement, as sent by the agent
+    :param prefix: The path prefix of the files, as returned by new_export
+    :param iam_role: A role ARN, or "default"
+    :param max_file_size_mb: Largest file written, in MB
+    :return: The UNLOAD statement
+    """
+    # UNLOAD takes the query as a quoted literal and refuses a LIMIT on its outer SELECT.
+    # A trailing line comment would swallow the closing parenthesis, so it is dropped.
+    inner = strip_trailing(query).replace("'", "''")
+    role = "default" if iam_role == "default" else "'" + iam_role.replace("'", "''") + "'"
+    return (
+        f"UNLOAD ('SELECT * FROM ({inner}) AS exported') "
+        f"TO '{prefix}' IAM_ROLE {role} "
+        f"FORMAT AS PARQUET MANIFEST VERBOSE MAXFILESIZE {max_file_size_mb} MB"
+    )
+
+
+def export_summary(export_id, manifest, preview, status, rows=None):
+    """
+    The answer sent to the agent for an exported result: a preview and where the files are,
+    never the full rows.
+
+    :param export_id: The export's handle
+    :param manifest: URI of the export's manifest
+    :param preview: The first rows of the result, as a list of dicts
+    :param status: "FINISHED", or the UNLOAD's status if it was still running
+    :param rows: Rows exported, if reported
+    :return: A dict
+    """
+    return {
+        "export": {"handle": export_id, "manifest": manifest, "format": "parquet", "status": status},
+        "rows": rows,
+        "columns": list(preview[0].keys()) if preview else [],
+        "preview": preview[:EXPORT_PREVIEW_ROWS],
+        "message": (
+            "The result is too large to send here and was exported in full. "
+            "Describe it from the preview and tell the user the complete result can be viewed and downloaded in the app."
+        )
+    }
@@ -0,0 +1,126 @@
+import itertools
+import json
+import os
+
+# Budgets applied to results returned to the agent. The action-group response is
+# limited to 25 KB, so there is no point fetching or decoding rows beyond it.
+MAX_RESULT_BYTES = int(os.environ.get('MAX_RESULT_BYTES', '24000'))
+MAX_RESULT_ROWS = int(os.environ.get('MAX_RESULT_ROWS', '1000'))
+
+# Length of the "[", "]" around the rows and the ", " between them, as written by json.dumps
+ARRAY_OVERHEAD = 2
+ROW_SEPARATOR = ', '
+
+
+class QueryResult(list):
+    """
+    The rows of a statement result, plus metadata about how they were read.
+    Behaves as a plain list, so it serializes and iterates like the rows alone.
+    """
+
+    def __init__(self, rows=(), total_rows=None, truncated=False, pages_read=0, encoded_rows=None):
+        super().__init__(rows)
+        # Unknown (None) only when the result was cut short before its end was seen
+        self.total_rows = len(self) if total_rows is None and not truncated else total_rows
+        self.truncated = truncated
+        self.pages_read = pages_read
+        # JSON encoding of each kept row, computed while enforcing the byte budget
+        self.encoded_rows = encoded_rows
+
+    def metadata(self):
+        return {
+            "total_rows": self.total_rows,
+            "returned_rows": len(self),
+            "truncated": self.truncated,
+            "pages_read": self.pages_read
+        }
+
+
+class QueryBatchResult(list):
+    """
+    Per-query outcomes of a batch, in input order. Each item is a dict with the "query"
+    and either its "result" (a list of rows), an "error" message, or the "pending" handle
+    of a statement still running.
+    """
+
+
+def iter_statement_pages(client, statement_id):
+    """
+    Lazily page through get_statement_result, following NextToken.
+
+    :param client: A redshift-data client
+    :param statement_id: The Id of a finished statement
+    :return: A generator of get_statement_result responses
+    """
+    column_metadata = None
+    kwargs = {'Id': statement_id}
+    while True:
+        page = client.get_statement_result(**kwargs)
+        # Later pages may omit the column metadata, carry it over from the first
+        if page.get('ColumnMetadata'):
+            column_metadata = page['ColumnMetadata']
+        elif column_metadata is not None:
+            page['ColumnMetadata'] = column_metadata
+        yield page
+        next_token = page.get('NextToken')
+        if not next_token:
+            return
+        kwargs['NextToken'] = next_token
+
+
+def read_statement_result(client, statement_id, decode_rows, max_rows=None, max_bytes=None, total_rows=None, offset=0):
+    """
+    Read a statement result page by page, stopping as soon as a row or byte budget is reached.
+    With an offset, the first rows are skipped, whole pages without being decoded.
+
+    :param client: A redshift-data client
+    :param statement_id: The Id of a finished statement
+    :param decode_rows: Callable turning one result page into an iterator of row dicts
+    :param max_rows: Maximum number of rows to keep, or None for no limit
+    :param max_bytes: Maximum size of the rows serialized as a JSON array, or None for no limit
+    :param total_rows: Row count reported by describe_statement, if known
+    :param offset: Number of leading rows to skip
+    :return: A QueryResult
+    """
+    rows = []
+    skipped = 0
+    encoded_rows = [] if max_bytes is not None else None
+    size = ARRAY_OVERHEAD
+    pages_read = 0
+    truncated = False
+
+    pages = iter_statement_pages(client, statement_id)
+    try:
+        for page in pages:
+            pages_read += 1
+            page_rows = decode_rows(page)
+            if skipped < offset:
+                records = len(page.get('Records', []))
+                if skipped + records <= offset:
+                    skipped += records
+                    continue
+                page_rows = itertools.islice(page_rows, offset - skipped, None)
+                skipped = offset
+            for row in page_rows:
+                if max_rows is not None and len(rows) >= max_rows:
+                    truncated = True
+                    break
+                if encoded_rows is not None:
+                    encoded = json.dumps(row)
+                    row_size = len(encoded) + (len(ROW_SEPARATOR) if rows else 0)
+                    if size + row_size > max_bytes:
+                        truncated = True
+                        break
+                    size += row_size
+                    encoded_rows.append(encoded)
+                rows.append(row)
+            if truncated:
+                break
+    finally:
+        pages.close()
+
+    if total_rows is None or total_rows < 0:
+        total_rows = None if truncated else skipped + len(rows)
+    elif total_rows > skipped + len(rows):
+        truncated = True
+    return QueryResult(rows, total_rows=total_rows, truncated=truncated, pages_read=pages_read, encoded_rows=encoded_rows)
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# How long a loaded catalog is served from memory before it is reloaded from Redshift.
+CATALOG_TTL_SECONDS = int(os.environ.get('SCHEMA_CACHE_TTL_SECONDS', '300'))
+
+EXCLUDED_SCHEMAS = ('pg_catalog', 'information_schema', 'pg_internal', 'pg_automv')
+
+# One statement returns every user table and column of the connected database.
+CATALOG_QUERY = (
+    "SELECT table_schema, table_name, column_name, data_type, remarks "
+    "FROM svv_columns "
+    "WHERE table_catalog = current_database() "
+    "AND table_schema NOT IN ({excluded}) "
+    "ORDER BY table_schema, table_name, ordinal_position;"
+).format(excluded=", ".join("'{}'".format(s) for s in EXCLUDED_SCHEMAS))
+
+_catalog_cache = {}
+_catalog_lock = threading.Lock()
+
+
+def build_catalog(rows):
+    """
+    Group flat catalog rows into an ordered table -> columns mapping.
+
+    :param rows: Rows of the catalog query, as returned by execute_query
+    :return: A dict of {"schema.table": [{"name", "type", "remarks"}, ...]}
+    """
+    catalog = {}
+    for row in rows:
+        table_key = f"{row['table_schema']}.{row['table_name']}"
+        catalog.setdefault(table_key, []).append({
+            "name": row['column_name'],
+            "type": row['data_type'],
+            "remarks": row.get('remarks') or None
+        })
+    return catalog
+
+
+def fingerprint_catalog(catalog):
+    """
+    Compute a stable fingerprint of a catalog, changing whenever a table or column does.
+
+    :param catalog: A catalog as returned by build_catalog
+    :return: A hex digest string
+    """
+    canonical = json.dumps(catalog, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def load_catalog(db, run_query, ttl=None, force_refresh=False):
+    """
+    Return the catalog of a database, loading it with a single bulk query when the
+    cached copy is missing, expired or explicitly refreshed.
+
+    :param db: The name of the database
+    :param run_query: Callable (query, db) -> list of row dicts, or an error string
+    :param ttl: Seconds a cached catalog stays valid. Defaults to SCHEMA_CACHE_TTL_SECONDS
+    :param force_refresh: Ignore any cached copy and reload from Redshift
+    :return: A dict with "catalog", "fingerprint" and "loaded_at" keys
+    """
+    ttl = CATALOG_TTL_SECONDS if ttl is None else ttl
+    now = time.time()
+
+    with _catalog_lock:
+        entry = _catalog_cache.get(db)
+        if entry and not force_refresh and now - entry['loaded_at'] < ttl:
+            return entry
+
+    rows = run_query(CATALOG_QUERY, db)
+    if isinstance(rows, str):
+        raise RuntimeError(rows)
+
+    catalog = build_catalog(rows)
+    entry = {
+        "catalog": catalog,
+        "fingerprint": fingerprint_catalog(catalog),
+        "loaded_at": now
+    }
+    with _catalog_lock:
+        previous = _catalog_cache.get(db)
+        if previous and previous['fingerprint'] != entry['fingerprint']:
+            logger.info("Schema catalog for %s changed: %s -> %s", db, previous['fingerprint'][:12], entry['fingerprint'][:12])
+        _catalog_cache[db] = entry
+    logger.info("Loaded schema catalog for %s: %d tables, %d columns", db, len(catalog), len(rows))
+    return entry
+
+
+def invalidate_catalog(db=None):
+    """
+    Drop cached catalogs so the next lookup reloads them from Redshift.
+
+    :param db: The database to invalidate. Invalidates every database when None
+    """
+    with _catalog_lock:
+        if db is None:
+            _catalog_cache.clear()
+        else:
+            _catalog_cache.pop(db, None)
+
+
+def get_cached_fingerprint(db):
+    """
+    Return the fingerprint of the cached catalog for a database without loading it.
+
+    :param db: The name of the database
+    :return: The fingerprint string, or None when nothing is cached
+    """
+    with _catalog_lock:
+        entry = _catalog_cache.get(db)
+        return entry['fingerprint'] if entry else None
@@ -0,0 +1,216 @@
+import json
+import math
+import os
+import re
+import threading
+
+# Size budget of a /getschema response, well under the 25 KB action-group limit
+SCHEMA_MAX_BYTES = int(os.environ.get('SCHEMA_MAX_BYTES', '12000'))
+# Most tables returned for a question, the best ranked first
+SCHEMA_MAX_TABLES = int(os.environ.get('SCHEMA_MAX_TABLES', '15'))
+
+# BM25 parameters, and the weight of a term in each field of a table
+BM25_K1 = 1.2
+BM25_B = 0.75
+FIELD_WEIGHTS = {'table': 3.0, 'schema': 0.5, 'column': 1.0, 'remarks': 0.5}
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from have how i in is it many me much my of on "
+    "or per show that the their there these this to was were what when where which who why "
+    "with list give find get all each tell any".split()
+)
+
+# Shorter spellings of Redshift data types, as reported by svv_columns
+TYPE_ABBREVIATIONS = {
+    'character varying': 'varchar',
+    'character': 'char',
+    'integer': 'int',
+    'smallint': 'int2',
+    'bigint': 'int8',
+    'double precision': 'float8',
+    'real': 'float4',
+    'boolean': 'bool',
+    'timestamp without time zone': 'timestamp',
+    'timestamp with time zone': 'timestamptz',
+    'time without time zone': 'time',
+    'time with time zone': 'timetz',
+}
+
+_CAMEL_CASE = re.compile(r'([a-z0-9])([A-Z])')
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    """
+    Split identifiers and prose into lowercase terms: snake_case and camelCase are broken
+    into words, stopwords dropped and plural "s" endings removed.
+
+    :param text: A table or column name, a comment or a question
+    :return: A list of terms
+    """
+    if not text:
+        return []
+    terms = []
+    for word in _WORD.findall(_CAMEL_CASE.sub(r'\1 \2', text).lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def compact_type(data_type):
+    return TYPE_ABBREVIATIONS.get(data_type, data_type)
+
+
+class SchemaIndex:
+    """
+    BM25 index of a catalog's tables, built once per catalog. A table is a document made
+    of its name, schema, column names and column comments, each field weighted by
+    FIELD_WEIGHTS; its columns matching the question are reported alongside its score.
+    """
+
+    def __init__(self, catalog):
+        self.tables = list(catalog)
+        self.catalog = catalog
+        self.postings = {}
+        self.lengths = []
+        self.column_terms = []
+        for doc, table_key in enumerate(self.tables):
+            schema, _, table = table_key.partition('.')
+            frequencies = {}
+            length = 0.0
+
+            def add(terms, weight):
+                nonlocal length
+                for term in terms:
+                    frequencies[term] = frequencies.get(term, 0.0) + weight
+                    length += weight
+
+            add(tokenize(table), FIELD_WEIGHTS['table'])
+            add(tokenize(schema), FIELD_WEIGHTS['schema'])
+            columns = []
+            for column in catalog[table_key]:
+                terms = tokenize(column['name'])
+                add(terms, FIELD_WEIGHTS['column'])
+                add(tokenize(column.get('remarks')), FIELD_WEIGHTS['remarks'])
+                columns.append(frozenset(terms + tokenize(column.get('remarks'))))
+            for term, frequency in frequencies.items():
+                self.postings.setdefault(term, []).append((doc, frequency))
+            self.lengths.append(length)
+            self.column_terms.append(columns)
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def search(self, question, limit=None):
+        """
+        Rank tables by their BM25 score for a question or keywords.
+
+        :param question: The user's question or keywords
+        :param limit: Most tables returned. Defaults to all matching tables
+        :return: A list of (table_key, score, matched column indexes), best first,
+                 holding only tables matching at least one term
+        """
+        terms = set(tokenize(question))
+        scores = {}
+        count = len(self.tables)
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, frequency in postings:
+                norm = 1 - BM25_B + BM25_B * self.lengths[doc] / self.average_length
+                scores[doc] = scores.get(doc, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [
+            (self.tables[doc], score, [index for index, column in enumerate(self.column_terms[doc]) if column & terms])
+            for doc, score in ranked
+        ]
+
+
+def _encode_columns(columns):
+    return [f"{column['name']} {compact_type(column['type'])}" for column in columns]
+
+
+def compact_schema(catalog, ranked=None, max_bytes=SCHEMA_MAX_BYTES):
+    """
+    Describe tables and their columns as compactly as the agent can read them, keeping as
+    many tables as fit the budget. A table too large for the remaining budget keeps its
+    matched columns first, then as many others as fit, in their original order.
+
+    :param catalog: A catalog as returned by schema_catalog.build_catalog
+    :param ranked: (table_key, score, matched column indexes) tuples from SchemaIndex.search,
+                   or None to include every table in catalog order
+    :param max_bytes: Maximum size of the JSON encoding of the result
+    :return: A dict {"tables": [{"table", "columns"}], "total_tables", "omitted_tables",
+             "omitted_columns"}, columns being one "name type, ..." string per table
+    """
+    if ranked is None:
+        ranked = [(table_key, None, []) for table_key in catalog]
+    total_columns = sum(len(columns) for columns in catalog.values())
+    # Worst case size of the counters around the tables
+    reserve = len('{"tables": [], "total_tables": , "omitted_tables": , "omitted_columns": }') + 3 * len(str(total_columns)) + 8
+    budget = max_bytes - reserve
+
+    tables = []
+    size = 0
+    returned_columns = 0
+    for table_key, _, matched in ranked:
+        columns = _encode_columns(catalog[table_key])
+        entry = {"table": table_key, "columns": ", ".join(columns)}
+        separator = 2 if tables else 0
+        entry_size = len(json.dumps(entry))
+        if size + separator + entry_size > budget:
+            # Keep the matched columns of a relevant table rather than dropping it
+            if matched:
+                matched_set = set(matched)
+                order = matched + [index for index in range(len(columns)) if index not in matched_set]
+                kept = []
+                used = size + separator + len(json.dumps({"table": table_key, "columns": ""}))
+                for index in order:
+                    extra = len(json.dumps(columns[index])) - 2 + (2 if kept else 0)
+                    if used + extra > budget:
+                        break
+                    kept.append(index)
+                    used += extra
+                if kept:
+                    tables.append({"table": table_key, "columns": ", ".join(columns[index] for index in sorted(kept))})
+                    returned_columns += len(kept)
+            break
+        tables.append(entry)
+        size += separator + entry_size
+        returned_columns += len(columns)
+
+    return {
+        "tables": tables,
+        "total_tables": len(catalog),
+        "omitted_tables": len(catalog) - len(tables),
+        "omitted_columns": total_columns - returned_columns
+    }
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_schema_index(db, entry):
+    """
+    Return the index of a loaded catalog, building it the first time the catalog is seen.
+    Only the index of the latest catalog of each database is kept.
+
+    :param db: The name of the database
+    :param entry: A catalog entry as returned by schema_catalog.load_catalog
+    :return: A SchemaIndex
+    """
+    with _indexes_lock:
+        cached = _indexes.get(db)
+        if cached and cached[0] == entry['fingerprint']:
+            return cached[1]
+    index = SchemaIndex(entry['catalog'])
+    with _indexes_lock:
+        _indexes[db] = (entry['fingerprint'], index)
+    return index
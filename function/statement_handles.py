@@ -0,0 +1,195 @@
+import logging
+import os
+import threading
+import time
+
+from statement_waiter import TERMINAL_STATES
+
+logger = logging.getLogger(__name__)
+
+# DynamoDB table keyed on "handle" shared by every execution environment
+STATEMENT_HANDLE_TABLE = os.environ.get('STATEMENT_HANDLE_TABLE')
+# Seconds /querydatabase waits for a statement before answering with a handle instead (0 disables).
+# /queryresult may run in another execution environment, so this is off without a shared table.
+STATEMENT_ASYNC_AFTER_SECONDS = float(os.environ.get('STATEMENT_ASYNC_AFTER_SECONDS', '20' if STATEMENT_HANDLE_TABLE else '0'))
+# Seconds a handle lives after it was last used; the statement of an expired handle is cancelled
+STATEMENT_HANDLE_TTL_SECONDS = int(os.environ.get('STATEMENT_HANDLE_TTL_SECONDS', '900'))
+# How often one execution environment looks for expired handles
+HANDLE_SWEEP_INTERVAL_SECONDS = 60
+
+
+class InMemoryHandleTable:
+    """
+    A local stand-in for a DynamoDB table of statement handles, answering get_item,
+    put_item, delete_item and scan like boto3's Table resource. Only for local runs:
+    on Lambda its handles are invisible to other execution environments and lost with
+    this one, so their statements would never be swept.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self._lock = threading.Lock()
+
+    def put_item(self, Item):
+        with self._lock:
+            self.items[Item['handle']] = dict(Item)
+
+    def get_item(self, Key):
+        with self._lock:
+            item = self.items.get(Key['handle'])
+        return {'Item': dict(item)} if item is not None else {}
+
+    def delete_item(self, Key):
+        with self._lock:
+            self.items.pop(Key['handle'], None)
+
+    def scan(self, **kwargs):
+        with self._lock:
+            return {'Items': [dict(item) for item in self.items.values()]}
+
+
+class HandleStore:
+    """
+    Statements still running when /querydatabase answered, keyed by handle (the statement
+    Id). An entry keeps what /queryresult needs to check access and read the result, and
+    expires ttl seconds after it was last used. With a DynamoDB table, any execution
+    environment can serve a handle; enabling the table's TTL on "expires_at" also drops
+    entries no sweep reached.
+    """
+
+    def __init__(self, table, ttl=STATEMENT_HANDLE_TTL_SECONDS, clock=time.time):
+        self.table = table
+        self.ttl = ttl
+        self.clock = clock
+        self._last_sweep = None
+        self._lock = threading.Lock()
+
+    def register(self, statement_id, db, schema, user_id=None, limit=None, cache_key=None):
+        """
+        Record a running statement under a new handle.
+
+        :param statement_id: The Id returned by execute_statement
+        :param db: The database the statement runs in
+        :param schema: The schema the user's access was checked for
+        :param user_id: The user who submitted it, the only one allowed to read it
+        :param limit: The LIMIT injected by the query guard, if any
+        :param cache_key: The query cache key to store the result under, if any
+        :return: The stored entry
+        """
+        now = int(self.clock())
+        entry = {
+            'handle': statement_id,
+            'statement_id': statement_id,
+            'db': db,
+            'schema': schema,
+            'user_id': user_id,
+            'limit': limit,
+            'cache_key': cache_key,
+            'created_at': now,
+            'expires_at': now + self.ttl
+        }
+        self.table.put_item(Item={key: value for key, value in entry.items() if value is not None})
+        return entry
+
+    def get(self, handle):
+        """
+        Look up a handle, extending its lifetime.
+
+        :param handle: A handle returned by /querydatabase
+        :return: The entry, or None if the handle is unknown or expired
+        """
+        item = self.table.get_item(Key={'handle': handle}).get('Item')
+        now = int(self.clock())
+        if item is None or int(item['expires_at']) <= now:
+            return None
+        item['expires_at'] = now + self.ttl
+        self.table.put_item(Item=item)
+        return item
+
+    def remove(self, handle):
+        self.table.delete_item(Key={'handle': handle})
+
+    def expired(self):
+        """
+        Return the entries whose lifetime has passed.
+
+        :return: A list of entries
+        """
+        now = int(self.clock())
+        items = []
+        kwargs = {}
+        while True:
+            page = self.table.scan(**kwargs)
+            items.extend(item for item in page.get('Items', []) if int(item['expires_at']) <= now)
+            if not page.get('LastEvaluatedKey'):
+                return items
+            kwargs['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+    def sweep_due(self, interval=HANDLE_SWEEP_INTERVAL_SECONDS):
+        """Return True at most once per interval, to rate limit sweeps."""
+        now = self.clock()
+        with self._lock:
+            if self._last_sweep is not None and now - self._last_sweep < interval:
+                return False
+            self._last_sweep = now
+            return True
+
+
+def sweep_expired(store, client):
+    """
+    Cancel the statements of abandoned handles and forget the handles.
+
+    :param store: A HandleStore
+    :param client: A redshift-data client
+    :return: The number of statements cancelled
+    """
+    cancelled = 0
+    for entry in store.expired():
+        statement_id = entry['statement_id']
+        try:
+            if client.describe_statement(Id=statement_id)['Status'] not in TERMINAL_STATES:
+                client.cancel_statement(Id=statement_id)
+                cancelled += 1
+                logger.info("Cancelled statement %s of an abandoned handle", statement_id)
+        except Exception as e:
+            logger.warning("Error cancelling abandoned statement %s: %s", statement_id, e)
+        store.remove(entry['handle'])
+    return cancelled
+
+
+def pending_response(entry, status, elapsed_seconds=None):
+    """
+    The answer for a statement that has not finished yet.
+
+    :param entry: The statement's handle entry
+    :param status: Its last reported status, e.g. "STARTED"
+    :param elapsed_seconds: Seconds since it was submitted, if known
+    :return: A dict telling the agent to call /queryresult with the handle
+    """
+    response = {
+        "handle": entry['handle'],
+        "status": status,
+        "message": "The query is still running. Call /queryresult with this handle to get its result."
+    }
+    if elapsed_seconds is not None:
+        response["elapsed_seconds"] = round(elapsed_seconds, 1)
+    return response
+
+
+def create_handle_store(table=None):
+    """
+    Create the handle store configured by the STATEMENT_* environment variables.
+
+    :param table: A table to use instead of the configured one
+    :return: A HandleStore, or None when STATEMENT_ASYNC_AFTER_SECONDS is 0 or no table is configured
+    """
+    if STATEMENT_ASYNC_AFTER_SECONDS <= 0:
+        return None
+    if table is None:
+        if not STATEMENT_HANDLE_TABLE:
+            # Detached statements must stay reachable and sweepable from every execution environment
+            logger.warning("STATEMENT_ASYNC_AFTER_SECONDS is set without STATEMENT_HANDLE_TABLE, statements are waited for instead")
+            return None
+        import boto3
+        table = boto3.resource('dynamodb').Table(STATEMENT_HANDLE_TABLE)
+    return HandleStore(table)
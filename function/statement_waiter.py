@@ -0,0 +1,114 @@
+import logging
+import os
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+# Default deadline for a single statement, kept below the Lambda timeout so the
+# handler can still cancel the statement and answer the agent.
+STATEMENT_TIMEOUT_SECONDS = float(os.environ.get('STATEMENT_TIMEOUT_SECONDS', '50'))
+
+TERMINAL_STATES = ('FINISHED', 'FAILED', 'ABORTED')
+
+# Initial poll delay per reported state. Queued statements are polled less eagerly
+# than running ones, since they cannot finish before they start.
+STATE_BASE_DELAYS = {
+    'SUBMITTED': 0.2,
+    'PICKED': 0.2,
+    'STARTED': 0.05,
+}
+DEFAULT_BASE_DELAY = 0.1
+MAX_DELAY = 2.0
+BACKOFF_MULTIPLIER = 1.6
+
+
+class StatementTimeoutError(Exception):
+    """Raised when a statement does not reach a terminal state before its deadline."""
+
+    def __init__(self, statement_id, timeout, polls, last_status, cancelled):
+        self.statement_id = statement_id
+        self.timeout = timeout
+        self.polls = polls
+        self.last_status = last_status
+        self.cancelled = cancelled
+        super().__init__(
+            f"Statement {statement_id} did not finish within {timeout:.1f}s "
+            f"(last status {last_status}, {polls} polls, "
+            f"{'cancelled' if cancelled else 'not cancelled'})"
+        )
+
+    def to_dict(self):
+        return {
+            "error": "StatementTimeout",
+            "statement_id": self.statement_id,
+            "timeout_seconds": self.timeout,
+            "polls": self.polls,
+            "last_status": self.last_status,
+            "cancelled": self.cancelled
+        }
+
+
+def next_delay(status, previous_delay, state_changed):
+    """
+    Compute the next poll delay with exponential backoff and full jitter.
+    The backoff restarts from the state's base delay whenever the state changes.
+
+    :param status: The statement status reported by the last describe_statement
+    :param previous_delay: The un-jittered delay used for the previous poll, or None
+    :param state_changed: Whether the status differs from the previous poll
+    :return: A tuple of (un-jittered delay, jittered sleep time)
+    """
+    base = STATE_BASE_DELAYS.get(status, DEFAULT_BASE_DELAY)
+    if previous_delay is None or state_changed:
+        delay = base
+    else:
+        delay = min(previous_delay * BACKOFF_MULTIPLIER, MAX_DELAY)
+    return delay, random.uniform(base / 2, delay)
+
+
+def wait_for_statement(client, statement_id, timeout=None, cancel_on_timeout=True, sleep=time.sleep, clock=time.monotonic):
+    """
+    Poll describe_statement until the statement reaches a terminal state or the deadline passes.
+
+    :param client: A redshift-data client
+    :param statement_id: The Id returned by execute_statement
+    :param timeout: Seconds to wait before giving up. Defaults to STATEMENT_TIMEOUT_SECONDS
+    :param cancel_on_timeout: Call cancel_statement when the deadline passes
+    :param sleep: Sleep function, replaceable for testing
+    :param clock: Monotonic clock function, replaceable for testing
+    :return: A tuple of (last describe_statement response, number of polls)
+    :raises StatementTimeoutError: If the statement is still running at the deadline
+    """
+    timeout = STATEMENT_TIMEOUT_SECONDS if timeout is None else timeout
+    started = clock()
+    deadline = started + timeout
+    polls = 0
+    delay = None
+    previous_status = None
+
+    while True:
+        status = client.describe_statement(Id=statement_id)
+        polls += 1
+        state = status['Status']
+        if state in TERMINAL_STATES:
+            logger.info("Statement %s %s after %d polls in %.3fs", statement_id, state, polls, clock() - started)
+            return status, polls
+
+        delay, pause = next_delay(state, delay, state != previous_status)
+        previous_status = state
+        remaining = deadline - clock()
+        if remaining <= 0:
+            break
+        sleep(min(pause, remaining))
+        if clock() >= deadline:
+            break
+
+    cancelled = False
+    if cancel_on_timeout:
+        try:
+            cancelled = bool(client.cancel_statement(Id=statement_id).get('Status', False))
+        except Exception as e:
+            logger.warning("Error cancelling statement %s: %s", statement_id, e)
+    logger.warning("Statement %s timed out after %d polls in %.3fs", statement_id, polls, clock() - started)
+    raise StatementTimeoutError(statement_id, timeout, polls, previous_status, cancelled)
@@ -0,0 +1,111 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'Text2SQL/ActionGroup')
+
+
+class SpanRecorder:
+    """
+    Timing spans of one invocation. Spans may be recorded from the worker threads of a
+    batch; one invocation runs at a time per execution environment, so reset() at the
+    start of each keeps them apart.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._spans = []
+        self._started = clock()
+
+    def reset(self):
+        with self._lock:
+            self._spans = []
+            self._started = self.clock()
+
+    def add(self, name, duration_ms, start_ms=None, **attributes):
+        """
+        Record a span measured elsewhere, e.g. from describe_statement timestamps.
+
+        :param name: The span name, also the metric name
+        :param duration_ms: The span's duration in milliseconds
+        :param start_ms: Offset from the start of the invocation, if known
+        """
+        span = {"name": name, "duration_ms": round(duration_ms, 3)}
+        if start_ms is not None:
+            span["start_ms"] = round(start_ms, 3)
+        span.update(attributes)
+        with self._lock:
+            self._spans.append(span)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Record the time spent in a with block."""
+        started = self.clock()
+        try:
+            yield
+        finally:
+            ended = self.clock()
+            self.add(name, (ended - started) * 1000, start_ms=(started - self._started) * 1000, **attributes)
+
+    def spans(self):
+        with self._lock:
+            return list(self._spans)
+
+    def emf(self, dimensions, namespace=METRICS_NAMESPACE):
+        """
+        Build a CloudWatch Embedded Metric Format record of the spans, summing spans of the
+        same name. Printed to stdout by Lambda, it is turned into metrics without API calls.
+
+        :param dimensions: A dict of dimension name -> value, e.g. {"ApiPath": "/getschema"}
+        :param namespace: The CloudWatch namespace
+        :return: The EMF record as a dict, with the individual spans under "spans"
+        """
+        spans = self.spans()
+        totals = {}
+        for span in spans:
+            totals[span["name"]] = totals.get(span["name"], 0.0) + span["duration_ms"]
+        record = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": namespace,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": [{"Name": name, "Unit": "Milliseconds"} for name in totals]
+                }]
+            },
+            "spans": spans
+        }
+        record.update(dimensions)
+        record.update({name: round(total, 3) for name, total in totals.items()})
+        return record
+
+    def emit(self, dimensions, namespace=METRICS_NAMESPACE):
+        # EMF records must be whole log lines, so they are printed rather than logged
+        if METRICS_ENABLED:
+            print(json.dumps(self.emf(dimensions, namespace), default=str))
+
+
+def timed_iter(iterable, elapsed):
+    """
+    Yield from an iterable, adding the seconds spent producing its items to elapsed[0],
+    e.g. the decoding done lazily by a row iterator.
+    """
+    iterator = iter(iterable)
+    clock = time.perf_counter
+    while True:
+        started = clock()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            elapsed[0] += clock() - started
+            return
+        elapsed[0] += clock() - started
+        yield item
+
+
+# Spans of the current invocation
+recorder = SpanRecorder()
@@ -1,13 +1,15 @@
 from boto3.session import Session
 from botocore.auth import SigV4Auth
 from botocore.awsrequest import AWSRequest
-from botocore.credentials import Credentials
 import json
 import os
-from requests import request
-import base64
-import io
-import sys
+import requests
+from requests.adapters import HTTPAdapter
+import codecs
+import threading
+from eventstream import iter_agent_events
+from trace_collector import TraceCollector
+from timing import TurnTiming
 
 agentId = os.environ.get("AGENT_ID")
 agentAliasId = os.environ.get("AGENT_ALIAS_ID")
@@ -15,8 +17,119 @@ theRegion = os.environ.get("AWS_REGION")
 
 # region = os.environ.get("AWS_REGION")
 
+# Base URL of the agent runtime, overridable to point the app at a local stand-in for load tests
+agentEndpoint = os.environ.get("BEDROCK_AGENT_ENDPOINT") or f'https://bedrock-agent-runtime.{theRegion}.amazonaws.com'
+
+# Connection settings of the shared Bedrock agent runtime client
+connectTimeout = float(os.environ.get("BEDROCK_CONNECT_TIMEOUT", "5"))
+readTimeout = float(os.environ.get("BEDROCK_READ_TIMEOUT", "120"))
+poolSize = int(os.environ.get("BEDROCK_POOL_SIZE", "20"))
+
+# The agent's action group Lambda, invoked directly for ACL and schema fingerprint lookups
+actionGroupFunction = os.environ.get("ACTION_GROUP_FUNCTION_NAME")
+
 llm_response = ""
 
+class SigV4Client:
+    """Sends SigV4-signed HTTP requests over a persistent keep-alive connection pool.
+
+    Credentials come from a boto3 session and are re-read before every request, so
+    refreshable credentials (instance profile, assumed roles) are renewed before they
+    expire instead of being frozen once. One client is safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        service='execute-api',
+        region=theRegion,
+        credentials=None,
+        session=None,
+        connect_timeout=connectTimeout,
+        read_timeout=readTimeout,
+        pool_size=poolSize
+    ):
+        """
+        Args:
+        service: The AWS service name used for signing. Defaults to 'execute-api'.
+        region: The AWS region id. Defaults to the env var 'AWS_REGION'.
+        credentials: Fixed AWS credentials to sign with instead of the session's. Defaults to None.
+        session: The boto3 session providing credentials. Defaults to a new Session().
+        connect_timeout: Seconds to wait for a connection. Defaults to BEDROCK_CONNECT_TIMEOUT.
+        read_timeout: Seconds to wait between bytes of the response. Defaults to BEDROCK_READ_TIMEOUT.
+        pool_size: Connections kept alive per host. Defaults to BEDROCK_POOL_SIZE.
+        """
+        self.service = service
+        self.region = region
+        self.timeout = (connect_timeout, read_timeout)
+        self._credentials = credentials if credentials is not None else (session or Session()).get_credentials()
+        self._signer = None
+        self._signer_credentials = None
+        self._lock = threading.Lock()
+
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', adapter)
+
+    def _get_signer(self):
+        if self._credentials is None:
+            raise RuntimeError("No AWS credentials found to sign the request")
+        # Refreshable credentials renew themselves here when they are about to expire
+        if hasattr(self._credentials, 'get_frozen_credentials'):
+            frozen = self._credentials.get_frozen_credentials()
+        else:
+            frozen = self._credentials
+        with self._lock:
+            if frozen != self._signer_credentials:
+                self._signer = SigV4Auth(frozen, self.service, self.region)
+                self._signer_credentials = frozen
+            return self._signer
+
+    def request(self, url, method='GET', body=None, params=None, headers=None, stream=False):
+        """Sends an HTTP request signed with SigV4
+        Args:
+        url: The request URL (e.g. 'https://www.example.com').
+        method: The request method (e.g. 'GET', 'POST', 'PUT', 'DELETE'). Defaults to 'GET'.
+        body: The request body (e.g. json.dumps({ 'foo': 'bar' })). Defaults to None.
+        params: The request query params (e.g. { 'foo': 'bar' }). Defaults to None.
+        headers: The request headers (e.g. { 'content-type': 'application/json' }). Defaults to None.
+        stream: Return before the response body is downloaded. Defaults to False.
+        Returns:
+         The HTTP response
+        """
+
+        # sign request
+        req = AWSRequest(
+            method=method,
+            url=url,
+            data=body,
+            params=params,
+            headers=headers
+        )
+        self._get_signer().add_auth(req)
+        req = req.prepare()
+
+        # send request over the pooled session
+        return self.http.request(
+            method=req.method,
+            url=req.url,
+            headers=req.headers,
+            data=req.body,
+            timeout=self.timeout,
+            stream=stream
+        )
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(service='bedrock', region=theRegion):
+    """Returns the process-wide client for a service and region, creating it on first use."""
+    with _clients_lock:
+        client = _clients.get((service, region))
+        if client is None:
+            client = _clients[(service, region)] = SigV4Client(service=service, region=region)
+        return client
+
 def sigv4_request(
     url,
     method='GET',
@@ -25,7 +138,7 @@ def sigv4_request(
     headers=None,
     service='execute-api',
     region=theRegion,
-    credentials=Session().get_credentials().get_frozen_credentials()
+    credentials=None
 ):
     """Sends an HTTP request signed with SigV4
     Args:
@@ -36,131 +149,221 @@ def sigv4_request(
     headers: The request headers (e.g. { 'content-type': 'application/json' }). Defaults to None.
     service: The AWS service name. Defaults to 'execute-api'.
     region: The AWS region id. Defaults to the env var 'AWS_REGION'.
-    credentials: The AWS credentials. Defaults to the current boto3 session's credentials.
+    credentials: Fixed AWS credentials. Defaults to the shared client's automatically refreshed credentials.
     Returns:
      The HTTP response
     """
+    if credentials is not None:
+        client = SigV4Client(service=service, region=region, credentials=credentials)
+    else:
+        client = get_client(service, region)
+    return client.request(url, method=method, body=body, params=params, headers=headers)
 
-    # sign request
-    req = AWSRequest(
-        method=method,
-        url=url,
-        data=body,
-        params=params,
-        headers=headers
-    )
-    SigV4Auth(credentials, service, region).add_auth(req)
-    req = req.prepare()
-
-    # send request
-    return request(
-        method=req.method,
-        url=req.url,
-        headers=req.headers,
-        data=req.body
-    )
+_lambda_client = None
+
+def invoke_action_group(api_path, properties):
+    """Calls the action group Lambda directly, the way the agent would, and returns the parsed response body."""
+    global _lambda_client
+    if not actionGroupFunction:
+        raise RuntimeError("ACTION_GROUP_FUNCTION_NAME is not set")
+    if _lambda_client is None:
+        _lambda_client = Session().client('lambda', region_name=theRegion)
+    event = {
+        "actionGroup": "RedshiftActions",
+        "apiPath": api_path,
+        "httpMethod": "POST",
+        "requestBody": {
+            "content": {
+                "application/json": {
+                    "properties": [{"name": name, "value": value} for name, value in properties.items()]
+                }
+            }
+        }
+    }
+    result = _lambda_client.invoke(FunctionName=actionGroupFunction, Payload=json.dumps(event))
+    payload = json.loads(result['Payload'].read())
+    if result.get('FunctionError'):
+        raise RuntimeError(payload.get('errorMessage', f"{api_path} failed"))
+    response = payload['response']
+    body = json.loads(response['responseBody']['application/json']['body'])
+    if response.get('httpStatusCode') != 200:
+        raise RuntimeError(body.get('error', f"{api_path} failed"))
+    return body
+
+def get_user_acl(user_id):
+    """Returns the [{"db", "schema"}] entries a user may query."""
+    return invoke_action_group('/getUserACL', {"user_id": user_id})
 
-def askQuestion(question, url, endSession=False):
+def get_schema_fingerprint(db):
+    """Returns the fingerprint of a database's schema catalog."""
+    return invoke_action_group('/getschemafingerprint', {"db": db})['fingerprint']
+
+def run_query(parameters, user_id):
+    """Runs a /querydatabase call (database, schema, query or queries) for a user without the agent, returning its rows."""
+    return invoke_action_group('/querydatabase', dict(parameters, user_id=user_id))
+
+def askQuestion(question, url, endSession=False, client=None, timing=None):
     myobj = {
         "inputText": question,   
         "enableTrace": True,
         "endSession": endSession
     }
     
-    # send request
-    response = sigv4_request(
+    # send request over the shared keep-alive connection pool
+    client = client or get_client('bedrock', theRegion)
+    response = client.request(
         url,
         method='POST',
-        service='bedrock',
         headers={
             'content-type': 'application/json', 
             'accept': 'application/json',
         },
-        region=theRegion,
-        body=json.dumps(myobj)
+        body=json.dumps(myobj),
+        stream=True
     )
+    if timing is not None:
+        timing.first_byte()
     
-    return decode_response(response)
-
-def decode_response(response):
-    # Create a StringIO object to capture print statements
-    captured_output = io.StringIO()
-    sys.stdout = captured_output
-
-    # Your existing logic
-    string = ""
-    for line in response.iter_content():
-        try:
-            string += line.decode(encoding='utf-8')
-        except:
-            continue
-
-    print("Decoded response", string)
-    split_response = string.split(":message-type")
-    print(f"Split Response: {split_response}")
-    print(f"length of split: {len(split_response)}")
-
-    for idx in range(len(split_response)):
-        if "bytes" in split_response[idx]:
-            #print(f"Bytes found index {idx}")
-            encoded_last_response = split_response[idx].split("\"")[3]
-            decoded = base64.b64decode(encoded_last_response)
-            final_response = decoded.decode('utf-8')
-            print(final_response)
+    try:
+        return decode_response(response, timing=timing)
+    finally:
+        # Hand the connection back to the pool
+        response.close()
+
+def decode_response(response, collector=None, timing=None):
+    """Decodes the event stream message by message as it arrives, recording traces
+    in a per-request TraceCollector and event arrivals in an optional TurnTiming.
+    Returns (collector, final answer)."""
+    collector = collector or TraceCollector()
+    chunks = []
+    for event in iter_agent_events(response):
+        if timing is not None:
+            timing.on_event(event.kind, event.data)
+        if event.kind == 'chunk':
+            chunks.append(event.data)
         else:
-            print(f"no bytes at index {idx}")
-            print(split_response[idx])
-            
-    last_response = split_response[-1]
-    print(f"Lst Response: {last_response}")
-    if "bytes" in last_response:
-        print("Bytes in last response")
-        encoded_last_response = last_response.split("\"")[3]
-        decoded = base64.b64decode(encoded_last_response)
-        final_response = decoded.decode('utf-8')
+            collector.add_event(event)
+
+    if chunks:
+        final_response = b"".join(chunks).decode('utf-8')
     else:
-        print("no bytes in last response")
-        part1 = string[string.find('finalResponse')+len('finalResponse":'):] 
-        part2 = part1[:part1.find('"}')+2]
-        final_response = json.loads(part2)['text']
+        # The answer is also reported in the orchestration trace when no chunk carries it
+        final_response = collector.final_response() or ""
+    return collector, final_response
 
-    final_response = final_response.replace("\"", "")
-    final_response = final_response.replace("{input:{value:", "")
-    final_response = final_response.replace(",source:null}}", "")
-    llm_response = final_response
 
-    # Restore original stdout
-    sys.stdout = sys.__stdout__
+def askQuestionStream(question, url, endSession=False, client=None, timing=None):
+    """Yields AgentEvents for a question as the agent produces them, with the final
+    answer streamed in chunks rather than sent once complete."""
+    myobj = {
+        "inputText": question,
+        "enableTrace": True,
+        "endSession": endSession,
+        "streamingConfigurations": {"streamFinalResponse": True}
+    }
 
-    # Get the string from captured output
-    captured_string = captured_output.getvalue()
+    client = client or get_client('bedrock', theRegion)
+    response = client.request(
+        url,
+        method='POST',
+        headers={
+            'content-type': 'application/json',
+            'accept': 'application/json',
+        },
+        body=json.dumps(myobj),
+        stream=True
+    )
+    if timing is not None:
+        timing.first_byte()
 
-    # Return both the captured output and the final response
-    return captured_string, llm_response
+    try:
+        for event in iter_agent_events(response):
+            if timing is not None:
+                timing.on_event(event.kind, event.data)
+            yield event
+    finally:
+        # Hand the connection back to the pool, also when the consumer stops early
+        response.close()
 
+def describe_rows(output_text):
+    # Summarize an action group response body, as produced by the Redshift Lambda
+    try:
+        body = json.loads(output_text)
+    except (TypeError, ValueError):
+        return "Received a response"
+    if isinstance(body, list):
+        return f"Query returned {len(body)} rows"
+    if isinstance(body, dict):
+        if 'error' in body:
+            return f"Query error: {body['error']}"
+        if 'export' in body:
+            rows = body.get('rows')
+            return f"Query result exported to Parquet ({rows} rows)" if rows is not None else "Query result exported to Parquet"
+        if 'handle' in body:
+            return f"Query still running ({body.get('status', 'running')})"
+        if body.get('truncated'):
+            return f"Query returned {body.get('returned_rows')} of {body.get('total_rows')} rows"
+    return "Received a response"
 
-def lambda_handler(event, context):
-    
+def describe_step(trace):
+    """Returns a short description of an intermediate agent step, or None if the trace is not one."""
+    orchestration = trace.get('trace', {}).get('orchestrationTrace', {})
+    if 'rationale' in orchestration:
+        return f"Thinking: {orchestration['rationale'].get('text', '')}"
+    if 'invocationInput' in orchestration:
+        action = orchestration['invocationInput'].get('actionGroupInvocationInput', {})
+        api_path = action.get('apiPath')
+        properties = action.get('requestBody', {}).get('content', {}).get('application/json', [])
+        values = {prop.get('name'): prop.get('value') for prop in properties}
+        if api_path == '/querydatabase':
+            return f"Running query: {values.get('query') or values.get('queries', '')}"
+        if api_path == '/getschema':
+            return f"Reading the schema of {values.get('db', 'the database')}"
+        if api_path == '/queryresult':
+            return "Waiting for the query to finish"
+        if api_path == '/getUserACL':
+            return f"Checking data access for {values.get('user_id', 'the user')}"
+        return f"Calling {api_path}" if api_path else None
+    if 'modelInvocationInput' in orchestration:
+        return "Generating SQL"
+    observation = orchestration.get('observation', {})
+    if 'actionGroupInvocationOutput' in observation:
+        return describe_rows(observation['actionGroupInvocationOutput'].get('text'))
+    if 'finalResponse' in observation:
+        return "Writing the answer"
+    return None
+
+def parse_request(event):
     sessionId = event["sessionId"]
     question = event["question"]
-    endSession = False
-    
-    print(f"Session: {sessionId} asked question: {question}")
+    endSession = str(event.get("endSession", False)).lower() == "true"
+    url = f'{agentEndpoint.rstrip("/")}/agents/{agentId}/agentAliases/{agentAliasId}/sessions/{sessionId}/text'
+    return sessionId, question, endSession, url
+
+def response_body(collector, final_response, timing):
+    # "response" is a readable summary of the steps, "trace" the structured steps,
+    # "trace_data" the agent's answer and "timing" the turn's latency breakdown
+    spans = timing.finish()
+    timing.emit()
+    return json.dumps({
+        "response": collector.render(),
+        "trace": collector.to_dict(),
+        "trace_data": final_response,
+        "timing": spans
+    })
+
+def lambda_handler(event, context):
     
-    try:
-        if (event["endSession"] == "true"):
-            endSession = True
-    except:
-        endSession = False
+    sessionId, question, endSession, url = parse_request(event)
     
-    url = f'https://bedrock-agent-runtime.{theRegion}.amazonaws.com/agents/{agentId}/agentAliases/{agentAliasId}/sessions/{sessionId}/text'
-
+    print(f"Session: {sessionId} asked question: {question}")
     
     try: 
-        response, trace_data = askQuestion(question, url, endSession)
+        timing = TurnTiming()
+        collector, trace_data = askQuestion(question, url, endSession, timing=timing)
         return {
             "status_code": 200,
-            "body": json.dumps({"response": response, "trace_data": trace_data})
+            "body": response_body(collector, trace_data, timing)
         }
     except Exception as e:
         return {
@@ -168,4 +371,41 @@ def lambda_handler(event, context):
             "body": json.dumps({"error": str(e)})
         }
 
+def lambda_handler_stream(event, context=None):
+    """Streaming variant of lambda_handler. Yields dicts as the agent works:
+    {"type": "step", "text": ...} for intermediate steps, {"type": "chunk", "text": ...}
+    for pieces of the answer, and finally {"type": "final", ...} holding the same
+    status_code and body lambda_handler returns."""
+    sessionId, question, endSession, url = parse_request(event)
+
+    print(f"Session: {sessionId} asked question (streaming): {question}")
 
+    collector = TraceCollector()
+    timing = TurnTiming()
+    answer = []
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    try:
+        for agent_event in askQuestionStream(question, url, endSession, timing=timing):
+            if agent_event.kind == 'chunk':
+                text = decoder.decode(agent_event.data)
+                answer.append(text)
+                if text:
+                    yield {"type": "chunk", "text": text}
+            else:
+                collector.add_event(agent_event)
+                step = describe_step(agent_event.data) if agent_event.kind == 'trace' else None
+                if step:
+                    yield {"type": "step", "text": step}
+        answer.append(decoder.decode(b'', final=True))
+        final_response = "".join(answer) or collector.final_response() or ""
+        yield {
+            "type": "final",
+            "status_code": 200,
+            "body": response_body(collector, final_response, timing)
+        }
+    except Exception as e:
+        yield {
+            "type": "final",
+            "status_code": 500,
+            "body": json.dumps({"error": str(e)})
+        }
@@ -1,10 +1,15 @@
 import InvokeAgent as agenthelper
+from history_store import HistoryStore
+from question_cache import QuestionCache
+from sql_cache import SqlCache, SQL_CACHE_ENABLED, cache_key, validated_query
+from export_viewer import ExportedResult, EXPORT_PAGE_SIZE, export_ready, find_exports
 import streamlit as st
 import json
 import pandas as pd
+import altair as alt
+import time
 import uuid
 from PIL import Image, ImageOps, ImageDraw
-import re
 from collections import Counter
 import os
 
@@ -62,16 +67,10 @@ if not st.session_state['authenticated']:
             st.error("Invalid User ID or password")
     st.stop()
 
-# Function to extract sql query from response
-def extract_queries(log_content):
-    # Regular expression pattern to match <query>...</query>
-    pattern = re.compile(r'<query>(.*?)</query>', re.DOTALL)
-    
-    # Find all matches
-    matches = pattern.findall(log_content)
-    
+# Function to extract the SQL queries the agent ran from the structured trace
+def extract_queries(trace):
     # Create list of dictionaries
-    queries_list = [{"query": match.strip()} for match in matches]
+    queries_list = [{"query": query} for query in (trace or {}).get('sql', [])]
     
     return queries_list
 
@@ -124,54 +123,172 @@ def format_response(response_body):
 
 
 
-@st.cache_data
-def generate_schema_questions(show_output=False):
+def generate_schema_questions(userid):
+    # Runs in a background thread, so it uses its own agent session and no Streamlit calls
     prompt = f"""
-    User ID: {st.session_state['userid']}
+    User ID: {userid}
     What are some of the questions that I can ask. Only show the questions in text format in natural language. Don't show the SQL query.
 
     Please generate a list of 10-15 natural language questions that can be asked based on the schema. The questions should cover different aspects of the data, such as filtering, aggregation, joining tables, and so on. Make sure the questions are clear, concise, and relevant to the given schema.
     """
 
     event = {
-        "sessionId": st.session_state['session_id'],
+        "sessionId": str(uuid.uuid4()),
         "question": prompt,
-        "systemPrompt": f"User ID: {st.session_state['userid']}"  # Include username in system prompt
+        "systemPrompt": f"User ID: {userid}"  # Include username in system prompt
     }
     response = agenthelper.lambda_handler(event, None)
 
+    response_data = json.loads(response['body'])
+    if response['status_code'] != 200:
+        raise RuntimeError(response_data.get('error', 'Invalid response received'))
+    return response_data['trace_data']
+
+
+def render_waterfall(spans):
+    # One bar per span, placed at its offset from the start of the turn
+    if not spans:
+        st.sidebar.markdown("*No timing recorded for this turn.*")
+        return
+    data = pd.DataFrame(spans)
+    data['end_ms'] = data['start_ms'] + data['duration_ms']
+    data['order'] = range(len(data))
+    chart = alt.Chart(data).mark_bar().encode(
+        x=alt.X('start_ms:Q', title='ms since the question was sent'),
+        x2='end_ms:Q',
+        y=alt.Y('name:N', sort=alt.SortField('order'), title=None),
+        tooltip=['name', 'start_ms', 'duration_ms']
+    )
+    st.sidebar.altair_chart(chart, use_container_width=True)
+
+
+@st.cache_resource
+def get_question_cache():
+    return QuestionCache()
+
+
+def get_schema_questions(userid):
+    # Keyed on the user's accessible schemas and their fingerprints when the action group
+    # Lambda is configured, otherwise on the user
+    lookups = {}
+    if agenthelper.actionGroupFunction:
+        lookups = {"get_user_acl": agenthelper.get_user_acl, "get_fingerprint": agenthelper.get_schema_fingerprint}
+    return get_question_cache().get_questions(userid, lambda: generate_schema_questions(userid), **lookups)
+
+
+@st.cache_resource
+def get_sql_cache():
+    return SqlCache()
+
+
+def sql_cache_key(userid, question):
+    # Saved SQL can only be replayed when the app can call the action group Lambda itself
+    if not (SQL_CACHE_ENABLED and agenthelper.actionGroupFunction):
+        return None
+    acl, fingerprints = get_question_cache().access_scope(userid, agenthelper.get_user_acl, agenthelper.get_schema_fingerprint)
+    # Until the schema fingerprints are known, the question goes to the agent
+    if fingerprints is None:
+        return None
+    return cache_key(question, acl, fingerprints)
+
+
+def answer_from_sql_cache(sql_key, userid):
+    # Replays the saved query of a repeat question; returns (parameters, body) or None
+    cached = get_sql_cache().get(sql_key) if sql_key else None
+    if cached is None:
+        return None
     try:
-        if response and 'body' in response and response['body']:
-            response_data = json.loads(response['body'])
+        return cached['parameters'], agenthelper.run_query(cached['parameters'], userid)
+    except Exception as e:
+        print(f"Replaying the saved query failed, asking the agent instead: {e}")
+        get_sql_cache().invalidate(sql_key)
+        return None
+
+
+def render_cached_answer(parameters, body):
+    # Shows the saved query and its fresh rows, and returns the text kept in the history
+    if parameters.get('query'):
+        queries, results = [parameters['query']], [body]
+    else:
+        # A batch: the agent passes queries as JSON text, answered by one item per query
+        queries = [item['query'] if isinstance(item, dict) else item for item in json.loads(parameters['queries'])]
+        results = [item.get('result', item) for item in body]
+    text = "Answered from the saved query for this question, without calling the agent:\n\n" + "\n\n".join(f"```sql\n{query}\n```" for query in queries)
+    st.markdown(text)
+    for result in results:
+        rows = result.get('rows', []) if isinstance(result, dict) else result
+        if isinstance(rows, list):
+            st.dataframe(pd.DataFrame(rows))
         else:
-            if show_output:
-                st.write("Invalid or empty response received")
-    except json.JSONDecodeError as e:
-        if show_output:
-            st.write(f"JSON decoding error: {e}")
-        response_data = None
+            st.write(result)
+    return text, queries
 
-    try:
-        the_response = response_data['trace_data']
-    except:
-        the_response = "Apologies, but an error occurred. Please rerun the application"
 
-    return the_response
+def cached_turn_context(question, parameters, queries):
+    # Tells the agent about a turn answered from saved SQL, which its session never saw
+    scope = ".".join(parameters[name] for name in ('database', 'schema') if parameters.get(name))
+    sql = "\n".join(queries)
+    return (f"Earlier in this conversation the user asked: {question}\n"
+            f"It was answered by running this SQL on {scope}:\n{sql}\n"
+            "Use it as context for the next question.")
+
+
+@st.cache_resource(max_entries=8)
+def load_export(manifest):
+    # Keeps the opened Parquet files of recent exports across reruns, so paging reads only new row groups
+    return ExportedResult(manifest)
+
+
+def render_export(manifest):
+    # Shows one page of an exported result, with links to download its files
+    try:
+        if not export_ready(manifest):
+            st.info("The full result is still being exported. It will appear here once the export finishes.")
+            st.button("Check again", key=f"export_refresh_{manifest}")
+            return
+        exported = load_export(manifest)
+    except Exception as e:
+        st.warning(f"The exported result could not be opened: {e}")
+        return
+    pages = max(1, -(-exported.num_rows // EXPORT_PAGE_SIZE))
+    st.markdown(f"{exported.num_rows:,} rows in {len(exported.files)} Parquet files ({exported.num_bytes / 1048576:.1f} MB)")
+    page = st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, value=1, key=f"export_page_{manifest}")
+    st.dataframe(exported.page(page - 1))
+    for number, file in enumerate(exported.files, start=1):
+        label = f"Download part {number} of {len(exported.files)}"
+        url = exported.download_url(file)
+        if url:
+            st.link_button(label, url)
+        else:
+            st.download_button(label, exported.read_file(file), file_name=os.path.basename(file['path']), key=f"export_file_{manifest}_{number}")
 
 
 
 # Session State Management
 if 'history' not in st.session_state:
-    st.session_state['history'] = []
     st.session_state['schema_questions'] = None
     st.session_state['session_id'] = str(uuid.uuid4())
+    st.session_state['history'] = HistoryStore(st.session_state['session_id'])
+
+# Questions asked in the current agent session; only the first can use saved SQL
+if 'session_turns' not in st.session_state:
+    st.session_state['session_turns'] = 0
+    st.session_state['agent_context'] = []
+
+# Turns answered from saved SQL that the agent has not been told about yet
+if 'agent_context' not in st.session_state:
+    st.session_state['agent_context'] = []
 
 if 'queries' not in st.session_state:
     st.session_state['queries'] = []
 
-# Generate and display schema-based questions (run only once)
+# Manifests of the results exported to Parquet in this session, most recent last
+if 'exports' not in st.session_state:
+    st.session_state['exports'] = []
+
+# Look up schema-based questions until they are available; they are generated in the background
 if st.session_state['schema_questions'] is None:
-    st.session_state['schema_questions'] = generate_schema_questions(show_output=False)
+    st.session_state['schema_questions'] = get_schema_questions(st.session_state['userid'])
 
 
 # Title
@@ -181,7 +298,10 @@ st.write("### Welcome to the Data Warehouse (DWH) Chat Agent!")
 st.write("This app allows you to enter natural language queries and get SQL queries results from Amazon Redshift")
 
 st.write("### Possible Questions Based on the Schema")
-st.write(st.session_state['schema_questions'])
+if st.session_state['schema_questions'] is None:
+    st.write("*Suggested questions are being prepared and will appear shortly.*")
+else:
+    st.write(st.session_state['schema_questions'])
 
 # Sidebar for user input
 st.sidebar.title("Trace Data")
@@ -194,29 +314,28 @@ def extract_sql_query(trace_data):
     except IndexError:
         return "No SQL query found in the trace data."
 
-# Session State Management
-if 'history' not in st.session_state:
-    st.session_state['history'] = []
-
 # Clear history button
 clear_history_button = st.button("Clear History")
 if clear_history_button:
-    st.session_state['history'] = []
+    st.session_state['history'].clear()
+    st.session_state['exports'] = []
 
 # Display conversation history
 st.write("### Conversation History")
 
 chat_container = st.container()  # Create a container for conversation history
 
-# Display the entire conversation history
+# Display the recent conversation history; older messages are loaded from disk on request
+history = st.session_state['history']
 with chat_container:
-    for message in st.session_state['history']:
-        if message['role'] == 'user':
-            with chat_container.chat_message(message['role']):
-                st.markdown(message['text'])
-        else:
-            with chat_container.chat_message(message['role']):
-                st.markdown(message['text'])
+    if history.remaining():
+        if st.button(f"Load earlier messages ({history.remaining()} more)"):
+            history.load_earlier()
+    if history.earlier() and st.button("Hide earlier messages"):
+        history.collapse()
+    for message in history.earlier() + history.recent():
+        with chat_container.chat_message(message['role']):
+            st.markdown(message['text'])
 
 # Display a text box for input
 prompt = st.chat_input("Enter your natural language query here:")
@@ -225,19 +344,70 @@ prompt = st.chat_input("Enter your natural language query here:")
 end_session_button = st.button("End Session")
 
 # Handling user input and responses
+sql_key = None
+cached_answer = None
 if prompt:
     # Update the conversation history with the user's question
-    st.session_state['history'].append({"role": "user", "text": prompt})
+    st.session_state['history'].append("user", prompt)
 
     with chat_container.chat_message("user"):
         st.markdown(prompt)
 
-    with st.spinner("Processing your query..."):
-        event = {
-            "sessionId": st.session_state['session_id'],
-            "question": f"User ID: {st.session_state['userid']}\n{prompt}"
-        }
-        response = agenthelper.lambda_handler(event, None)
+    # A repeat question is answered by running its saved SQL, skipping the agent. Only the
+    # first question of a session, as the SQL of a follow-up depends on the earlier turns.
+    turn_started = time.perf_counter()
+    if st.session_state['session_turns'] == 0:
+        try:
+            sql_key = sql_cache_key(st.session_state['userid'], prompt)
+        except Exception as e:
+            print(f"SQL cache unavailable: {e}")
+        cached_answer = answer_from_sql_cache(sql_key, st.session_state['userid'])
+    st.session_state['session_turns'] += 1
+
+if prompt and cached_answer is not None:
+    with chat_container.chat_message("assistant"):
+        the_response, cached_queries = render_cached_answer(*cached_answer)
+    turn_ms = (time.perf_counter() - turn_started) * 1000
+    st.session_state['queries'] = extract_queries({'sql': cached_queries})
+    st.session_state['agent_context'].append(cached_turn_context(prompt, cached_answer[0], cached_queries))
+    st.session_state['history'].append("assistant", the_response)
+    st.session_state['trace_data'] = the_response
+    st.session_state['exports'] += find_exports([json.dumps(cached_answer[1])])
+
+    st.sidebar.markdown("### Latency Breakdown")
+    render_waterfall([{"name": "App turn (saved SQL)", "start_ms": 0, "duration_ms": round(turn_ms, 1)}])
+    stats = get_sql_cache().stats()
+    st.sidebar.markdown(f"Saved SQL cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%}), {stats['entries']} questions")
+
+elif prompt:
+    # Follow-ups of a turn answered from saved SQL need that turn, which the agent never saw
+    context = "".join(f"{turn}\n\n" for turn in st.session_state['agent_context'])
+    st.session_state['agent_context'] = []
+    event = {
+        "sessionId": st.session_state['session_id'],
+        "question": f"User ID: {st.session_state['userid']}\n{context}{prompt}"
+    }
+
+    # Stream the agent's steps and answer into the chat as they arrive
+    response = None
+    with chat_container.chat_message("assistant"):
+        status = st.status("Processing your query...", expanded=False)
+        answer_placeholder = st.empty()
+        streamed_text = ""
+        for update in agenthelper.lambda_handler_stream(event, None):
+            if update['type'] == 'step':
+                status.update(label=update['text'][:200])
+                status.write(update['text'])
+            elif update['type'] == 'chunk':
+                streamed_text += update['text']
+                answer_placeholder.markdown(streamed_text + "▌")
+            else:
+                response = update
+        if response and response['status_code'] == 200:
+            status.update(label="Done", state="complete")
+        else:
+            status.update(label="Failed", state="error")
+    turn_ms = (time.perf_counter() - turn_started) * 1000
 
     try:
         if response and 'body' in response and response['body']:
@@ -258,15 +428,23 @@ if prompt:
     except Exception as e:
         all_data = "..."
         the_response = f"Apologies, but an error occurred: {str(e)}. Please rerun the application."
-    # Truncate response_data if it's longer than 1000 characters
-    truncated_response_data = str(response_data)
-    st.session_state['queries'] = extract_queries(truncated_response_data)
-
-    if len(truncated_response_data) > 10000:
-        truncated_response_data = "..." + truncated_response_data[-10000:]
-
-    # Display truncated response data in the sidebar
-    st.sidebar.text_area("Truncated Response Data", value=truncated_response_data, height=300)
+    st.session_state['queries'] = extract_queries(response_data.get('trace') if isinstance(response_data, dict) else None)
+
+    # Results too large for the agent were exported; the agent only saw a preview of them
+    if isinstance(response_data, dict):
+        observations = response_data.get('trace', {}).get('observations', [])
+        st.session_state['exports'] += find_exports(observation.get('text') for observation in observations)
+
+    # Save the query the agent validated, so the same question is answered without it next time
+    if sql_key and isinstance(response_data, dict) and response and response['status_code'] == 200:
+        parameters = validated_query(response_data.get('trace'))
+        if parameters:
+            get_sql_cache().store(sql_key, prompt, parameters)
+
+    # Display where the time of this turn went in the sidebar
+    spans = response_data.get('timing', []) if isinstance(response_data, dict) else []
+    st.sidebar.markdown("### Latency Breakdown")
+    render_waterfall([{"name": "App turn", "start_ms": 0, "duration_ms": round(turn_ms, 1)}] + spans)
     
     st.sidebar.divider()
     # recent_queries = st.session_state['queries']
@@ -294,13 +472,20 @@ if prompt:
 
 
     # Add the bot's response to the conversation history
-    st.session_state['history'].append({"role": "assistant", "text": the_response})
+    st.session_state['history'].append("assistant", the_response)
 
-    with chat_container.chat_message("assistant"):
-        st.markdown(the_response)
+    # Replace the streamed text with the final answer
+    answer_placeholder.markdown(the_response)
 
     st.session_state['trace_data'] = the_response
 
+# Display the full results exported in this session, newest first
+if st.session_state['exports']:
+    st.write("### Exported Results")
+    for manifest in reversed(st.session_state['exports'][-3:]):
+        with st.expander(manifest, expanded=manifest == st.session_state['exports'][-1]):
+            render_export(manifest)
+
 if end_session_button:
     event = {
         "sessionId": st.session_state['session_id'],
@@ -308,5 +493,8 @@ if end_session_button:
         "endSession": True
     }
     agenthelper.lambda_handler(event, None)
+    st.session_state['session_turns'] = 0
+    st.session_state['agent_context'] = []
     st.session_state['history'].clear()
+    st.session_state['exports'] = []
     chat_container.empty()  # Clear the conversation history display
\ No newline at end of file
@@ -0,0 +1,215 @@
+"""Incremental decoder for the application/vnd.amazon.eventstream framing used by
+bedrock-agent-runtime InvokeAgent responses.
+
+Each message is framed as:
+
+    total length (4) | headers length (4) | prelude CRC32 (4) | headers | payload | message CRC32 (4)
+
+with all integers big-endian. Messages are decoded as bytes arrive, so events can be
+handled before the response has finished downloading.
+"""
+import base64
+import json
+import struct
+import uuid
+import zlib
+from collections import namedtuple
+
+PRELUDE_LENGTH = 12
+CRC_LENGTH = 4
+MINIMUM_MESSAGE_LENGTH = PRELUDE_LENGTH + CRC_LENGTH
+MAXIMUM_MESSAGE_LENGTH = 16 * 1024 * 1024
+MAXIMUM_HEADERS_LENGTH = 128 * 1024
+
+# Bytes read from the HTTP response at a time
+DEFAULT_READ_SIZE = 64 * 1024
+
+EventStreamMessage = namedtuple('EventStreamMessage', ['headers', 'payload'])
+
+# A decoded agent event. kind is 'chunk' (data: answer bytes), 'trace' or 'returnControl'
+# (data: the parsed JSON payload), or the raw :event-type of any other event.
+AgentEvent = namedtuple('AgentEvent', ['kind', 'data'])
+
+
+class EventStreamError(Exception):
+    """Raised when the stream is malformed or fails a CRC check."""
+
+
+class AgentStreamError(Exception):
+    """Raised when the agent sends an exception event instead of a response."""
+
+    def __init__(self, exception_type, message):
+        self.exception_type = exception_type
+        super().__init__(f"{exception_type}: {message}")
+
+
+def _decode_headers(data):
+    headers = {}
+    offset = 0
+    end = len(data)
+    while offset < end:
+        name_length = data[offset]
+        offset += 1
+        name = data[offset:offset + name_length].decode('utf-8')
+        offset += name_length
+        value_type = data[offset]
+        offset += 1
+        if value_type == 0:
+            value = True
+        elif value_type == 1:
+            value = False
+        elif value_type == 2:
+            value = struct.unpack_from('>b', data, offset)[0]
+            offset += 1
+        elif value_type == 3:
+            value = struct.unpack_from('>h', data, offset)[0]
+            offset += 2
+        elif value_type == 4:
+            value = struct.unpack_from('>i', data, offset)[0]
+            offset += 4
+        elif value_type in (5, 8):
+            # 8 is a timestamp in milliseconds since the epoch
+            value = struct.unpack_from('>q', data, offset)[0]
+            offset += 8
+        elif value_type in (6, 7):
+            length = struct.unpack_from('>H', data, offset)[0]
+            offset += 2
+            value = data[offset:offset + length]
+            offset += length
+            if value_type == 7:
+                value = value.decode('utf-8')
+        elif value_type == 9:
+            value = uuid.UUID(bytes=data[offset:offset + 16])
+            offset += 16
+        else:
+            raise EventStreamError(f"Unknown header value type {value_type}")
+        headers[name] = value
+    return headers
+
+
+class EventStreamDecoder:
+    """Buffers raw bytes and yields complete, CRC-verified messages."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """Adds bytes to the buffer and yields every message completed by them."""
+        self._buffer += data
+        buffer = self._buffer
+        offset = 0
+        available = len(buffer)
+        try:
+            while available - offset >= PRELUDE_LENGTH:
+                total_length, headers_length, prelude_crc = struct.unpack_from('>III', buffer, offset)
+                if zlib.crc32(bytes(buffer[offset:offset + 8])) != prelude_crc:
+                    raise EventStreamError("Prelude CRC mismatch")
+                if total_length < MINIMUM_MESSAGE_LENGTH or total_length > MAXIMUM_MESSAGE_LENGTH:
+                    raise EventStreamError(f"Invalid message length {total_length}")
+                if headers_length > MAXIMUM_HEADERS_LENGTH or headers_length > total_length - MINIMUM_MESSAGE_LENGTH:
+                    raise EventStreamError(f"Invalid headers length {headers_length}")
+                if available - offset < total_length:
+                    break
+
+                end = offset + total_length
+                message_crc = struct.unpack_from('>I', buffer, end - CRC_LENGTH)[0]
+                headers_start = offset + PRELUDE_LENGTH
+                payload_start = headers_start + headers_length
+                # The view must be released before the buffer can be resized
+                with memoryview(buffer) as view:
+                    if zlib.crc32(view[offset:end - CRC_LENGTH]) != message_crc:
+                        raise EventStreamError("Message CRC mismatch")
+                    headers = _decode_headers(bytes(view[headers_start:payload_start]))
+                    payload = bytes(view[payload_start:end - CRC_LENGTH])
+                offset = end
+                yield EventStreamMessage(headers, payload)
+        finally:
+            # Drop consumed bytes once, rather than after every message
+            if offset:
+                del buffer[:offset]
+
+    def pending(self):
+        """Returns the number of buffered bytes not yet forming a complete message."""
+        return len(self._buffer)
+
+
+def _encode_header(name, value):
+    name_bytes = name.encode('utf-8')
+    encoded = struct.pack('>B', len(name_bytes)) + name_bytes
+    if isinstance(value, bool):
+        return encoded + struct.pack('>B', 0 if value else 1)
+    if isinstance(value, int):
+        return encoded + struct.pack('>Bq', 5, value)
+    if isinstance(value, bytes):
+        return encoded + struct.pack('>BH', 6, len(value)) + value
+    value_bytes = str(value).encode('utf-8')
+    return encoded + struct.pack('>BH', 7, len(value_bytes)) + value_bytes
+
+
+def encode_message(headers, payload):
+    """Encodes one event-stream message. Used to build recorded or synthetic streams."""
+    header_bytes = b''.join(_encode_header(name, value) for name, value in headers.items())
+    total_length = PRELUDE_LENGTH + len(header_bytes) + len(payload) + CRC_LENGTH
+    prelude = struct.pack('>II', total_length, len(header_bytes))
+    message = prelude + struct.pack('>I', zlib.crc32(prelude)) + header_bytes + payload
+    return message + struct.pack('>I', zlib.crc32(message))
+
+
+def encode_agent_event(kind, data):
+    """Encodes an agent event the way bedrock-agent-runtime frames it."""
+    headers = {':event-type': kind, ':content-type': 'application/json', ':message-type': 'event'}
+    if kind == 'chunk':
+        data = {'bytes': base64.b64encode(data).decode('ascii')}
+    return encode_message(headers, json.dumps(data).encode('utf-8'))
+
+
+def to_agent_event(message):
+    """Turns a decoded message into an AgentEvent, raising AgentStreamError for exceptions."""
+    headers = message.headers
+    message_type = headers.get(':message-type', 'event')
+    if message_type != 'event':
+        exception_type = headers.get(':exception-type') or headers.get(':error-code') or message_type
+        try:
+            detail = json.loads(message.payload).get('message', '')
+        except ValueError:
+            detail = message.payload.decode('utf-8', 'replace')
+        raise AgentStreamError(exception_type, detail)
+
+    kind = headers.get(':event-type', '')
+    data = json.loads(message.payload) if message.payload else {}
+    if kind == 'chunk':
+        return AgentEvent('chunk', base64.b64decode(data.get('bytes', '')))
+    return AgentEvent(kind, data)
+
+
+def raise_for_error_response(response):
+    """Raises AgentStreamError with the service's message when the request itself failed.
+
+    Throttling, expired credentials and validation errors are answered with an HTTP
+    error status and a JSON body rather than an event stream."""
+    status_code = getattr(response, 'status_code', 200)
+    if status_code < 300:
+        return
+    headers = getattr(response, 'headers', None) or {}
+    # e.g. "AccessDeniedException:http://internal.amazon.com/coral/..."
+    error_type = (headers.get('x-amzn-ErrorType') or '').split(':')[0]
+    body = response.content or b''
+    try:
+        error = json.loads(body)
+        detail = error.get('message') or error.get('Message') or body.decode('utf-8', 'replace')
+    except (ValueError, AttributeError):
+        detail = body.decode('utf-8', 'replace')
+    if not error_type:
+        raise AgentStreamError(f"HTTP {status_code}", detail)
+    raise AgentStreamError(error_type, f"{detail} (HTTP {status_code})")
+
+
+def iter_agent_events(response, read_size=DEFAULT_READ_SIZE):
+    """Yields AgentEvents from a streamed HTTP response as they arrive."""
+    raise_for_error_response(response)
+    decoder = EventStreamDecoder()
+    for data in response.iter_content(chunk_size=read_size):
+        for message in decoder.feed(data):
+            yield to_agent_event(message)
+    if decoder.pending():
+        raise EventStreamError(f"Stream ended with {decoder.pending()} bytes of an incomplete message")
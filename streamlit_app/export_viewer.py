@@ -0,0 +1,176 @@
+"""Lazy, paginated access to query results the Redshift Lambda exported as Parquet.
+
+A result too large for the agent is unloaded by the Lambda to EXPORT_LOCATION, and the
+agent only receives a preview and the URI of the export's manifest. The app finds that
+URI in the trace, reads the manifest, and opens the Parquet files through Arrow's
+filesystem layer: S3 (or an S3-compatible store such as MinIO, with
+EXPORT_S3_ENDPOINT_URL), or the local filesystem, memory-mapped, for file:// URIs.
+
+Only the footers of the files are read up front; a page of the table reads just the row
+groups it overlaps, so a multi-million-row export is never loaded whole.
+"""
+import json
+import os
+import re
+import threading
+from urllib.parse import urlparse
+
+EXPORT_PAGE_SIZE = int(os.environ.get("EXPORT_PAGE_SIZE", "100"))
+# Endpoint of an S3-compatible object store holding the exports, e.g. http://localhost:9000 for MinIO
+EXPORT_S3_ENDPOINT_URL = os.environ.get("EXPORT_S3_ENDPOINT_URL")
+# Lifetime of the download links of files on S3
+EXPORT_URL_EXPIRY_SECONDS = int(os.environ.get("EXPORT_URL_EXPIRY_SECONDS", "3600"))
+
+# Matches the manifest URI of an export summary, also in observation text cut by the trace collector
+_MANIFEST = re.compile(r'"manifest":\s*"([^"]+)"')
+
+
+def find_exports(texts):
+    """
+    Returns the manifest URIs of the exports reported in action group outputs, in order.
+
+    :param texts: Response bodies of action group calls
+    :return: A list of URIs, without duplicates
+    """
+    manifests = []
+    for text in texts:
+        for manifest in _MANIFEST.findall(text or ""):
+            if manifest not in manifests:
+                manifests.append(manifest)
+    return manifests
+
+
+def uri_path(uri):
+    """Returns the path of an s3:// or file:// URI on its filesystem."""
+    parsed = urlparse(uri)
+    return parsed.netloc + parsed.path if parsed.scheme == "s3" else parsed.path
+
+
+def open_filesystem(uri):
+    """
+    Returns an Arrow filesystem for a URI and the path of the URI on it.
+
+    :param uri: An s3:// or file:// URI, or a local path
+    :return: A tuple (pyarrow.fs.FileSystem, path)
+    """
+    from pyarrow import fs
+
+    parsed = urlparse(uri)
+    if parsed.scheme == "s3":
+        if EXPORT_S3_ENDPOINT_URL:
+            endpoint = urlparse(EXPORT_S3_ENDPOINT_URL)
+            filesystem = fs.S3FileSystem(endpoint_override=endpoint.netloc, scheme=endpoint.scheme or "https")
+        else:
+            filesystem = fs.S3FileSystem(region=os.environ.get("AWS_REGION"))
+        return filesystem, uri_path(uri)
+    if parsed.scheme in ("", "file"):
+        return fs.LocalFileSystem(use_mmap=True), uri_path(uri)
+    return fs.FileSystem.from_uri(uri)
+
+
+class ExportedResult:
+    """
+    An exported result: the Parquet files listed by its manifest, read lazily. Row counts
+    come from the manifest, or from the Parquet footers when the manifest has none.
+    """
+
+    def __init__(self, manifest_uri):
+        self.manifest_uri = manifest_uri
+        self.filesystem, manifest_path = open_filesystem(manifest_uri)
+        with self.filesystem.open_input_stream(manifest_path) as f:
+            manifest = json.loads(f.read())
+        self.files = []
+        for entry in manifest.get("entries", []):
+            meta = entry.get("meta", {})
+            self.files.append({"uri": entry["url"], "path": uri_path(entry["url"]), "bytes": meta.get("content_length"), "rows": meta.get("record_count")})
+        self._parquet = {}
+        self._lock = threading.Lock()
+        for index, file in enumerate(self.files):
+            if file["rows"] is None:
+                file["rows"] = self._parquet_file(index).metadata.num_rows
+        self.num_rows = sum(file["rows"] for file in self.files)
+        self.num_bytes = sum(file["bytes"] or 0 for file in self.files)
+
+    def _parquet_file(self, index):
+        # Opening a file reads only its footer; open files are kept for the next pages
+        import pyarrow.parquet as pq
+
+        with self._lock:
+            if index not in self._parquet:
+                self._parquet[index] = pq.ParquetFile(self.filesystem.open_input_file(self.files[index]["path"]))
+            return self._parquet[index]
+
+    def page(self, number, size=EXPORT_PAGE_SIZE):
+        """
+        Reads one page of rows, decoding only the row groups it overlaps.
+
+        :param number: The page number, from 0
+        :param size: Rows per page
+        :return: A pandas DataFrame
+        """
+        import pyarrow as pa
+
+        start, stop = number * size, (number + 1) * size
+        tables = []
+        file_start = 0
+        for index, file in enumerate(self.files):
+            file_stop = file_start + file["rows"]
+            if file_stop > max(start, file_start) and file_start < stop:
+                parquet = self._parquet_file(index)
+                group_start = file_start
+                for group in range(parquet.num_row_groups):
+                    group_stop = group_start + parquet.metadata.row_group(group).num_rows
+                    if group_stop > max(start, group_start) and group_start < stop:
+                        table = parquet.read_row_group(group)
+                        tables.append(table.slice(max(0, start - group_start), min(group_stop, stop) - max(start, group_start)))
+                    group_start = group_stop
+            file_start = file_stop
+            if file_start >= stop:
+                break
+        if not tables:
+            return self._empty_page()
+        return pa.concat_tables(tables).to_pandas()
+
+    def _empty_page(self):
+        if not self.files:
+            import pandas as pd
+            return pd.DataFrame()
+        return self._parquet_file(0).schema_arrow.empty_table().to_pandas()
+
+    def download_url(self, file):
+        """
+        Returns a time-limited link to download one of the files, or None for local files.
+
+        :param file: An entry of self.files
+        :return: A URL or None
+        """
+        parsed = urlparse(file["uri"])
+        if parsed.scheme != "s3":
+            return None
+        import boto3
+
+        client = boto3.client("s3", endpoint_url=EXPORT_S3_ENDPOINT_URL, region_name=os.environ.get("AWS_REGION"))
+        return client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": parsed.netloc, "Key": parsed.path.lstrip("/")},
+            ExpiresIn=EXPORT_URL_EXPIRY_SECONDS
+        )
+
+    def read_file(self, file):
+        """Returns the content of one of the files, to download a local export."""
+        with self.filesystem.open_input_stream(file["path"]) as f:
+            return f.read()
+
+
+def export_ready(manifest_uri):
+    """
+    Returns whether an export can be opened: its manifest is written last, once the UNLOAD
+    has written every file.
+
+    :param manifest_uri: The URI of the export's manifest
+    :return: True or False
+    """
+    from pyarrow import fs
+
+    filesystem, path = open_filesystem(manifest_uri)
+    return filesystem.get_file_info(path).type != fs.FileType.NotFound
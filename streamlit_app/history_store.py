@@ -0,0 +1,85 @@
+"""Bounded conversation history for one chat session.
+
+The most recent HISTORY_WINDOW messages are kept in memory and rendered on every
+rerun. Older messages are appended to a per-session JSON Lines file and read back
+a page at a time only when the user asks for earlier messages, so memory and render
+time per session stay flat however long the conversation gets.
+"""
+import json
+import os
+import tempfile
+from array import array
+from collections import deque
+
+# Messages kept in memory and rendered on each rerun
+HISTORY_WINDOW = int(os.environ.get("HISTORY_WINDOW", "20"))
+# Messages read back from disk per "load earlier messages"
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", "20"))
+HISTORY_DIR = os.environ.get("HISTORY_DIR", os.path.join(tempfile.gettempdir(), "chat_history"))
+
+
+class HistoryStore:
+    """Conversation history with an in-memory window and an on-disk log of older turns."""
+
+    def __init__(self, session_id, window=HISTORY_WINDOW, directory=HISTORY_DIR):
+        self.window = window
+        self.path = os.path.join(directory, f"{session_id}.jsonl")
+        self._recent = deque()
+        # Start offsets of the spilled messages in the log, 8 bytes each
+        self._offsets = array('q')
+        self._earlier = []
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, role, text):
+        self._recent.append({"role": role, "text": text})
+        if len(self._recent) > self.window:
+            self._spill(self._recent.popleft())
+
+    def _spill(self, message):
+        with open(self.path, 'ab') as f:
+            self._offsets.append(f.tell())
+            f.write(json.dumps(message, separators=(',', ':')).encode('utf-8') + b'\n')
+        # Keep loaded earlier messages contiguous with the window
+        if self._earlier:
+            self._earlier.append(message)
+
+    def recent(self):
+        """The messages in the in-memory window, oldest first."""
+        return list(self._recent)
+
+    def earlier(self):
+        """The spilled messages loaded so far with load_earlier, oldest first."""
+        return self._earlier
+
+    def remaining(self):
+        """The number of spilled messages not loaded yet."""
+        return len(self._offsets) - len(self._earlier)
+
+    def load_earlier(self, page_size=HISTORY_PAGE_SIZE):
+        """Reads the next page of older messages from the log and returns them."""
+        end = self.remaining()
+        start = max(0, end - page_size)
+        if start == end:
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(self._offsets[start])
+            page = [json.loads(f.readline()) for _ in range(end - start)]
+        self._earlier[:0] = page
+        return page
+
+    def collapse(self):
+        """Drops loaded earlier messages from memory; they stay in the log."""
+        self._earlier = []
+
+    def clear(self):
+        """Forgets the whole conversation, removing its log."""
+        self._recent.clear()
+        self._offsets = array('q')
+        self._earlier = []
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def __len__(self):
+        return len(self._offsets) + len(self._recent)
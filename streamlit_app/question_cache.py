@@ -0,0 +1,232 @@
+"""Suggested-question cache shared by every session and process of the app.
+
+Questions are generated once per (set of accessible db/schema pairs, schema fingerprints)
+and stored as JSON files in QUESTION_CACHE_DIR, so users with the same access share
+them and a schema change produces a new entry. When the current entry is missing, it is
+generated in a background thread while the last questions generated for the same access
+are served, so rendering never waits on the agent. Schema fingerprints, which may run the
+catalog query, are also looked up in the background. A lock file per entry keeps several
+app processes from generating the same questions at once.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get("QUESTION_CACHE_DIR", os.path.join(tempfile.gettempdir(), "schema_questions"))
+# How long an ACL or schema fingerprint lookup is reused before asking the Lambda again
+CHECK_INTERVAL_SECONDS = float(os.environ.get("QUESTION_CACHE_CHECK_SECONDS", "300"))
+# Entries keyed without fingerprints (no Lambda configured) are regenerated after this age
+MAX_AGE_SECONDS = float(os.environ.get("QUESTION_CACHE_MAX_AGE_SECONDS", "86400"))
+# A generation lock older than this is considered abandoned
+LOCK_TIMEOUT_SECONDS = 300
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+
+
+def access_key(acl):
+    """Identifies a set of accessible (db, schema) pairs, independent of order and duplicates."""
+    return _digest(sorted({(entry.get('db'), entry.get('schema')) for entry in acl}))
+
+
+def entry_key(acl, fingerprints):
+    """Identifies the questions for a set of accessible pairs and the schemas they had."""
+    return _digest([access_key(acl), sorted(fingerprints.items())])
+
+
+class QuestionCache:
+    """Stores generated questions on disk and regenerates them in the background."""
+
+    def __init__(self, directory=CACHE_DIR, check_interval=CHECK_INTERVAL_SECONDS, clock=time.time):
+        self.directory = directory
+        self.check_interval = check_interval
+        self.clock = clock
+        self._lookups = {}
+        self._lock = threading.Lock()
+        self._generating = set()
+        self._looking_up = set()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read(self, name):
+        try:
+            with open(self._path(name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, name, value):
+        # Write then rename, so readers in other processes never see a partial file
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(value, f)
+        os.replace(temp_path, self._path(name))
+
+    def _remembered(self, key, lookup):
+        # Reuse ACL lookups across reruns and sessions for check_interval, failures included
+        now = self.clock()
+        with self._lock:
+            cached = self._lookups.get(key)
+            if cached and now - cached[0] < self.check_interval:
+                if isinstance(cached[1], Exception):
+                    raise cached[1]
+                return cached[1]
+        try:
+            value = lookup()
+        except Exception as e:
+            with self._lock:
+                self._lookups[key] = (now, e)
+            raise
+        with self._lock:
+            self._lookups[key] = (now, value)
+        return value
+
+    def _remembered_in_background(self, key, lookup):
+        # Like _remembered, but the lookup runs in a background thread and a failure is
+        # remembered as None. Returns (known, value), serving the previous value while a
+        # stale one is looked up again.
+        now = self.clock()
+        with self._lock:
+            cached = self._lookups.get(key)
+            if cached and now - cached[0] < self.check_interval:
+                return True, cached[1]
+            if key in self._looking_up:
+                return cached is not None, cached[1] if cached else None
+            self._looking_up.add(key)
+
+        def run():
+            try:
+                value = lookup()
+            except Exception as e:
+                logger.warning("Lookup %s failed: %s", key, e)
+                value = None
+            with self._lock:
+                self._lookups[key] = (self.clock(), value)
+                self._looking_up.discard(key)
+
+        threading.Thread(target=run, name=f"lookup-{key[0]}", daemon=True).start()
+        return cached is not None, cached[1] if cached else None
+
+    def get(self, key):
+        """Returns the stored entry for a key, or None."""
+        return self._read(f"{key}.json")
+
+    def latest(self, access):
+        """Returns the most recently generated entry for a set of accessible pairs, or None."""
+        pointer = self._read(f"latest-{access}.json")
+        return self.get(pointer['key']) if pointer else None
+
+    def store(self, key, access, questions):
+        entry = {"key": key, "questions": questions, "generated_at": self.clock()}
+        self._write(f"{key}.json", entry)
+        self._write(f"latest-{access}.json", {"key": key})
+        return entry
+
+    def _acquire(self, key):
+        # An exclusive lock file is visible to every process sharing the directory
+        lock_path = self._path(f"{key}.lock")
+        try:
+            if self.clock() - os.path.getmtime(lock_path) > LOCK_TIMEOUT_SECONDS:
+                os.remove(lock_path)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            return False
+
+    def _release(self, key):
+        try:
+            os.remove(self._path(f"{key}.lock"))
+        except OSError:
+            pass
+
+    def refresh_in_background(self, key, access, generate):
+        """Starts generating the entry for a key unless this or another process already is."""
+        with self._lock:
+            if key in self._generating:
+                return
+            self._generating.add(key)
+        if not self._acquire(key):
+            with self._lock:
+                self._generating.discard(key)
+            return
+
+        def run():
+            try:
+                self.store(key, access, generate())
+                logger.info("Generated suggested questions %s", key)
+            except Exception as e:
+                logger.error("Generating suggested questions failed: %s", e)
+            finally:
+                self._release(key)
+                with self._lock:
+                    self._generating.discard(key)
+
+        threading.Thread(target=run, name=f"questions-{key[:8]}", daemon=True).start()
+
+    def access_scope(self, user_id, get_user_acl=None, get_fingerprint=None):
+        """
+        Returns what a user's cached answers are keyed on: the (db, schema) pairs the user may
+        query and the fingerprints of those databases' schemas. Lookups, and their failures,
+        are reused for check_interval. Fingerprints, which may run the schema catalog query,
+        are looked up in the background; a database whose lookup failed has a None
+        fingerprint. Without get_user_acl, or when the ACL lookup fails, the scope is the user.
+
+        :return: A tuple (acl, fingerprints), fingerprints being a dict of db -> fingerprint,
+                 or None while the first lookup of some fingerprint is still running
+        """
+        if get_user_acl is not None:
+            try:
+                acl = self._remembered(('acl', user_id), lambda: get_user_acl(user_id))
+            except Exception as e:
+                logger.warning("Keying cached answers on the user: %s", e)
+            else:
+                fingerprints = {}
+                pending = False
+                if get_fingerprint is not None:
+                    for db in sorted({entry['db'] for entry in acl}):
+                        known, fingerprints[db] = self._remembered_in_background(
+                            ('fingerprint', db), lambda db=db: get_fingerprint(db)
+                        )
+                        pending = pending or not known
+                return acl, None if pending else fingerprints
+        return [{"db": None, "schema": f"user:{user_id}"}], {}
+
+    def get_questions(self, user_id, generate, get_user_acl=None, get_fingerprint=None):
+        """
+        Returns the suggested questions for a user without waiting on the agent.
+
+        :param user_id: The logged in user
+        :param generate: Callable returning freshly generated questions, run in the background
+        :param get_user_acl: Callable user_id -> [{"db", "schema"}], or None to key on the user
+        :param get_fingerprint: Callable db -> schema fingerprint, or None to expire by age
+        :return: The questions, the last ones generated for the same access while they are
+                 regenerated, or None when there are none yet
+        """
+        acl, fingerprints = self.access_scope(user_id, get_user_acl, get_fingerprint)
+        access = access_key(acl)
+        if fingerprints is None:
+            # The entry's key is not known until the fingerprints are
+            latest = self.latest(access)
+            return latest['questions'] if latest else None
+        key = entry_key(acl, fingerprints)
+        entry = self.get(key)
+        # Without every fingerprint a schema change can go unnoticed, so entries expire by age
+        complete = fingerprints and None not in fingerprints.values()
+        if entry and (complete or self.clock() - entry['generated_at'] < MAX_AGE_SECONDS):
+            return entry['questions']
+
+        self.refresh_in_background(key, access, generate)
+        stale = entry or self.latest(access)
+        return stale['questions'] if stale else None
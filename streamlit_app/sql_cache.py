@@ -0,0 +1,146 @@
+"""Question-to-SQL cache that answers repeat questions without the agent.
+
+When the agent answers the first question of a session with a /querydatabase call whose
+result came back without an error, the parameters of that call are stored under the normalized question,
+the user's accessible db/schema pairs and their schema fingerprints. The same question
+asked again in the same scope replays the stored call against the action group Lambda,
+which still checks the user's access, and skips the agent and its model invocations.
+Follow-up questions are neither cached nor answered from the cache, since their SQL
+depends on the earlier turns of their conversation.
+
+Entries expire after SQL_CACHE_TTL_SECONDS, the least recently used are evicted beyond
+SQL_CACHE_MAX_ENTRIES, and the cache is persisted to SQL_CACHE_PATH so it survives
+restarts. A schema change gives the same question a new key.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from question_cache import entry_key
+
+logger = logging.getLogger(__name__)
+
+SQL_CACHE_ENABLED = os.environ.get("SQL_CACHE_ENABLED", "true").lower() == "true"
+SQL_CACHE_PATH = os.environ.get("SQL_CACHE_PATH", os.path.join(tempfile.gettempdir(), "sql_cache.json"))
+SQL_CACHE_TTL_SECONDS = float(os.environ.get("SQL_CACHE_TTL_SECONDS", "86400"))
+SQL_CACHE_MAX_ENTRIES = int(os.environ.get("SQL_CACHE_MAX_ENTRIES", "1000"))
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_SPACE = re.compile(r"\s+")
+# Suffix trace_collector.truncate adds to a cut text field; a cut query cannot be replayed
+_TRUNCATED = re.compile(r"\.\.\. \[\d+ more characters\]$")
+
+
+def normalize_question(question):
+    """Lower-cases a question and drops punctuation and repeated whitespace."""
+    return _SPACE.sub(" ", _PUNCTUATION.sub(" ", question.lower())).strip()
+
+
+def cache_key(question, acl, fingerprints):
+    """Identifies a question asked by any user with the same access to the same schemas."""
+    material = json.dumps([normalize_question(question), entry_key(acl, fingerprints)])
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()[:32]
+
+
+def validated_query(trace):
+    """
+    Returns the parameters of the last /querydatabase call of a turn whose result came
+    back without an error, or None.
+
+    :param trace: A TraceCollector.to_dict() of the turn
+    :return: A dict of the call's parameters (database, schema, query or queries)
+    """
+    if not trace:
+        return None
+    # Action group calls and their outputs are recorded in the same order
+    calls = [invocation for invocation in trace.get('invocation_inputs', []) if invocation.get('api_path')]
+    outputs = [observation for observation in trace.get('observations', []) if observation.get('text') is not None]
+    validated = None
+    for call, output in zip(calls, outputs):
+        if call['api_path'] != '/querydatabase':
+            continue
+        parameters = call.get('parameters', {})
+        if not output.get('succeeded') or any(isinstance(value, str) and _TRUNCATED.search(value) for value in parameters.values()):
+            continue
+        validated = {name: parameters[name] for name in ('database', 'schema', 'table', 'query', 'queries') if parameters.get(name)}
+    return validated if validated and (validated.get('query') or validated.get('queries')) else None
+
+
+class SqlCache:
+    """LRU map of question keys to validated /querydatabase calls, persisted as one JSON file."""
+
+    def __init__(self, path=SQL_CACHE_PATH, ttl=SQL_CACHE_TTL_SECONDS, max_entries=SQL_CACHE_MAX_ENTRIES, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = self.clock()
+        for key, entry in entries:
+            if now - entry['stored_at'] < self.ttl:
+                self._entries[key] = entry
+
+    def _save(self):
+        # Write then rename, so other app processes never read a partial file
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(list(self._entries.items()), f)
+        os.replace(temp_path, self.path)
+
+    def get(self, key):
+        """Returns the stored call for a key, or None when it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() - entry['stored_at'] >= self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry
+
+    def store(self, key, question, parameters):
+        """Stores the validated call answering a question, evicting the least recently used entries."""
+        with self._lock:
+            self._entries[key] = {"question": question, "parameters": parameters, "stored_at": self.clock()}
+            self._entries.move_to_end(key)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+            self._save()
+
+    def invalidate(self, key):
+        """Forgets an entry whose replay failed, so the question goes to the agent again."""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._stats["invalidations"] += 1
+                self._save()
+
+    def stats(self):
+        """Returns hit and miss counters of this process, the hit rate and the number of entries."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,96 @@
+"""Per-turn latency breakdown of an agent call, as seen from the app.
+
+A TurnTiming is started when a question is sent. It records the time to the first
+response byte and the arrival of every agent event, and splits the turn into phases:
+agent reasoning, each action group call (from the invocation input to its observation,
+covering the Lambda and Redshift) and the streaming of the answer. The phases form the
+per-turn waterfall in the sidebar, and are also printed as a CloudWatch EMF record.
+"""
+import json
+import os
+import time
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "Text2SQL/App")
+
+
+class TurnTiming:
+    """Spans of one question, as offsets in milliseconds from when it was sent."""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        self.spans = []
+        self.events = 0
+        self._phase = None
+        self._phase_started = None
+
+    def _now_ms(self):
+        return (self.clock() - self.started) * 1000
+
+    def add_span(self, name, start_ms, end_ms):
+        self.spans.append({"name": name, "start_ms": round(start_ms, 1), "duration_ms": round(end_ms - start_ms, 1)})
+
+    def _enter_phase(self, name):
+        now = self._now_ms()
+        if self._phase is not None:
+            self.add_span(self._phase, self._phase_started, now)
+        self._phase = name
+        self._phase_started = now
+
+    def first_byte(self):
+        """Marks the arrival of the response headers."""
+        now = self._now_ms()
+        self.add_span("Time to first byte", 0, now)
+        self._phase = "Agent reasoning"
+        self._phase_started = now
+
+    def on_event(self, kind, data=None):
+        """Marks the arrival of an agent event, starting a new phase when it begins one."""
+        self.events += 1
+        if kind == 'chunk':
+            if self._phase != "Answer streaming":
+                self._enter_phase("Answer streaming")
+            return
+        if kind != 'trace':
+            return
+        orchestration = data.get('trace', {}).get('orchestrationTrace', {})
+        action = orchestration.get('invocationInput', {}).get('actionGroupInvocationInput')
+        if action is not None:
+            self._enter_phase(f"Action group {action.get('apiPath', '')}")
+        elif 'actionGroupInvocationOutput' in orchestration.get('observation', {}):
+            self._enter_phase("Agent reasoning")
+
+    def finish(self):
+        """Closes the open phase and adds the whole turn as the first span."""
+        now = self._now_ms()
+        if self._phase is not None:
+            self.add_span(self._phase, self._phase_started, now)
+            self._phase = None
+        self.spans.insert(0, {"name": "Agent call", "start_ms": 0, "duration_ms": round(now, 1)})
+        return self.spans
+
+    def emf(self, namespace=METRICS_NAMESPACE):
+        """A CloudWatch Embedded Metric Format record of the turn, summing phases of the same name."""
+        totals = {}
+        for span in self.spans:
+            totals[span["name"]] = totals.get(span["name"], 0.0) + span["duration_ms"]
+        record = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": namespace,
+                    "Dimensions": [[]],
+                    "Metrics": [{"Name": name, "Unit": "Milliseconds"} for name in totals]
+                }]
+            },
+            "events": self.events,
+            "spans": self.spans
+        }
+        record.update(totals)
+        return record
+
+    def emit(self):
+        # Printed as one line, so a CloudWatch agent shipping the app log extracts the metrics
+        if METRICS_ENABLED:
+            print(json.dumps(self.emf()))
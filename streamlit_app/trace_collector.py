@@ -0,0 +1,155 @@
+"""Per-request collection of agent trace events.
+
+A TraceCollector is created for each question and keeps the parsed steps of the
+agent's orchestration: rationales, action group invocation inputs (and the SQL they
+carry), observations, whether each action group output was a usable result, and the
+final response. Memory is bounded: at most MAX_STEPS
+steps are kept per kind and long text fields are truncated. Model invocation prompts,
+which repeat the whole schema on every step, are only counted.
+"""
+import json
+import os
+from collections import deque
+
+# Steps of each kind kept per request
+MAX_STEPS = int(os.environ.get("TRACE_MAX_STEPS", "50"))
+# Characters kept of any single text field
+MAX_TEXT_CHARS = int(os.environ.get("TRACE_MAX_TEXT_CHARS", "4000"))
+
+
+def truncate(text, max_chars=MAX_TEXT_CHARS):
+    if text is None or len(text) <= max_chars:
+        return text
+    return text[:max_chars] + f"... [{len(text) - max_chars} more characters]"
+
+
+def sql_from_properties(properties):
+    # Queries sent to /querydatabase, either as a single "query" or a JSON "queries" batch
+    queries = []
+    for prop in properties:
+        if prop.get('name') == 'query' and prop.get('value'):
+            queries.append(prop['value'].strip())
+        elif prop.get('name') == 'queries' and prop.get('value'):
+            try:
+                batch = json.loads(prop['value'])
+            except ValueError:
+                continue
+            for item in batch if isinstance(batch, list) else []:
+                query = item.get('query') if isinstance(item, dict) else item
+                if isinstance(query, str) and query.strip():
+                    queries.append(query.strip())
+    return queries
+
+
+def result_succeeded(output_text):
+    """Whether an action group output is a result the agent can rely on: rows, or a truncated envelope of rows, with no error."""
+    try:
+        body = json.loads(output_text)
+    except (TypeError, ValueError):
+        return False
+    if isinstance(body, dict):
+        return 'rows' in body and 'error' not in body
+    if isinstance(body, list):
+        return not any(isinstance(item, dict) and ('error' in item or 'pending' in item) for item in body)
+    return False
+
+
+class TraceCollector:
+    """Collects the trace events of one agent invocation."""
+
+    def __init__(self, max_steps=MAX_STEPS, max_text_chars=MAX_TEXT_CHARS):
+        self.max_text_chars = max_text_chars
+        self._rationales = deque(maxlen=max_steps)
+        self._invocation_inputs = deque(maxlen=max_steps)
+        self._observations = deque(maxlen=max_steps)
+        self._sql = deque(maxlen=max_steps)
+        self._final_response = None
+        self.model_invocations = 0
+        self.trace_count = 0
+        self.other_events = 0
+
+    def _text(self, text):
+        return truncate(text, self.max_text_chars)
+
+    def add_trace(self, trace):
+        """Records one trace event payload, as decoded from the response stream."""
+        self.trace_count += 1
+        orchestration = trace.get('trace', {}).get('orchestrationTrace', {})
+        if 'rationale' in orchestration:
+            self._rationales.append(self._text(orchestration['rationale'].get('text', '')))
+        if 'modelInvocationInput' in orchestration:
+            self.model_invocations += 1
+        if 'invocationInput' in orchestration:
+            self._add_invocation_input(orchestration['invocationInput'])
+        if 'observation' in orchestration:
+            self._add_observation(orchestration['observation'])
+
+    def _add_invocation_input(self, invocation_input):
+        action = invocation_input.get('actionGroupInvocationInput')
+        if action is None:
+            self._invocation_inputs.append({"type": invocation_input.get('invocationType')})
+            return
+        properties = action.get('requestBody', {}).get('content', {}).get('application/json', [])
+        self._invocation_inputs.append({
+            "type": invocation_input.get('invocationType', 'ACTION_GROUP'),
+            "action_group": action.get('actionGroupName'),
+            "api_path": action.get('apiPath'),
+            "parameters": {prop.get('name'): self._text(prop.get('value')) for prop in properties}
+        })
+        if action.get('apiPath') == '/querydatabase':
+            self._sql.extend(sql_from_properties(properties))
+
+    def _add_observation(self, observation):
+        if 'finalResponse' in observation:
+            self._final_response = observation['finalResponse'].get('text')
+        output = observation.get('actionGroupInvocationOutput')
+        # Judged on the full output, as the kept text may be cut short of valid JSON
+        self._observations.append({
+            "type": observation.get('type'),
+            "text": self._text(output.get('text')) if output else None,
+            "succeeded": result_succeeded(output.get('text')) if output else False
+        })
+
+    def add_event(self, event):
+        """Records an AgentEvent other than an answer chunk."""
+        if event.kind == 'trace':
+            self.add_trace(event.data)
+        elif event.kind != 'chunk':
+            self.other_events += 1
+
+    def rationales(self):
+        return list(self._rationales)
+
+    def invocation_inputs(self):
+        return list(self._invocation_inputs)
+
+    def generated_sql(self):
+        """The SQL statements the agent sent to Redshift, in order."""
+        return list(self._sql)
+
+    def observations(self):
+        return list(self._observations)
+
+    def final_response(self):
+        """The final answer as reported in the trace, or None."""
+        return self._final_response
+
+    def to_dict(self):
+        return {
+            "rationales": self.rationales(),
+            "invocation_inputs": self.invocation_inputs(),
+            "sql": self.generated_sql(),
+            "observations": self.observations(),
+            "final_response": self._final_response,
+            "trace_count": self.trace_count,
+            "model_invocations": self.model_invocations
+        }
+
+    def render(self):
+        """A readable, bounded summary of the steps, for display."""
+        lines = [f"Traces: {self.trace_count}, model invocations: {self.model_invocations}"]
+        lines += [f"Rationale: {text}" for text in self._rationales]
+        for invocation in self._invocation_inputs:
+            lines.append(f"Invocation: {invocation.get('api_path') or invocation.get('type')} {json.dumps(invocation.get('parameters', {}))}")
+        lines += [f"Observation: {observation['text']}" for observation in self._observations if observation['text']]
+        return "\n".join(lines)